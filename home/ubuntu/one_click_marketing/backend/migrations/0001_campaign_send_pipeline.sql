@@ -0,0 +1,114 @@
+-- Migration number: 0001 	 Campaign send pipeline (MySQL 8)
+--
+-- Brings a database created from the original models up to date with the columns and tables added for
+-- chunked campaign sends, retries, billing holds, idempotency keys, opt-outs and the webhook queue.
+-- A new database gets all of this from db.create_all(); run this script once on an existing one, before
+-- starting the new version of the backend:
+--
+--     mysql -h "$DB_HOST" -P "$DB_PORT" -u "$DB_USERNAME" -p "$DB_NAME" < migrations/0001_campaign_send_pipeline.sql
+--
+-- MySQL commits each ALTER TABLE on its own. If a statement fails part way, fix the cause and re-run only
+-- the statements after the last one that succeeded.
+
+-- client_profiles: sender throughput tier, fair-share weight and the part of the wallet held by campaigns
+ALTER TABLE client_profiles
+  ADD COLUMN meta_messages_per_second INTEGER NULL,
+  ADD COLUMN send_weight FLOAT NULL,
+  ADD COLUMN wallet_reserved_balance NUMERIC(10, 2) NOT NULL DEFAULT 0.00;
+
+-- campaigns: failure reason, audience report, billing hold and send progress
+ALTER TABLE campaigns
+  ADD COLUMN failure_reason TEXT NULL,
+  ADD COLUMN audience_report_json TEXT NULL,
+  ADD COLUMN billing_price_per_message NUMERIC(10, 4) NULL,
+  ADD COLUMN billing_reserved_amount NUMERIC(10, 2) NOT NULL DEFAULT 0,
+  ADD COLUMN billing_settled_count INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN send_cursor INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN send_heartbeat_at DATETIME NULL,
+  ADD COLUMN chunked_at DATETIME NULL,
+  ADD INDEX ix_campaigns_status_scheduled_at (status, scheduled_at);
+
+-- message_logs: retry bookkeeping (including the retry worker's claim token) and the per-recipient idempotency key of campaign sends
+ALTER TABLE message_logs
+  ADD COLUMN attempt_count INTEGER NOT NULL DEFAULT 1,
+  ADD COLUMN next_retry_at DATETIME NULL,
+  ADD COLUMN retry_claimed_by VARCHAR(120) NULL,
+  ADD COLUMN idempotency_key VARCHAR(120) NULL,
+  ADD UNIQUE INDEX idempotency_key (idempotency_key),
+  ADD INDEX ix_message_logs_status_next_retry_at (status, next_retry_at);
+
+CREATE TABLE IF NOT EXISTS campaign_recipients (
+  id INTEGER NOT NULL AUTO_INCREMENT,
+  campaign_id INTEGER NOT NULL,
+  phone_number VARCHAR(30) NOT NULL,
+  variables_json TEXT NULL,
+  state VARCHAR(20) NOT NULL DEFAULT 'pending',
+  message_log_id INTEGER NULL,
+  created_at DATETIME NULL,
+  PRIMARY KEY (id),
+  INDEX ix_campaign_recipients_campaign_id_id (campaign_id, id),
+  INDEX ix_campaign_recipients_campaign_id_state (campaign_id, state),
+  INDEX ix_campaign_recipients_campaign_id_phone_number (campaign_id, phone_number),
+  FOREIGN KEY (campaign_id) REFERENCES campaigns (id) ON DELETE CASCADE,
+  FOREIGN KEY (message_log_id) REFERENCES message_logs (id)
+);
+
+CREATE TABLE IF NOT EXISTS campaign_chunks (
+  id INTEGER NOT NULL AUTO_INCREMENT,
+  campaign_id INTEGER NOT NULL,
+  first_recipient_id INTEGER NOT NULL,
+  last_recipient_id INTEGER NOT NULL,
+  state VARCHAR(20) NOT NULL DEFAULT 'pending',
+  lease_owner VARCHAR(120) NULL,
+  lease_expires_at DATETIME NULL,
+  lease_count INTEGER NOT NULL DEFAULT 0,
+  created_at DATETIME NULL,
+  completed_at DATETIME NULL,
+  PRIMARY KEY (id),
+  INDEX ix_campaign_chunks_campaign_id_state_id (campaign_id, state, id),
+  INDEX ix_campaign_chunks_state_lease_expires_at (state, lease_expires_at),
+  FOREIGN KEY (campaign_id) REFERENCES campaigns (id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  id INTEGER NOT NULL AUTO_INCREMENT,
+  client_id INTEGER NOT NULL,
+  idempotency_key VARCHAR(255) NOT NULL,
+  request_fingerprint VARCHAR(64) NOT NULL,
+  state VARCHAR(20) NOT NULL DEFAULT 'in_progress',
+  response_status INTEGER NULL,
+  response_body TEXT NULL,
+  created_at DATETIME NULL,
+  completed_at DATETIME NULL,
+  PRIMARY KEY (id),
+  CONSTRAINT uq_idempotency_keys_client_id_key UNIQUE (client_id, idempotency_key),
+  INDEX ix_idempotency_keys_created_at (created_at),
+  FOREIGN KEY (client_id) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS suppressed_numbers (
+  id INTEGER NOT NULL AUTO_INCREMENT,
+  client_id INTEGER NOT NULL,
+  phone_number VARCHAR(30) NOT NULL,
+  reason VARCHAR(50) NOT NULL DEFAULT 'manual',
+  notes TEXT NULL,
+  created_at DATETIME NULL,
+  PRIMARY KEY (id),
+  CONSTRAINT uq_suppressed_numbers_client_id_phone_number UNIQUE (client_id, phone_number),
+  FOREIGN KEY (client_id) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS webhook_events (
+  id INTEGER NOT NULL AUTO_INCREMENT,
+  payload MEDIUMTEXT NOT NULL,
+  received_at DATETIME NOT NULL,
+  state VARCHAR(20) NOT NULL DEFAULT 'pending',
+  claimed_by VARCHAR(120) NULL,
+  claimed_at DATETIME NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  processed_at DATETIME NULL,
+  error TEXT NULL,
+  PRIMARY KEY (id),
+  INDEX ix_webhook_events_state_id (state, id),
+  INDEX ix_webhook_events_state_processed_at (state, processed_at)
+);
@@ -0,0 +1,280 @@
+# backend/scripts/mock_graph_server.py
+"""
+Local stand-in for the WhatsApp Cloud API (Meta Graph API) for load-testing campaigns without
+messaging real phones. Standard library only (asyncio).
+
+It accepts POST /<version>/<phone_number_id>/messages (and Graph batch requests of such sends,
+POST /<version> with a "batch" array) and media uploads to /<version>/<phone_number_id>/media,
+answers like Graph does (message ids, OAuthException-style errors) after a configurable latency,
+injects 429s and 5xx failures, and posts the matching "sent" / "delivered" / "read" (or "failed")
+status webhooks back to the app.
+
+Usage:
+    python scripts/mock_graph_server.py --port 8081 --latency-ms 80 --rate-limit-ratio 0.01 \\
+        --error-ratio 0.005 --webhook-url http://127.0.0.1:5000/api/v1/meta/webhook --waba-id <WABA ID>
+
+Then start the backend with WHATSAPP_API_BASE_URL=http://127.0.0.1:8081. Throughput is printed
+every --stats-interval seconds and is also available from GET /stats.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger("mock_graph_server")
+
+STATUS_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+def graph_error(code, message, error_type="OAuthException", subcode=None):
+    error = {"message": message, "type": error_type, "code": code, "fbtrace_id": base64.b64encode(os.urandom(9)).decode()}
+    if subcode:
+        error["error_subcode"] = subcode
+    return {"error": error}
+
+
+def new_message_id():
+    # Real ids look like "wamid.HBgLMTU1NTAwMDAwMDEVAgARGBI..." (base64 of the recipient and a random key)
+    return "wamid." + base64.b64encode(os.urandom(30)).decode().rstrip("=")
+
+
+class MockGraphServer:
+
+    def __init__(self, args):
+        self.args = args
+        self.stats = Counter()
+        self.webhook_queue = asyncio.Queue(maxsize=args.webhook_queue_size)
+        self.started_at = time.monotonic()
+
+    # --- HTTP server -------------------------------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True: # HTTP/1.1 keep-alive: the backend's pooled session reuses connections
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0") or 0))
+                status, response = await self.route(method, path, headers, body)
+                payload = json.dumps(response).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_REASONS.get(status, 'OK')}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, headers, body):
+        parts = urlsplit(path).path.strip("/").split("/")
+        if method == "GET" and parts == ["stats"]:
+            return 200, self.snapshot()
+        if len(parts) == 1 and method == "POST": # Graph batch request: POST /<version> with a "batch" array
+            if not headers.get("authorization", "").startswith("Bearer "):
+                return 400, graph_error(190, "Invalid OAuth access token - Cannot parse access token")
+            return await self.route_batch(body)
+        if len(parts) == 3 and parts[2] == "media" and method == "POST": # Media upload (multipart form)
+            if not headers.get("authorization", "").startswith("Bearer "):
+                return 400, graph_error(190, "Invalid OAuth access token - Cannot parse access token")
+            if not headers.get("content-type", "").startswith("multipart/form-data") or not body:
+                return 400, graph_error(100, "(#100) The parameter file is required.")
+            self.stats["media_uploads"] += 1
+            return 200, {"id": str(random.randrange(10**15, 10**16))}
+        if len(parts) != 3 or parts[2] != "messages":
+            return 404, graph_error(100, "Unknown path components", "GraphMethodException")
+        if method != "POST":
+            return 405, graph_error(100, "Unsupported method", "GraphMethodException")
+        if not headers.get("authorization", "").startswith("Bearer "):
+            return 400, graph_error(190, "Invalid OAuth access token - Cannot parse access token")
+        try:
+            message = json.loads(body or b"{}")
+        except ValueError:
+            return 400, graph_error(100, "Invalid parameter", subcode=2494010)
+        return await self.send_message(parts[1], message)
+
+    async def route_batch(self, body):
+        try:
+            batch = json.loads(body or b"{}").get("batch")
+            if isinstance(batch, str):
+                batch = json.loads(batch)
+        except (ValueError, AttributeError):
+            return 400, graph_error(100, "Invalid parameter", subcode=2494010)
+        if not isinstance(batch, list) or not batch or len(batch) > 50:
+            return 400, graph_error(100, "(#100) The batch parameter must be a JSON array of 1 to 50 requests")
+        self.stats["batch_requests"] += 1
+
+        async def run_item(item):
+            parts = str(item.get("relative_url", "")).strip("/").split("/")
+            if str(item.get("method", "")).upper() != "POST" or len(parts) != 2 or parts[1] != "messages":
+                status, response = 404, graph_error(100, "Unknown path components", "GraphMethodException")
+            else:
+                # Sub-request bodies are form-encoded; object-valued fields are JSON strings
+                message = {name: values[0] for name, values in parse_qs(item.get("body", "")).items()}
+                status, response = await self.send_message(parts[0], message)
+            return {"code": status, "headers": [{"name": "Content-Type", "value": "application/json"}], "body": json.dumps(response)}
+
+        return 200, list(await asyncio.gather(*(run_item(item) for item in batch)))
+
+    async def send_message(self, phone_number_id, message):
+        recipient = str(message.get("to", ""))
+        if not recipient:
+            return 400, graph_error(100, "(#100) The parameter to is required.")
+
+        self.stats["requests"] += 1
+        latency = max(0.0, random.gauss(self.args.latency_ms, self.args.latency_jitter_ms)) / 1000
+        if latency:
+            await asyncio.sleep(latency)
+
+        roll = random.random()
+        if roll < self.args.rate_limit_ratio:
+            self.stats["rate_limited"] += 1
+            return 429, graph_error(130429, "(#130429) Rate limit hit", subcode=2494055)
+        if roll < self.args.rate_limit_ratio + self.args.error_ratio:
+            self.stats["errors"] += 1
+            return 500, graph_error(131000, "(#131000) Something went wrong", "OAuthException")
+
+        message_id = new_message_id()
+        self.stats["accepted"] += 1
+        if self.args.webhook_url:
+            try:
+                self.webhook_queue.put_nowait((phone_number_id, recipient, message_id))
+            except asyncio.QueueFull:
+                self.stats["webhooks_dropped"] += 1
+        return 200, {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": recipient, "wa_id": recipient.lstrip("+")}],
+            "messages": [{"id": message_id}]
+        }
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {**self.stats, "elapsed_seconds": round(elapsed, 1), "accepted_per_second": round(self.stats["accepted"] / elapsed, 1)}
+
+    # --- Status webhooks -----------------------------------------------------------------------
+
+    def status_sequence(self):
+        """Statuses Meta would report for one accepted message, with the delay before each."""
+        if random.random() < self.args.undeliverable_ratio:
+            return [("failed", self.args.delivery_delay_ms)]
+        sequence = [("sent", self.args.sent_delay_ms), ("delivered", self.args.delivery_delay_ms)]
+        if random.random() < self.args.read_ratio:
+            sequence.append(("read", self.args.read_delay_ms))
+        return sequence
+
+    def webhook_body(self, phone_number_id, recipient, message_id, status):
+        status_update = {
+            "id": message_id,
+            "status": status,
+            "timestamp": str(int(time.time())),
+            "recipient_id": recipient.lstrip("+")
+        }
+        if status == "failed":
+            status_update["errors"] = [{"code": 131026, "title": "Message undeliverable"}]
+        return {
+            "object": "whatsapp_business_account",
+            "entry": [{
+                "id": self.args.waba_id,
+                "changes": [{
+                    "field": "messages",
+                    "value": {
+                        "messaging_product": "whatsapp",
+                        "metadata": {"display_phone_number": "15550000000", "phone_number_id": phone_number_id},
+                        "statuses": [status_update]
+                    }
+                }]
+            }]
+        }
+
+    async def post_webhook(self, body):
+        target = urlsplit(self.args.webhook_url)
+        payload = json.dumps(body).encode()
+        reader, writer = await asyncio.open_connection(target.hostname, target.port or 80)
+        try:
+            writer.write(
+                f"POST {target.path or '/'} HTTP/1.1\r\nHost: {target.netloc}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            return int(status_line.split()[1]) if status_line else 0
+        finally:
+            writer.close()
+
+    async def webhook_worker(self):
+        while True:
+            phone_number_id, recipient, message_id = await self.webhook_queue.get()
+            try:
+                for status, delay_ms in self.status_sequence():
+                    await asyncio.sleep(delay_ms / 1000)
+                    code = await self.post_webhook(self.webhook_body(phone_number_id, recipient, message_id, status))
+                    self.stats["webhooks_sent" if code == 200 else "webhooks_failed"] += 1
+            except (OSError, ValueError, IndexError) as e:
+                self.stats["webhooks_failed"] += 1
+                logger.debug(f"Webhook delivery failed: {e}")
+            finally:
+                self.webhook_queue.task_done()
+
+    async def report_stats(self):
+        previous = 0
+        while True:
+            await asyncio.sleep(self.args.stats_interval)
+            accepted = self.stats["accepted"]
+            logger.info(f"{(accepted - previous) / self.args.stats_interval:.0f} msg/s | {dict(self.stats)}")
+            previous = accepted
+
+    async def run(self):
+        server = await asyncio.start_server(self.handle_connection, self.args.host, self.args.port, backlog=1024)
+        logger.info(f"Mock Graph API listening on http://{self.args.host}:{self.args.port}")
+        for _ in range(self.args.webhook_workers if self.args.webhook_url else 0):
+            asyncio.create_task(self.webhook_worker())
+        asyncio.create_task(self.report_stats())
+        async with server:
+            await server.serve_forever()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mock WhatsApp Cloud API for local load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="Mean response latency")
+    parser.add_argument("--latency-jitter-ms", type=float, default=20.0, help="Standard deviation of the latency")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Share of requests answered with 429 / code 130429")
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="Share of requests answered with 500 / code 131000")
+    parser.add_argument("--webhook-url", default=None, help="The app's /api/v1/meta/webhook URL; omit to send no status webhooks")
+    parser.add_argument("--waba-id", default="MOCK_WABA_ID", help="entry.id of the webhooks; must match the client's meta_waba_id")
+    parser.add_argument("--webhook-workers", type=int, default=32)
+    parser.add_argument("--webhook-queue-size", type=int, default=1_000_000)
+    parser.add_argument("--undeliverable-ratio", type=float, default=0.0, help="Share of accepted messages later reported as failed")
+    parser.add_argument("--read-ratio", type=float, default=0.5, help="Share of delivered messages later reported as read")
+    parser.add_argument("--sent-delay-ms", type=float, default=200.0)
+    parser.add_argument("--delivery-delay-ms", type=float, default=1000.0)
+    parser.add_argument("--read-delay-ms", type=float, default=5000.0)
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(MockGraphServer(parse_args()).run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,142 @@
+# backend/src/logging_config.py
+
+import collections
+import threading
+import logging
+import json
+import time
+import sys
+import os
+
+# Logging is configured here once, by main.py; modules only create their logger with logging.getLogger(__name__).
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower() # "json": one JSON object per line, for log ingestion
+
+# Hot paths (per message, per webhook event) don't log every event: they feed a SummaryLog, which writes one
+# line per LOG_SUMMARY_EVERY events (or at least once per LOG_SUMMARY_MAX_SECONDS while events keep coming),
+# and repeated warnings go through a RateLimitedLog allowing LOG_RATE_LIMIT_PER_MINUTE lines per category.
+LOG_SUMMARY_EVERY = int(os.getenv("LOG_SUMMARY_EVERY", "1000"))
+LOG_SUMMARY_MAX_SECONDS = float(os.getenv("LOG_SUMMARY_MAX_SECONDS", "60"))
+LOG_RATE_LIMIT_PER_MINUTE = int(os.getenv("LOG_RATE_LIMIT_PER_MINUTE", "20"))
+
+# Attributes every LogRecord has; anything else was passed through `extra` and becomes a JSON field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON with the fields passed through `extra` (e.g. extra={"event": ...})."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT):
+    """Sets up the root logger for the application. Safe to call more than once."""
+    root = logging.getLogger()
+    root.setLevel(level)
+    handler = next((h for h in root.handlers if getattr(h, "_app_handler", False)), None)
+    if handler is None:
+        handler = logging.StreamHandler(sys.stdout)
+        handler._app_handler = True
+        root.addHandler(handler)
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    # Per-connection chatter from the HTTP client would cost more than the sends it describes
+    logging.getLogger("urllib3").setLevel(max(logging.WARNING, root.level))
+
+
+class RateLimitedLog:
+    """
+    Logs at most `per_minute` lines per category; the rest are counted and the count is appended to the next
+    line that gets through ("... [37 similar suppressed]"). For warnings that can repeat for every message.
+    """
+
+    def __init__(self, logger, per_minute=LOG_RATE_LIMIT_PER_MINUTE):
+        self.logger = logger
+        self.per_minute = per_minute
+        self._windows = {} # category -> [window start, lines logged, lines suppressed]
+        self._lock = threading.Lock()
+
+    def log(self, category, level, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(category)
+            if window is None or now - window[0] >= 60:
+                suppressed = window[2] if window else 0
+                window = self._windows[category] = [now, 0, 0]
+            else:
+                suppressed = 0
+            if window[1] >= self.per_minute:
+                window[2] += 1
+                return
+            window[1] += 1
+            suppressed, window[2] = suppressed + window[2], 0
+        if suppressed:
+            msg = f"{msg} [%d similar suppressed]"
+            args = args + (suppressed,)
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def warning(self, category, msg, *args, **kwargs):
+        self.log(category, logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, category, msg, *args, **kwargs):
+        self.log(category, logging.ERROR, msg, *args, **kwargs)
+
+
+class SummaryLog:
+    """
+    Counts events by outcome (and their latency) and logs one INFO line per `every` events instead of one
+    per event, e.g. "whatsapp_send: 1000 in 12.5s (sent=991 retryable=9), latency p50 84ms p95 170ms max 410ms".
+    The counts and latencies are also passed as structured fields for JSON logs.
+    """
+
+    def __init__(self, logger, name, every=LOG_SUMMARY_EVERY, max_seconds=LOG_SUMMARY_MAX_SECONDS):
+        self.logger = logger
+        self.name = name
+        self.every = max(1, every)
+        self.max_seconds = max_seconds
+        self._counts = collections.Counter()
+        self._latencies = []
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, outcome, latency_seconds=None):
+        now = time.monotonic()
+        with self._lock:
+            self._counts[outcome] += 1
+            if latency_seconds is not None:
+                self._latencies.append(latency_seconds)
+            total = sum(self._counts.values())
+            if total < self.every and now - self._started_at < self.max_seconds:
+                return
+            counts, latencies, elapsed = dict(self._counts), sorted(self._latencies), now - self._started_at
+            self._counts.clear()
+            self._latencies = []
+            self._started_at = now
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        fields = {"event": f"{self.name}_summary", "count": total, "elapsed_seconds": round(elapsed, 2), "outcomes": counts}
+        outcome_text = " ".join(f"{key}={value}" for key, value in sorted(counts.items()))
+        if latencies:
+            percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+            fields.update(latency_p50_ms=round(percentile(0.5), 1), latency_p95_ms=round(percentile(0.95), 1),
+                          latency_max_ms=round(latencies[-1] * 1000, 1))
+            self.logger.info("%s: %d in %.1fs (%s), latency p50 %.0fms p95 %.0fms max %.0fms", self.name, total, elapsed,
+                             outcome_text, fields["latency_p50_ms"], fields["latency_p95_ms"], fields["latency_max_ms"], extra=fields)
+        else:
+            self.logger.info("%s: %d in %.1fs (%s)", self.name, total, elapsed, outcome_text, extra=fields)
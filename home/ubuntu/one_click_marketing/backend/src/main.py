@@ -4,6 +4,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask
+from src.logging_config import configure_logging
 from src.models.user import db # Assuming db is initialized elsewhere or will be initialized if DB is used
 from src.routes.auth import auth_bp
 from src.routes.admin import admin_bp
@@ -14,6 +15,13 @@ from src.routes.campaigns import campaigns_bp
 from src.routes.reports import reports_bp
 from src.routes.admin_pricing import admin_pricing_bp
 from src.routes.client_portal import client_portal_bp
+from src.routes.suppressions import suppressions_bp
+from src.services.campaign_dispatcher import campaign_dispatcher
+from src.services.retry_queue import retry_queue
+from src.services.campaign_scheduler import campaign_scheduler
+from src.services.webhook_queue import webhook_queue
+
+configure_logging() # The one place logging is set up (LOG_LEVEL, LOG_FORMAT)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'a_default_secret_key_please_change_in_prod')
@@ -46,6 +54,7 @@ app.register_blueprint(campaigns_bp, url_prefix='/campaigns') # Will be /api/cam
 app.register_blueprint(reports_bp, url_prefix='/reports') # Will be /api/reports
 app.register_blueprint(admin_pricing_bp, url_prefix='/admin-pricing') # Will be /api/admin-pricing
 app.register_blueprint(client_portal_bp, url_prefix='/client-portal') # Will be /api/client-portal
+app.register_blueprint(suppressions_bp, url_prefix='/suppressions') # Will be /api/suppressions
 
 
 # Database Configuration (User must set these environment variables in Vercel)
@@ -58,6 +67,16 @@ if os.getenv('DB_HOST'): # Only configure DB if DB_HOST is set
     # Consider using Flask-Migrate or a similar tool for database migrations.
     # with app.app_context():
     #     db.create_all() # User might need to run this once or handle migrations
+    # Databases created before the campaign send pipeline need migrations/0001_campaign_send_pipeline.sql applied once.
+
+    # Resume campaigns left in SENDING by a crashed or recycled instance
+    campaign_dispatcher.start_recovery_monitor(app)
+    # Re-send messages that failed with transient errors (also picks up retries persisted before a restart)
+    retry_queue.start(app)
+    # Send SCHEDULED campaigns when their scheduled_at is reached
+    campaign_scheduler.start(app)
+    # Apply WhatsApp webhook payloads queued by the webhook route (and any left pending before a restart)
+    webhook_queue.start(app)
 
 # The main Flask app instance is 'app', which Vercel will pick up.
 # No need for app.run() as Vercel handles the serving.
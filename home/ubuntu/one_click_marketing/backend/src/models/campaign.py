@@ -13,17 +13,10 @@ class Campaign(db.Model):
     
     campaign_name = db.Column(db.String(255), nullable=False)
     
-    # Audience can be complex. For now, let's assume a simple list of phone numbers or a segment ID.
-    # A more robust solution might involve a separate Audience model or integration with a CRM.
-    # For simplicity, storing as JSON text for now, e.g., ["+15551234567", "+15557654321"]
-    # Or it could be a reference to a contact list/group model if we build that.
-    audience_json = db.Column(db.Text, nullable=True) # JSON array of phone numbers or contact group IDs
-    
-    # Personalization data: A JSON object where keys are recipient phone numbers (or other identifiers)
-    # and values are objects પાણીng variable values for that recipient.
-    # E.g., {"+15551234567": {"name": "John", "date": "2023-10-26"}, ...}
-    # This might become very large. For large campaigns, consider alternative storage or processing.
-    personalization_data_json = db.Column(db.Text, nullable=True) 
+    # Legacy audience storage. The audience and per-recipient variables now live in the campaign_recipients
+    # table (see CampaignRecipient); these blobs are only read to migrate campaigns created before it existed.
+    audience_json = db.Column(db.Text, nullable=True) # JSON array of phone numbers
+    personalization_data_json = db.Column(db.Text, nullable=True) # JSON object: {"phone": {"var_name": "val"}}
 
     scheduled_at = db.Column(db.DateTime, nullable=True) # If null, send immediately (or requires manual trigger)
     # Actual send time might differ slightly due to processing delays.
@@ -31,6 +24,7 @@ class Campaign(db.Model):
     
     status = db.Column(db.String(50), nullable=False, default="DRAFT") 
     # DRAFT, SCHEDULED, SENDING, COMPLETED, PAUSED, FAILED, CANCELLED
+    failure_reason = db.Column(db.Text, nullable=True) # Why the campaign failed, set by the background dispatcher
     
     # Statistics (can be aggregated from MessageLog or stored here for quick access)
     total_recipients = db.Column(db.Integer, default=0)
@@ -38,6 +32,23 @@ class Campaign(db.Model):
     messages_delivered_count = db.Column(db.Integer, default=0)
     messages_read_count = db.Column(db.Integer, default=0)
     messages_failed_count = db.Column(db.Integer, default=0)
+    # Outcome of the pre-send audience normalization (JSON): numbers normalized, invalid and duplicate
+    # entries dropped, with samples. total_recipients is the number actually sent to once this is set.
+    audience_report_json = db.Column(db.Text, nullable=True)
+
+    # Billing: the send reserves total_recipients x price from the client's wallet up front. Sent messages are
+    # charged against that hold in periodic CAMPAIGN_COST entries; whatever is left is released at the end.
+    billing_price_per_message = db.Column(db.Numeric(10, 4), nullable=True) # Price locked in when the send started
+    billing_reserved_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0) # Hold not yet charged or released
+    billing_settled_count = db.Column(db.Integer, nullable=False, default=0) # Sent messages already charged
+
+    # Send progress. When the send starts, the pending recipients after send_cursor are split into campaign_chunks
+    # (chunked_at is set in the same transaction); instances then lease and send chunks in parallel, and send_cursor
+    # records the last recipient of the most recently finished chunk. Workers refresh send_heartbeat_at after every
+    # chunk; a stale heartbeat on a SENDING campaign that was never split means the instance that started it died.
+    send_cursor = db.Column(db.Integer, nullable=False, default=0)
+    send_heartbeat_at = db.Column(db.DateTime, nullable=True)
+    chunked_at = db.Column(db.DateTime, nullable=True)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -47,6 +58,11 @@ class Campaign(db.Model):
     template = db.relationship("MessageTemplate", backref=db.backref("campaigns", lazy=True))
 
     # Message logs for this campaign can be queried via MessageLog.campaign_id
+    # Recipients can be queried via CampaignRecipient.campaign_id
+
+    __table_args__ = (
+        db.Index("ix_campaigns_status_scheduled_at", "status", "scheduled_at"), # The scheduler's due-campaign lookups
+    )
 
     def __repr__(self):
         return f"<Campaign {self.id} 	{self.campaign_name}	 for Client {self.client_id}>"
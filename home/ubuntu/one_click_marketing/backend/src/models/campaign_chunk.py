@@ -0,0 +1,32 @@
+# backend/src/models/campaign_chunk.py
+
+from datetime import datetime
+from .user import db # Assuming db is initialized
+
+class CampaignChunk(db.Model):
+    __tablename__ = "campaign_chunks"
+
+    # A contiguous id range of a campaign's recipients, sent as one unit. Any instance can send a chunk once it
+    # holds its lease; a lease that isn't renewed before lease_expires_at can be taken over by another instance.
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey("campaigns.id", ondelete="CASCADE"), nullable=False)
+    first_recipient_id = db.Column(db.Integer, nullable=False) # Inclusive CampaignRecipient.id bounds
+    last_recipient_id = db.Column(db.Integer, nullable=False)
+
+    state = db.Column(db.String(20), nullable=False, default="pending") # pending, leased, done, cancelled
+    lease_owner = db.Column(db.String(120), nullable=True) # Worker identity (host:pid:random) holding the lease
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    lease_count = db.Column(db.Integer, nullable=False, default=0) # > 1 means an earlier lease expired mid-chunk
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # Lease claims scan a campaign's open chunks in id order
+        db.Index("ix_campaign_chunks_campaign_id_state_id", "campaign_id", "state", "id"),
+        # Instances look for campaigns with pending chunks or expired leases
+        db.Index("ix_campaign_chunks_state_lease_expires_at", "state", "lease_expires_at"),
+    )
+
+    def __repr__(self):
+        return f"<CampaignChunk {self.id} of Campaign {self.campaign_id} [{self.first_recipient_id}-{self.last_recipient_id}] {self.state}>"
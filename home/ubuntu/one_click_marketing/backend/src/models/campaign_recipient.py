@@ -0,0 +1,34 @@
+# backend/src/models/campaign_recipient.py
+
+from datetime import datetime
+from .user import db # Assuming db is initialized
+
+class CampaignRecipient(db.Model):
+    __tablename__ = "campaign_recipients"
+
+    # One row per audience member of a campaign. Replaces the audience_json / personalization_data_json
+    # blobs on Campaign so that campaigns of any size can be created and sent in fixed-size chunks.
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey("campaigns.id", ondelete="CASCADE"), nullable=False)
+    phone_number = db.Column(db.String(30), nullable=False)
+    variables_json = db.Column(db.Text, nullable=True) # JSON object of personalization variables, e.g. {"name": "John"}
+
+    state = db.Column(db.String(20), nullable=False, default="pending")
+    # pending, sending (API call in flight), retrying (transient failure, retry scheduled), sent, failed, interrupted,
+    # unconfirmed (no response to the send, never retried; its status webhook turns it into sent or failed),
+    # cancelled (campaign cancelled before this recipient was attempted),
+    # invalid / duplicate (dropped by the pre-send normalization pass, never sent),
+    # suppressed (number is on the client's suppression list, never sent)
+    message_log_id = db.Column(db.Integer, db.ForeignKey("message_logs.id"), nullable=True) # Log row of the send attempt
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # The send path walks a campaign's recipients in id order and filters on state
+        db.Index("ix_campaign_recipients_campaign_id_id", "campaign_id", "id"),
+        db.Index("ix_campaign_recipients_campaign_id_state", "campaign_id", "state"),
+        db.Index("ix_campaign_recipients_campaign_id_phone_number", "campaign_id", "phone_number"), # Deduplication
+    )
+
+    def __repr__(self):
+        return f"<CampaignRecipient {self.id} {self.phone_number} of Campaign {self.campaign_id} state {self.state}>"
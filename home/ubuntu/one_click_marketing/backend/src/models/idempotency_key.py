@@ -0,0 +1,30 @@
+# backend/src/models/idempotency_key.py
+
+from datetime import datetime
+from .user import db # Assuming db is initialized
+
+class IdempotencyKey(db.Model):
+    __tablename__ = "idempotency_keys"
+
+    # One row per Idempotency-Key a client sent to the messaging routes. The row is inserted before the
+    # message is sent (state "in_progress") and holds the response once the request finished ("completed"),
+    # so a retry with the same key is answered from here instead of messaging the recipient again.
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    idempotency_key = db.Column(db.String(255), nullable=False)
+    request_fingerprint = db.Column(db.String(64), nullable=False) # SHA-256 of route and body; a reused key with another body is rejected
+
+    state = db.Column(db.String(20), nullable=False, default="in_progress") # in_progress, completed
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True) # JSON returned by the original request
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True) # Keys expire IDEMPOTENCY_KEY_TTL_HOURS after this
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # The unique index is what makes concurrent requests with the same key safe: only one insert wins
+        db.UniqueConstraint("client_id", "idempotency_key", name="uq_idempotency_keys_client_id_key"),
+    )
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.idempotency_key} of Client {self.client_id} {self.state}>"
@@ -3,6 +3,20 @@
 from datetime import datetime
 from .user import db # Assuming db is initialized in user.py or a central app file and can be imported
 
+class MessageStatus:
+    """Outgoing status values that are written by the send paths and the status webhook."""
+    PENDING_API_CALL = "pending_api_call"
+    SENT_TO_WHATSAPP = "sent_to_whatsapp"
+    DELIVERED = "delivered"
+    READ = "read"
+    RETRY_SCHEDULED = "retry_scheduled"
+    RETRY_IN_FLIGHT = "retry_in_flight"
+    SEND_UNKNOWN = "send_unknown" # No response to the send (e.g. read timeout); settled by its status webhook
+    FAILED_ON_SEND = "failed_on_send"
+    FAILED_INTERNAL_ERROR_ON_SEND = "failed_internal_error_on_send"
+    FAILED_INTERRUPTED = "failed_interrupted"
+    FAILED_FROM_WHATSAPP = "failed" # Reported by Meta's status webhook
+
 class MessageLog(db.Model):
     __tablename__ = "message_logs"
 
@@ -22,11 +36,19 @@ class MessageLog(db.Model):
     incoming_message_content = db.Column(db.Text, nullable=True) # For incoming messages
 
     status = db.Column(db.String(50), nullable=False, default="pending") 
-    # Outgoing statuses: pending, sent, delivered, read, failed, undeliverable
+    # Outgoing statuses: pending, sent, delivered, read, failed, undeliverable,
+    # retry_scheduled / retry_in_flight (transient send failure being retried),
+    # send_unknown (no response to the send, not retried; matched to its status webhook by recipient)
     # Incoming statuses: received, read_by_client (if we implement client read status)
     
     failure_reason = db.Column(db.Text, nullable=True)
+    attempt_count = db.Column(db.Integer, nullable=False, default=1) # Send attempts made so far (outgoing)
+    next_retry_at = db.Column(db.DateTime, nullable=True) # When a "retry_scheduled" message is due to be re-sent
+    retry_claimed_by = db.Column(db.String(120), nullable=True) # Claim token (host:pid:random) of the retry worker that last re-sent it
     cost = db.Column(db.Numeric(10, 4), nullable=True) # Cost of sending the message
+    # "campaign:<id>:recipient:<id>" for campaign sends. The unique index guarantees a recipient is never given a
+    # second log (and so a second message) by an overlapping sender; retries re-send the same log.
+    idempotency_key = db.Column(db.String(120), nullable=True, unique=True)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     sent_at = db.Column(db.DateTime, nullable=True) # Timestamp from WhatsApp when message was sent by them
@@ -38,6 +60,10 @@ class MessageLog(db.Model):
     client = db.relationship("User", backref=db.backref("message_logs", lazy=True))
     # campaign = db.relationship("Campaign", backref=db.backref("message_logs", lazy=True)) # When Campaign model exists
 
+    __table_args__ = (
+        db.Index("ix_message_logs_status_next_retry_at", "status", "next_retry_at"), # Due-retry lookups
+    )
+
     def __repr__(self):
         return f"<MessageLog {self.id} to {self.recipient_phone_number} status {self.status}>"
 
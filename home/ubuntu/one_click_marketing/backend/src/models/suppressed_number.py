@@ -0,0 +1,26 @@
+# backend/src/models/suppressed_number.py
+
+from datetime import datetime
+from .user import db # Assuming db is initialized
+
+class SuppressedNumber(db.Model):
+    __tablename__ = "suppressed_numbers"
+
+    # Numbers a client must not message: opted out by replying with an opt-out keyword, or added
+    # by the client through the suppression API. Campaigns and the /messages/send-* routes skip them.
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    phone_number = db.Column(db.String(30), nullable=False) # E.164, e.g. "+15551234567"
+    reason = db.Column(db.String(50), nullable=False, default="manual") # "opt_out_keyword" or "manual"
+    notes = db.Column(db.Text, nullable=True) # e.g. the inbound message that triggered the opt-out
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    client = db.relationship("User", backref=db.backref("suppressed_numbers", lazy=True))
+
+    __table_args__ = (
+        db.UniqueConstraint("client_id", "phone_number", name="uq_suppressed_numbers_client_id_phone_number"),
+    )
+
+    def __repr__(self):
+        return f"<SuppressedNumber {self.phone_number} for Client {self.client_id} ({self.reason})>"
@@ -46,9 +46,14 @@ class ClientProfile(db.Model):
     meta_access_token_encrypted = db.Column(db.String(1024), nullable=True) 
     meta_phone_number_id = db.Column(db.String(80), nullable=True)
     meta_waba_id = db.Column(db.String(80), nullable=True) # WhatsApp Business Account ID
+    meta_messages_per_second = db.Column(db.Integer, nullable=True) # Meta throughput tier for this number; null uses the system default
+    # Share of the platform's campaign send capacity relative to other clients (see FairSendQueue); null uses SEND_DEFAULT_CLIENT_WEIGHT
+    send_weight = db.Column(db.Float, nullable=True)
 
     # Wallet Balance - Using Numeric for precision with currency
     wallet_balance = db.Column(db.Numeric(10, 2), nullable=False, default=decimal.Decimal("0.00"))
+    # Part of wallet_balance held by campaigns being sent (see CampaignBilling); available = balance - reserved
+    wallet_reserved_balance = db.Column(db.Numeric(10, 2), nullable=False, default=decimal.Decimal("0.00"))
     currency = db.Column(db.String(10), nullable=False, default="USD") # Default currency for the wallet
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
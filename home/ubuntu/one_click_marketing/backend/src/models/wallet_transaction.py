@@ -18,7 +18,7 @@ class WalletTransaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     campaign_id = db.Column(db.Integer, db.ForeignKey("campaigns.id"), nullable=True) # Optional, if related to a campaign
-    message_log_id = db.Column(db.Integer, db.ForeignKey("message_log.id"), nullable=True) # Optional, if related to a specific message
+    message_log_id = db.Column(db.Integer, db.ForeignKey("message_logs.id"), nullable=True) # Optional, if related to a specific message
     
     transaction_type = db.Column(db.Enum(TransactionType), nullable=False)
     amount = db.Column(db.Float, nullable=False) # Positive for credits (top-up), negative for debits (costs)
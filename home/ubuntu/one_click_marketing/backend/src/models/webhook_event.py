@@ -0,0 +1,31 @@
+# backend/src/models/webhook_event.py
+
+from datetime import datetime
+from .user import db # Assuming db is initialized
+
+class WebhookEvent(db.Model):
+    __tablename__ = "webhook_events"
+
+    # Append-only queue of raw WhatsApp webhook payloads. The webhook route only inserts a row and answers
+    # Meta; consumer threads claim pending rows in id order, apply them, and mark them done in the same
+    # transaction. Done rows are purged after WEBHOOK_EVENT_RETENTION_HOURS.
+    id = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.Text(16777215), nullable=False) # Raw JSON body as received (MEDIUMTEXT on MySQL)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    state = db.Column(db.String(20), nullable=False, default="pending") # pending, processing, done, failed
+    claimed_by = db.Column(db.String(120), nullable=True) # Claim token (host:pid:random) of the consumer processing it
+    claimed_at = db.Column(db.DateTime, nullable=True) # A claim older than WEBHOOK_CLAIM_TIMEOUT_SECONDS is taken over
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True) # Why processing failed (state "failed" after WEBHOOK_MAX_ATTEMPTS)
+
+    __table_args__ = (
+        # Consumers claim the oldest pending (or abandoned) rows
+        db.Index("ix_webhook_events_state_id", "state", "id"),
+        # Purge of processed rows
+        db.Index("ix_webhook_events_state_processed_at", "state", "processed_at"),
+    )
+
+    def __repr__(self):
+        return f"<WebhookEvent {self.id} {self.state}>"
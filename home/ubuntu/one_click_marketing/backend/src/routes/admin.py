@@ -81,7 +81,8 @@ def get_user(user_id):
                 "company_name": user.client_profile.company_name,
                 "wallet_balance": float(user.client_profile.wallet_balance),
                 "meta_phone_number_id": user.client_profile.meta_phone_number_id,
-                "meta_api_key_present": bool(user.client_profile.meta_api_key_encrypted) # Indicate if key is set
+                "meta_api_key_present": bool(user.client_profile.meta_api_key_encrypted), # Indicate if key is set
+                "send_weight": user.client_profile.send_weight
             }
 
         return jsonify({
@@ -127,6 +128,15 @@ def update_user(user_id):
                     user.client_profile.wallet_balance = float(profile_data["wallet_balance"])
                 except ValueError:
                     return jsonify({"message": "Invalid wallet balance format"}), 400
+            if "send_weight" in profile_data:
+                # Relative share of campaign send capacity; null restores the default
+                try:
+                    send_weight = float(profile_data["send_weight"]) if profile_data["send_weight"] is not None else None
+                except (TypeError, ValueError):
+                    return jsonify({"message": "Invalid send weight format"}), 400
+                if send_weight is not None and send_weight <= 0:
+                    return jsonify({"message": "send_weight must be greater than 0"}), 400
+                user.client_profile.send_weight = send_weight
         
         user.updated_at = datetime.datetime.utcnow()
         db.session.commit()
@@ -1,21 +1,58 @@
 # backend/src/routes/campaigns.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from sqlalchemy import delete, update
 from ..models.user import User, ClientProfile, db
 from ..models.campaign import Campaign
 from ..models.message_template import MessageTemplate
-from ..models.message_log import MessageLog # For logging messages sent as part of a campaign
-from ..services.whatsapp_service import WhatsAppService # To send messages
+from ..models.campaign_recipient import CampaignRecipient
+from ..models.campaign_chunk import CampaignChunk
+from ..services.audience_service import AudienceService, AudienceUploadReport
+from ..services.campaign_dispatcher import campaign_dispatcher # Background campaign sending
+from ..services.campaign_scheduler import campaign_scheduler # Fires SCHEDULED campaigns
+from ..services.billing_service import CampaignBilling
+from ..services.campaign_progress import campaign_progress, CAMPAIGN_PROGRESS_STREAM_SECONDS, CAMPAIGN_PROGRESS_STREAM_TOKEN_SECONDS # Live counters for the progress stream
+from ..routes.auth import SECRET_KEY
 from ..routes.meta_integration import token_required
 import logging
 import json
-from datetime import datetime
-import time # For potential delays in a loop
+import csv
+import io
+import time
+import jwt # PyJWT library
+from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger(__name__)
 
 campaigns_bp = Blueprint("campaigns_bp", __name__, url_prefix="/api/v1/campaigns")
 
+# get_campaign?include_audience=true inlines the audience only up to this many recipients
+MAX_INLINE_AUDIENCE = 10000
+
+UPLOAD_FORMATS_BY_MIMETYPE = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+UPLOAD_READ_BUFFER_SIZE = 64 * 1024
+
+# Progress stream: a comment line is sent after this many idle seconds so proxies keep the connection open,
+# and bursts of changes (e.g. webhook storms) are coalesced into at most one event per interval
+PROGRESS_KEEPALIVE_SECONDS = 15
+PROGRESS_MIN_EVENT_INTERVAL_SECONDS = 0.5
+PROGRESS_RECONNECT_MS = 3000
+# "aud" claim of progress stream tokens: token_required rejects them, so they can't be used as API tokens
+PROGRESS_STREAM_TOKEN_AUDIENCE = "campaign-progress-stream"
+
+def parse_scheduled_at(value):
+    """Parses an ISO 8601 scheduled_at into a naive UTC datetime, the form stored in the campaigns table."""
+    scheduled_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if scheduled_at.tzinfo is not None:
+        scheduled_at = scheduled_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return scheduled_at
+
 @campaigns_bp.route("", methods=["POST"])
 @token_required
 def create_campaign():
@@ -30,8 +67,9 @@ def create_campaign():
     personalization_data_json = data.get("personalization_data_json") # JSON string: {"phone": {"var_name": "val"}}
     scheduled_at_str = data.get("scheduled_at") # ISO format string or null
 
-    if not campaign_name or not template_id or not audience_json:
-        return jsonify({"message": "Missing required fields: campaign_name, template_id, audience_json"}), 400
+    # audience_json may be omitted for large audiences, which are then uploaded via POST /<id>/audience
+    if not campaign_name or not template_id:
+        return jsonify({"message": "Missing required fields: campaign_name, template_id"}), 400
 
     template = MessageTemplate.query.filter_by(id=template_id, client_id=client_id).first()
     if not template:
@@ -42,15 +80,14 @@ def create_campaign():
     scheduled_at = None
     if scheduled_at_str:
         try:
-            scheduled_at = datetime.fromisoformat(scheduled_at_str.replace("Z", "+00:00"))
+            scheduled_at = parse_scheduled_at(scheduled_at_str)
         except ValueError:
             return jsonify({"message": "Invalid scheduled_at format. Use ISO 8601 format."}), 400
 
     try:
-        audience_list = json.loads(audience_json)
+        audience_list = json.loads(audience_json or "[]")
         if not isinstance(audience_list, list):
             raise ValueError("Audience JSON must be a list of phone numbers.")
-        total_recipients = len(audience_list)
     except (json.JSONDecodeError, ValueError) as e:
         return jsonify({"message": f"Invalid audience_json: {str(e)}"}), 400
     
@@ -68,11 +105,8 @@ def create_campaign():
             client_id=client_id,
             template_id=template_id,
             campaign_name=campaign_name,
-            audience_json=audience_json, # Store the original JSON
-            personalization_data_json=personalization_data_json, # Store the original JSON
             scheduled_at=scheduled_at,
-            status="DRAFT",
-            total_recipients=total_recipients
+            status="DRAFT"
         )
         if scheduled_at and scheduled_at > datetime.utcnow():
             new_campaign.status = "SCHEDULED"
@@ -80,13 +114,18 @@ def create_campaign():
              new_campaign.status = "PENDING_SEND" # Ready for manual trigger
         
         db.session.add(new_campaign)
+        db.session.flush() # Get the campaign ID for its recipients
+        # One campaign_recipients row per audience member, written in bulk in the same transaction
+        AudienceService.replace_recipients(new_campaign, audience_list, parsed_personalization_data)
         db.session.commit()
+        campaign_scheduler.sync(new_campaign)
         logger.info(f"New campaign 	{campaign_name}	 created for client ID {client_id}, Campaign ID {new_campaign.id}")
         return jsonify({
             "message": "Campaign created successfully.", 
             "campaign_id": new_campaign.id,
             "campaign_name": new_campaign.campaign_name,
-            "status": new_campaign.status
+            "status": new_campaign.status,
+            "total_recipients": new_campaign.total_recipients
         }), 201
     except Exception as e:
         db.session.rollback()
@@ -122,18 +161,17 @@ def get_campaigns():
 @token_required
 def get_campaign(campaign_id):
     client_id = request.current_user_id
+    include_audience = request.args.get("include_audience", "false").lower() == "true"
     try:
         camp = Campaign.query.filter_by(id=campaign_id, client_id=client_id).first()
         if not camp:
             return jsonify({"message": "Campaign not found or access denied"}), 404
         
-        return jsonify({
+        result = {
             "id": camp.id,
             "campaign_name": camp.campaign_name,
             "template_id": camp.template_id,
             "template_name": camp.template.template_name if camp.template else None,
-            "audience_json": camp.audience_json,
-            "personalization_data_json": camp.personalization_data_json,
             "status": camp.status,
             "scheduled_at": camp.scheduled_at.isoformat() if camp.scheduled_at else None,
             "actual_sent_at": camp.actual_sent_at.isoformat() if camp.actual_sent_at else None,
@@ -142,13 +180,224 @@ def get_campaign(campaign_id):
             "messages_delivered_count": camp.messages_delivered_count,
             "messages_read_count": camp.messages_read_count,
             "messages_failed_count": camp.messages_failed_count,
+            "send_cursor": camp.send_cursor,
+            "failure_reason": camp.failure_reason,
+            "audience_report": json.loads(camp.audience_report_json) if camp.audience_report_json else None, # Set once sending starts
+            "billing_reserved_amount": str(camp.billing_reserved_amount or 0), # Hold not yet charged or released
+            "billing_settled_count": camp.billing_settled_count,
             "created_at": camp.created_at.isoformat(),
             "updated_at": camp.updated_at.isoformat()
-        }), 200
+        }
+        if include_audience:
+            # Only for small audiences (edit/view forms); large audiences are paged via /<id>/recipients
+            if camp.audience_json: # Legacy campaign that hasn't been migrated to campaign_recipients yet
+                result["audience_json"] = camp.audience_json
+                result["personalization_data_json"] = camp.personalization_data_json
+            elif (camp.total_recipients or 0) <= MAX_INLINE_AUDIENCE:
+                recipients = CampaignRecipient.query.filter_by(campaign_id=camp.id).order_by(CampaignRecipient.id).all()
+                result["audience_json"] = json.dumps([r.phone_number for r in recipients])
+                result["personalization_data_json"] = json.dumps({r.phone_number: json.loads(r.variables_json) for r in recipients if r.variables_json})
+        return jsonify(result), 200
     except Exception as e:
         logger.error(f"Error fetching campaign {campaign_id} for client {client_id}: {str(e)}", exc_info=True)
         return jsonify({"message": "Failed to retrieve campaign", "error": str(e)}), 500
 
+@campaigns_bp.route("/<int:campaign_id>/progress/stream-token", methods=["POST"])
+@token_required
+def create_progress_stream_token(campaign_id):
+    """
+    Issues a short-lived token that opens this campaign's progress stream: EventSource can't send an
+    Authorization header, and the API token must not end up in URLs (server logs, browser history).
+    """
+    client_id = request.current_user_id
+    camp = Campaign.query.filter_by(id=campaign_id, client_id=client_id).first()
+    if not camp:
+        return jsonify({"message": "Campaign not found or access denied"}), 404
+    stream_token = jwt.encode({
+        "user_id": client_id,
+        "campaign_id": campaign_id,
+        "aud": PROGRESS_STREAM_TOKEN_AUDIENCE,
+        "exp": datetime.now(timezone.utc) + timedelta(seconds=CAMPAIGN_PROGRESS_STREAM_TOKEN_SECONDS)
+    }, SECRET_KEY, algorithm="HS256")
+    return jsonify({"stream_token": stream_token, "expires_in": CAMPAIGN_PROGRESS_STREAM_TOKEN_SECONDS}), 200
+
+def stream_token_required(fn):
+    """
+    Authenticates the progress stream with ?stream_token=<token from POST /<id>/progress/stream-token>.
+    Clients that can send an Authorization header may use their API token instead.
+    """
+    def wrapper(*args, **kwargs):
+        stream_token = request.args.get("stream_token")
+        if not stream_token:
+            return token_required(fn)(*args, **kwargs)
+        try:
+            claims = jwt.decode(stream_token, SECRET_KEY, algorithms=["HS256"], audience=PROGRESS_STREAM_TOKEN_AUDIENCE)
+        except jwt.ExpiredSignatureError:
+            return jsonify({"message": "Stream token has expired"}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({"message": "Invalid stream token"}), 401
+        if claims.get("campaign_id") != kwargs.get("campaign_id"):
+            return jsonify({"message": "Stream token was issued for another campaign"}), 403
+        request.current_user_id = claims.get("user_id")
+        return fn(*args, **kwargs)
+    wrapper.__name__ = fn.__name__
+    return wrapper
+
+@campaigns_bp.route("/<int:campaign_id>/progress/stream", methods=["GET"])
+@stream_token_required
+def stream_campaign_progress(campaign_id):
+    """
+    Server-Sent Events stream of a campaign's status and counters. A "progress" event carrying the same field
+    names as GET /campaigns/<id> is sent on connect and whenever they change. Events are fed from in-process
+    counters; the database is read only by the periodic refresh, once per campaign for all its streams.
+    Browsers open it as new EventSource(".../progress/stream?stream_token=..."); when the token has expired
+    the reconnect fails with a 401 and the page requests a new token.
+    """
+    client_id = request.current_user_id
+    camp = Campaign.query.filter_by(id=campaign_id, client_id=client_id).first()
+    if not camp:
+        return jsonify({"message": "Campaign not found or access denied"}), 404
+    db.session.rollback() # Don't hold a connection for the lifetime of the stream
+
+    if not campaign_progress.watch(campaign_id):
+        return jsonify({"message": "Too many live progress streams on this server; poll GET /campaigns/<id> instead."}), 503
+
+    def events():
+        yield f"retry: {PROGRESS_RECONNECT_MS}\n\n"
+        version = -1
+        ends_at = time.monotonic() + CAMPAIGN_PROGRESS_STREAM_SECONDS
+        while time.monotonic() < ends_at:
+            new_version, snapshot = campaign_progress.wait(campaign_id, version, timeout=PROGRESS_KEEPALIVE_SECONDS)
+            if new_version == version:
+                yield ": keepalive\n\n"
+                continue
+            version = new_version
+            yield f"event: progress\nid: {version}\ndata: {json.dumps({'campaign_id': campaign_id, **snapshot})}\n\n"
+            time.sleep(PROGRESS_MIN_EVENT_INTERVAL_SECONDS)
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # Disable proxy buffering
+    )
+    # Runs when the stream ends or the client disconnects, even if no event was sent yet
+    response.call_on_close(lambda: campaign_progress.unwatch(campaign_id))
+    return response
+
+@campaigns_bp.route("/<int:campaign_id>/recipients", methods=["GET"])
+@token_required
+def get_campaign_recipients(campaign_id):
+    client_id = request.current_user_id
+    page = request.args.get("page", 1, type=int)
+    per_page = min(request.args.get("per_page", 100, type=int), 1000)
+    state = request.args.get("state") # Optional filter: pending, sent, failed, ...
+
+    camp = Campaign.query.filter_by(id=campaign_id, client_id=client_id).first()
+    if not camp:
+        return jsonify({"message": "Campaign not found or access denied"}), 404
+
+    try:
+        recipients_query = CampaignRecipient.query.filter_by(campaign_id=camp.id)
+        if state:
+            recipients_query = recipients_query.filter_by(state=state)
+        paginated_recipients = recipients_query.order_by(CampaignRecipient.id).paginate(page=page, per_page=per_page, error_out=False)
+
+        results = []
+        for recipient in paginated_recipients.items:
+            results.append({
+                "id": recipient.id,
+                "phone_number": recipient.phone_number,
+                "variables": json.loads(recipient.variables_json) if recipient.variables_json else {},
+                "state": recipient.state,
+                "message_log_id": recipient.message_log_id
+            })
+
+        return jsonify({
+            "recipients": results,
+            "total_recipients": paginated_recipients.total,
+            "current_page": paginated_recipients.page,
+            "total_pages": paginated_recipients.pages,
+            "per_page": paginated_recipients.per_page
+        }), 200
+    except Exception as e:
+        logger.error(f"Error fetching recipients of campaign {campaign_id}: {str(e)}", exc_info=True)
+        return jsonify({"message": "Failed to retrieve campaign recipients", "error": str(e)}), 500
+
+def _recount_recipients(camp):
+    """
+    Stores the campaign's recipient count after a failed upload (appended chunks committed before the
+    failure are kept; a failed replace was rolled back entirely). Commits. Returns the count, or None.
+    """
+    try:
+        camp.total_recipients = AudienceService.count_recipients(camp.id)
+        db.session.commit()
+        return camp.total_recipients
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error recounting recipients of campaign {camp.id}: {str(e)}", exc_info=True)
+        return None
+
+@campaigns_bp.route("/<int:campaign_id>/audience", methods=["POST"])
+@token_required
+def upload_campaign_audience(campaign_id):
+    """
+    Streams a CSV (text/csv) or NDJSON (application/x-ndjson) audience file into campaign_recipients.
+    The body is parsed incrementally from the request stream and written in batches, so memory use
+    doesn't depend on the file size. ?mode=replace swaps the current audience for the file's recipients
+    (default: append); the swap is one transaction, so a file that fails halfway leaves the old audience in place.
+    """
+    client_id = request.current_user_id
+    camp = Campaign.query.filter_by(id=campaign_id, client_id=client_id).first()
+    if not camp:
+        return jsonify({"message": "Campaign not found or access denied"}), 404
+
+    if camp.status not in ["DRAFT", "SCHEDULED", "PENDING_SEND"]:
+        return jsonify({"message": f"Audience cannot be changed in the campaign's current status: {camp.status}"}), 400
+
+    upload_format = request.args.get("format") or UPLOAD_FORMATS_BY_MIMETYPE.get((request.mimetype or "").lower())
+    if upload_format not in ("csv", "ndjson"):
+        return jsonify({"message": "Unsupported audience format. Send text/csv or application/x-ndjson (or pass ?format=csv|ndjson)."}), 415
+
+    mode = request.args.get("mode", "append")
+    if mode not in ("append", "replace"):
+        return jsonify({"message": "mode must be 'append' or 'replace'"}), 400
+
+    report = AudienceUploadReport()
+    try:
+        AudienceService.migrate_legacy_audience(camp)
+        db.session.commit()
+        if mode == "replace":
+            # Not committed until the whole file has been written: the delete and the inserts succeed or fail together
+            db.session.execute(delete(CampaignRecipient).where(CampaignRecipient.campaign_id == camp.id))
+
+        # utf-8-sig drops the BOM that spreadsheet exports often start with
+        text_stream = io.TextIOWrapper(io.BufferedReader(request.stream, buffer_size=UPLOAD_READ_BUFFER_SIZE), encoding="utf-8-sig", newline="")
+        if upload_format == "csv":
+            recipients = AudienceService.parse_csv_stream(text_stream, report)
+        else:
+            recipients = AudienceService.parse_ndjson_stream(text_stream, report)
+        # Appends commit per chunk so very large files don't build one huge transaction
+        AudienceService.add_recipients(camp.id, recipients, commit_each_chunk=(mode == "append"))
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        total_recipients = _recount_recipients(camp)
+        return jsonify({"message": f"Invalid audience file: {str(e)}", **report.to_dict(), "total_recipients": total_recipients}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error uploading audience for campaign {campaign_id}: {str(e)}", exc_info=True)
+        total_recipients = _recount_recipients(camp)
+        return jsonify({"message": "Failed to upload audience", "error": str(e), **report.to_dict(), "total_recipients": total_recipients}), 500
+
+    camp.total_recipients = AudienceService.count_recipients(camp.id)
+    db.session.commit()
+    logger.info(f"Audience upload for campaign {camp.id}: {report.rows_accepted} accepted, {report.rows_rejected} rejected")
+    return jsonify({
+        "message": "Audience uploaded.",
+        "campaign_id": camp.id,
+        **report.to_dict(),
+        "total_recipients": camp.total_recipients
+    }), 200
+
 @campaigns_bp.route("/<int:campaign_id>", methods=["PUT"])
 @token_required
 def update_campaign(campaign_id):
@@ -171,23 +420,33 @@ def update_campaign(campaign_id):
             if not template: return jsonify({"message": "Template not found"}), 404
             if template.status != "APPROVED_BY_META": return jsonify({"message": "Template not approved by Meta"}), 400
             camp.template_id = data["template_id"]
-        if "audience_json" in data: 
-            camp.audience_json = data["audience_json"]
+        if "audience_json" in data or "personalization_data_json" in data:
             try:
-                audience_list = json.loads(data["audience_json"])
-                camp.total_recipients = len(audience_list)
-            except: return jsonify({"message": "Invalid audience_json"}),400
-        if "personalization_data_json" in data: camp.personalization_data_json = data["personalization_data_json"]
+                personalization_map = json.loads(data.get("personalization_data_json") or "{}")
+                if not isinstance(personalization_map, dict): raise ValueError()
+            except (json.JSONDecodeError, TypeError, ValueError): return jsonify({"message": "Invalid personalization_data_json"}), 400
+            AudienceService.migrate_legacy_audience(camp) # Make sure recipients, not blobs, hold the audience
+            if "audience_json" in data:
+                try:
+                    audience_list = json.loads(data["audience_json"])
+                    if not isinstance(audience_list, list): raise ValueError()
+                except (json.JSONDecodeError, TypeError, ValueError): return jsonify({"message": "Invalid audience_json"}), 400
+                AudienceService.replace_recipients(camp, audience_list, personalization_map)
+            else:
+                AudienceService.update_personalization(camp.id, personalization_map)
         if "scheduled_at" in data:
             scheduled_at_str = data.get("scheduled_at")
             if scheduled_at_str:
-                camp.scheduled_at = datetime.fromisoformat(scheduled_at_str.replace("Z", "+00:00"))
+                try:
+                    camp.scheduled_at = parse_scheduled_at(scheduled_at_str)
+                except ValueError: return jsonify({"message": "Invalid scheduled_at format. Use ISO 8601 format."}), 400
                 camp.status = "SCHEDULED" if camp.scheduled_at > datetime.utcnow() else camp.status
             else:
                 camp.scheduled_at = None
                 camp.status = "PENDING_SEND" if camp.status == "SCHEDULED" else camp.status
         
         db.session.commit()
+        campaign_scheduler.sync(camp)
         logger.info(f"Campaign ID {campaign_id} updated for client ID {client_id}")
         return jsonify({"message": "Campaign updated successfully.", "campaign_id": camp.id, "status": camp.status}), 200
     except Exception as e:
@@ -206,9 +465,18 @@ def delete_campaign(campaign_id):
     if camp.status not in ["DRAFT", "SCHEDULED", "CANCELLED", "FAILED", "COMPLETED", "PENDING_SEND"]:
          return jsonify({"message": f"Campaign cannot be deleted in its current status: {camp.status}. You might need to cancel it first."}), 400
 
+    if CampaignBilling.has_chunk_in_flight(camp.id):
+        return jsonify({"message": "Campaign is still finishing a batch of messages. Try again in a moment."}), 409
+
     try:
+        # The final charge and the release of the hold are committed together with the delete;
+        # no worker is left to settle a campaign that no longer exists
+        CampaignBilling.settle(camp.id, release=True, commit=False)
+        db.session.execute(delete(CampaignChunk).where(CampaignChunk.campaign_id == camp.id))
+        db.session.execute(delete(CampaignRecipient).where(CampaignRecipient.campaign_id == camp.id))
         db.session.delete(camp)
         db.session.commit()
+        campaign_scheduler.unschedule(campaign_id)
         logger.info(f"Campaign ID {campaign_id} deleted for client ID {client_id}")
         return jsonify({"message": "Campaign deleted successfully."}), 200
     except Exception as e:
@@ -239,108 +507,176 @@ def send_campaign_now(campaign_id):
         db.session.commit()
         return jsonify({"message": camp.failure_reason}), 400
 
-    try:
-        audience_list = json.loads(camp.audience_json)
-        personalization_map = json.loads(camp.personalization_data_json or "{}")
-        variables_expected = json.loads(template.variables_expected_json or "[]")
-    except Exception as e:
-        camp.status = "FAILED"
-        camp.failure_reason = f"Error parsing campaign data (audience, personalization, or template variables): {str(e)}"
-        db.session.commit()
-        return jsonify({"message": camp.failure_reason}), 400
+    if not camp.total_recipients and not camp.audience_json:
+        return jsonify({"message": "Campaign has no recipients. Provide audience_json or upload an audience first."}), 400
+
+    # Hold recipients x price in the same transaction that starts the send, so it can't overdraw the wallet later
+    reserved, amount, currency = CampaignBilling.reserve(camp)
+    if not reserved:
+        db.session.rollback()
+        return jsonify({
+            "message": "Insufficient wallet balance to send this campaign.",
+            "required_amount": str(amount),
+            "currency": currency
+        }), 402
 
     camp.status = "SENDING"
     camp.actual_sent_at = datetime.utcnow()
+    camp.failure_reason = None
+    camp.send_cursor = 0
+    camp.messages_sent_count = 0
+    camp.messages_failed_count = 0
+    camp.send_heartbeat_at = camp.actual_sent_at
     db.session.commit()
+    campaign_progress.record(camp.id, status="SENDING")
+    campaign_scheduler.unschedule(camp.id) # A scheduled campaign sent manually must not fire again
 
-    whatsapp_service = WhatsAppService(
-        access_token=client_profile.meta_access_token_encrypted, 
-        phone_number_id=client_profile.meta_phone_number_id
-    )
+    # The actual sending happens in a background worker; the campaign moves to
+    # COMPLETED / PARTIALLY_COMPLETED / FAILED once the audience has been drained.
+    campaign_dispatcher.enqueue(current_app._get_current_object(), camp.id)
 
-    sent_count = 0
-    failed_count = 0
+    logger.info(f"Campaign {camp.id} accepted for sending")
+    return jsonify({
+        "message": "Campaign accepted for sending.",
+        "campaign_id": camp.id,
+        "status": camp.status
+    }), 202
 
-    for recipient_phone in audience_list:
-        components = []
-        recipient_personalization = personalization_map.get(str(recipient_phone), {}) # Ensure phone is string key
-        
-        # Assuming template_structure_json helps identify where variables go (header, body)
-        # For simplicity, let's assume all variables go into the body for now if not specified further.
-        # A more robust solution would parse template_structure_json to build components for header, body, buttons.
-        
-        body_params = []
-        # If variables_expected_json is an ordered list of keys for {{1}}, {{2}}...
-        if variables_expected:
-            for var_key in variables_expected:
-                body_params.append({
-                    "type": "text",
-                    "text": str(recipient_personalization.get(var_key, "")) # Default to empty string if var not found
-                })
-        
-        if body_params:
-            components.append({"type": "body", "parameters": body_params})
-        
-        # TODO: Add support for header variables and button payload variables based on template_structure_json
+@campaigns_bp.route("/<int:campaign_id>/resume", methods=["POST"])
+@token_required
+def resume_campaign(campaign_id):
+    client_id = request.current_user_id
 
-        log_entry = MessageLog(
-            client_id=client_id,
-            campaign_id=camp.id,
-            recipient_phone_number=recipient_phone,
-            sender_phone_number_id=client_profile.meta_phone_number_id,
-            message_type="template",
-            direction="outgoing",
-            template_name=template.template_name,
-            message_content_rendered=f"Personalized template {template.template_name} to {recipient_phone} with vars: {recipient_personalization}",
-            status="pending_api_call"
+    camp = Campaign.query.filter_by(id=campaign_id, client_id=client_id).first()
+    if not camp:
+        return jsonify({"message": "Campaign not found or access denied"}), 404
+
+    if camp.status == "PAUSED":
+        result = db.session.execute(
+            update(Campaign)
+            .where(Campaign.id == camp.id, Campaign.status == "PAUSED")
+            .values(status="SENDING", send_heartbeat_at=datetime.utcnow(), failure_reason=None) # Clears a sender-failure pause note
+            .execution_options(synchronize_session=False)
         )
-        db.session.add(log_entry)
-        db.session.commit() # Get ID for log_entry
+        db.session.commit()
+        if result.rowcount != 1:
+            return jsonify({"message": "Campaign status changed, please retry."}), 409
+        campaign_dispatcher.clear_stop(camp.id)
+        campaign_progress.record(camp.id, status="SENDING")
+        # False if the paused worker hasn't finished its last chunk yet; it then simply carries on
+        campaign_dispatcher.enqueue(current_app._get_current_object(), camp.id)
+        db.session.refresh(camp)
+        logger.info(f"Campaign {camp.id} resumed after a pause at recipient {camp.send_cursor}")
+        return jsonify({
+            "message": "Campaign resumed.",
+            "campaign_id": camp.id,
+            "status": camp.status,
+            "send_cursor": camp.send_cursor
+        }), 202
 
-        try:
-            api_response = whatsapp_service.send_template_message(
-                recipient_phone_number=recipient_phone,
-                template_name=template.template_name,
-                language_code=template.language_code,
-                components=components if components else None
-            )
-
-            if api_response and "error" not in api_response and api_response.get("messages"):
-                log_entry.whatsapp_message_id = api_response.get("messages", [{}])[0].get("id")
-                log_entry.status = "sent_to_whatsapp" # Will be updated by webhook later
-                sent_count += 1
-            else:
-                log_entry.status = "failed_on_send"
-                error_details = api_response.get("error", {}) if api_response else {}
-                log_entry.failure_reason = error_details.get("message", str(api_response.get("details", "Unknown API error")))
-                failed_count += 1
-            db.session.add(log_entry)
-            db.session.commit()
-        except Exception as e_send:
-            logger.error(f"Exception sending message to {recipient_phone} in campaign {camp.id}: {str(e_send)}")
-            log_entry.status = "failed_internal_error_on_send"
-            log_entry.failure_reason = str(e_send)
-            failed_count += 1
-            db.session.add(log_entry)
-            db.session.commit()
-        
-        # Optional: add a small delay to avoid hitting rate limits too hard in a simple loop
-        # time.sleep(0.1) # 100ms
+    if camp.status != "SENDING":
+        return jsonify({"message": f"Campaign cannot be resumed in its current status: {camp.status}"}), 400
 
-    camp.messages_sent_count = sent_count
-    camp.messages_failed_count = failed_count # Initial failed count, webhooks might update this
-    camp.status = "COMPLETED" if failed_count == 0 else "PARTIALLY_COMPLETED"
-    if sent_count == 0 and failed_count > 0:
-        camp.status = "FAILED"
-        
+    # Only a campaign whose worker has stopped (crash, redeploy) can be taken over; a live send keeps its heartbeat fresh
+    if not campaign_dispatcher.claim_stalled(camp.id):
+        return jsonify({"message": "Campaign is still being sent.", "campaign_id": camp.id, "status": camp.status}), 409
+
+    campaign_dispatcher.enqueue(current_app._get_current_object(), camp.id)
+    logger.info(f"Campaign {camp.id} resumed from checkpoint {camp.send_cursor}")
+    return jsonify({
+        "message": "Campaign resumed from its last checkpoint.",
+        "campaign_id": camp.id,
+        "status": camp.status,
+        "send_cursor": camp.send_cursor
+    }), 202
+
+@campaigns_bp.route("/<int:campaign_id>/pause", methods=["POST"])
+@token_required
+def pause_campaign(campaign_id):
+    client_id = request.current_user_id
+
+    camp = Campaign.query.filter_by(id=campaign_id, client_id=client_id).first()
+    if not camp:
+        return jsonify({"message": "Campaign not found or access denied"}), 404
+
+    result = db.session.execute(
+        update(Campaign)
+        .where(Campaign.id == camp.id, Campaign.status == "SENDING")
+        .values(status="PAUSED")
+        .execution_options(synchronize_session=False)
+    )
     db.session.commit()
+    if result.rowcount != 1:
+        return jsonify({"message": f"Campaign cannot be paused in its current status: {camp.status}"}), 400
+
+    # The send loop stops after the chunk in flight; scheduled retries are held until the campaign is resumed
+    campaign_dispatcher.request_stop(camp.id, "PAUSED")
+    campaign_progress.record(camp.id, status="PAUSED")
+    db.session.refresh(camp)
+    logger.info(f"Campaign {camp.id} paused at recipient {camp.send_cursor}")
+    return jsonify({
+        "message": "Campaign paused. Messages already handed to WhatsApp are not recalled.",
+        "campaign_id": camp.id,
+        "status": camp.status,
+        "send_cursor": camp.send_cursor,
+        "messages_sent_count": camp.messages_sent_count,
+        "messages_failed_count": camp.messages_failed_count
+    }), 202
 
-    logger.info(f"Campaign {camp.id} processing finished. Sent: {sent_count}, Failed: {failed_count}")
+@campaigns_bp.route("/<int:campaign_id>/cancel", methods=["POST"])
+@token_required
+def cancel_campaign(campaign_id):
+    client_id = request.current_user_id
+
+    camp = Campaign.query.filter_by(id=campaign_id, client_id=client_id).first()
+    if not camp:
+        return jsonify({"message": "Campaign not found or access denied"}), 404
+
+    cancellable_statuses = ["SENDING", "PAUSED", "SCHEDULED", "PENDING_SEND", "DRAFT"]
+    try:
+        result = db.session.execute(
+            update(Campaign)
+            .where(Campaign.id == camp.id, Campaign.status.in_(cancellable_statuses))
+            .values(status="CANCELLED")
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            return jsonify({"message": f"Campaign cannot be cancelled in its current status: {camp.status}"}), 400
+        # Recipients never attempted are closed out in one statement; scheduled retries are abandoned by the retry queue
+        skipped = db.session.execute(
+            update(CampaignRecipient)
+            .where(CampaignRecipient.campaign_id == camp.id, CampaignRecipient.state == "pending")
+            .values(state="cancelled")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        # Chunks no instance has leased yet are closed too; only chunks already being sent can still send
+        db.session.execute(
+            update(CampaignChunk)
+            .where(CampaignChunk.campaign_id == camp.id, CampaignChunk.state == "pending")
+            .values(state="cancelled")
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error cancelling campaign {campaign_id}: {str(e)}", exc_info=True)
+        return jsonify({"message": "Failed to cancel campaign", "error": str(e)}), 500
+
+    campaign_dispatcher.request_stop(camp.id, "CANCELLED")
+    campaign_progress.record(camp.id, status="CANCELLED")
+    campaign_scheduler.unschedule(camp.id)
+    # Kept while any instance still holds a chunk lease: the worker finishing the last chunk settles and releases it
+    CampaignBilling.settle(camp.id, release=True)
+    db.session.refresh(camp)
+    logger.info(f"Campaign {camp.id} cancelled; {skipped} recipients will not be messaged")
     return jsonify({
-        "message": f"Campaign processing finished. Sent: {sent_count}, Failed: {failed_count}",
+        "message": "Campaign cancelled.",
         "campaign_id": camp.id,
-        "status": camp.status
+        "status": camp.status,
+        "recipients_skipped": skipped,
+        "messages_sent_count": camp.messages_sent_count,
+        "messages_failed_count": camp.messages_failed_count
     }), 200
 
 # Remember to register this blueprint in main.py
-
@@ -1,12 +1,17 @@
 # backend/src/routes/messaging.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from sqlalchemy import desc
 from ..models.user import User, ClientProfile, db # Assuming db is accessible
 from ..models.message_log import MessageLog # Import MessageLog model
-from ..services.whatsapp_service import WhatsAppService
+from ..services.whatsapp_service import whatsapp_services
+from ..services.suppression_service import suppression_index # Opted-out numbers are never messaged
+from ..services.sender_health import sender_circuit_breaker
+from ..services.idempotency_service import idempotency_store, request_fingerprint, IDEMPOTENCY_KEY_MAX_LENGTH
+from ..services.send_results import RETRYABLE_HTTP_STATUSES
 from ..routes.auth import SECRET_KEY # For token decoding to identify the user
 from ..routes.meta_integration import token_required # Re-use the token_required decorator
+from functools import wraps
 import jwt # PyJWT library
 import logging
 
@@ -14,8 +19,58 @@ logger = logging.getLogger(__name__)
 
 messaging_bp = Blueprint("messaging_bp", __name__, url_prefix="/api/v1/messages")
 
+def idempotent(f):
+    """
+    Honours an optional Idempotency-Key header: a retry with the same key and body gets the original response
+    (marked with "Idempotent-Replayed: true") instead of sending the message again. Responses with a retryable
+    status (429, 5xx) are not stored, so retrying those sends again; a send that got no response (202, it may
+    have been delivered) is stored, so it is never sent twice. Must be applied below token_required.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key", "").strip()
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify({"message": f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters"}), 400
+
+        client_id = request.current_user_id
+        fingerprint = request_fingerprint(request.path, request.get_data())
+        try:
+            outcome, status, body = idempotency_store.begin(client_id, key, fingerprint)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error checking Idempotency-Key for client {client_id}: {str(e)}")
+            return jsonify({"message": "Could not check the Idempotency-Key, please retry", "error": str(e)}), 503
+        if outcome == "replay":
+            response = current_app.response_class(body, status=status, mimetype="application/json")
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+        if outcome == "in_progress":
+            return jsonify({"message": "A request with this Idempotency-Key is still being processed"}), 409
+        if outcome == "mismatch":
+            return jsonify({"message": "This Idempotency-Key was already used for a different request"}), 422
+
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            idempotency_store.release(client_id, key)
+            raise
+        try:
+            if response.status_code in RETRYABLE_HTTP_STATUSES:
+                idempotency_store.release(client_id, key)
+            else:
+                idempotency_store.complete(client_id, key, fingerprint, response.status_code, response.get_data(as_text=True))
+        except Exception as e:
+            # The key stays "in_progress": retries get a 409 rather than a second message
+            db.session.rollback()
+            logger.error(f"Error storing the response for Idempotency-Key of client {client_id}: {str(e)}")
+        return response
+    return decorated
+
 @messaging_bp.route("/send-template", methods=["POST"])
 @token_required # Ensures the user is authenticated and client_profile is available on request
+@idempotent
 def send_template_message_route():
     data = request.get_json()
     if not data:
@@ -34,10 +89,22 @@ def send_template_message_route():
     if not client_profile.meta_access_token_encrypted or not client_profile.meta_phone_number_id:
         return jsonify({"message": "Meta API credentials not configured for this client."}), 400
 
+    if suppression_index.is_suppressed(client_profile.user_id, recipient_phone_number):
+        return jsonify({"message": "Recipient has opted out of messages from this client."}), 403
+
+    if sender_circuit_breaker.is_open(client_profile.meta_phone_number_id):
+        health = sender_circuit_breaker.health(client_profile.meta_phone_number_id)
+        return jsonify({"message": "Sending is paused for this number after repeated sender-level failures (authorization or account errors, or the Graph API being unreachable or failing).",
+                        "sender_health": health}), 503
+
     access_token = client_profile.meta_access_token_encrypted 
     phone_number_id = client_profile.meta_phone_number_id
 
-    whatsapp_service = WhatsAppService(access_token=access_token, phone_number_id=phone_number_id)
+    whatsapp_service = whatsapp_services.get(
+        access_token=access_token,
+        phone_number_id=phone_number_id,
+        messages_per_second=client_profile.meta_messages_per_second
+    )
     
     # Create a preliminary message log entry for outgoing message
     log_entry = MessageLog(
@@ -60,7 +127,7 @@ def send_template_message_route():
         # Decide if we should still attempt to send or return error
 
     try:
-        logger.info(f"Attempting to send template message 	{template_name}	 to {recipient_phone_number} for client ID {client_profile.user_id}")
+        logger.debug("Attempting to send template message '%s' to %s for client ID %s", template_name, recipient_phone_number, client_profile.user_id)
         response = whatsapp_service.send_template_message(
             recipient_phone_number=recipient_phone_number,
             template_name=template_name,
@@ -72,16 +139,28 @@ def send_template_message_route():
             whatsapp_msg_id = response.get("messages", [{}])[0].get("id")
             log_entry.whatsapp_message_id = whatsapp_msg_id
             log_entry.status = "sent_to_whatsapp" # Or a status indicating it was accepted by WhatsApp API
-            logger.info(f"Template message sent successfully via service. API Response: {response}")
+            logger.debug("Template message sent successfully via service. API Response: %s", response)
             db.session.add(log_entry)
             db.session.commit()
             return jsonify({"message": "Template message sent successfully", "api_response": response, "log_id": log_entry.id}), 200
+        elif response and response.get("delivery_unknown"):
+            # Meta may have accepted it: not reported as failed (a retry could send it twice); its status webhook settles it
+            log_entry.status = "send_unknown"
+            log_entry.failure_reason = response.get("details")
+            db.session.add(log_entry)
+            db.session.commit()
+            logger.warning("No response to the template message sent to %s for client ID %s", recipient_phone_number, client_profile.user_id)
+            return jsonify({
+                "message": "No response from WhatsApp: the message may have been sent. It is not retried; its status is updated when WhatsApp reports it.",
+                "delivery_unknown": True,
+                "log_id": log_entry.id
+            }), 202
         else:
             log_entry.status = "failed_to_send"
             log_entry.failure_reason = response.get("error", {}).get("message") if response and response.get("error") else response.get("details", "Unknown error from WhatsApp service")
             db.session.add(log_entry)
             db.session.commit()
-            logger.error(f"Failed to send template message via service. Error: {log_entry.failure_reason}")
+            logger.error("Failed to send template message via service. Error: %s", log_entry.failure_reason)
             return jsonify({
                 "message": "Failed to send template message", 
                 "error_details": log_entry.failure_reason,
@@ -98,6 +177,7 @@ def send_template_message_route():
 
 @messaging_bp.route("/send-text", methods=["POST"])
 @token_required
+@idempotent
 def send_text_message_route():
     data = request.get_json()
     if not data:
@@ -115,10 +195,22 @@ def send_text_message_route():
     if not client_profile.meta_access_token_encrypted or not client_profile.meta_phone_number_id:
         return jsonify({"message": "Meta API credentials not configured for this client."}), 400
 
+    if suppression_index.is_suppressed(client_profile.user_id, recipient_phone_number):
+        return jsonify({"message": "Recipient has opted out of messages from this client."}), 403
+
+    if sender_circuit_breaker.is_open(client_profile.meta_phone_number_id):
+        health = sender_circuit_breaker.health(client_profile.meta_phone_number_id)
+        return jsonify({"message": "Sending is paused for this number after repeated sender-level failures (authorization or account errors, or the Graph API being unreachable or failing).",
+                        "sender_health": health}), 503
+
     access_token = client_profile.meta_access_token_encrypted
     phone_number_id = client_profile.meta_phone_number_id
 
-    whatsapp_service = WhatsAppService(access_token=access_token, phone_number_id=phone_number_id)
+    whatsapp_service = whatsapp_services.get(
+        access_token=access_token,
+        phone_number_id=phone_number_id,
+        messages_per_second=client_profile.meta_messages_per_second
+    )
     
     log_entry = MessageLog(
         client_id=client_profile.user_id,
@@ -137,7 +229,7 @@ def send_text_message_route():
         logger.error(f"Error creating initial MessageLog for outgoing text: {str(e)}")
 
     try:
-        logger.info(f"Attempting to send text message to {recipient_phone_number} for client ID {client_profile.user_id}")
+        logger.debug("Attempting to send text message to %s for client ID %s", recipient_phone_number, client_profile.user_id)
         response = whatsapp_service.send_text_message(
             recipient_phone_number=recipient_phone_number,
             message_text=message_text,
@@ -150,14 +242,26 @@ def send_text_message_route():
             log_entry.status = "sent_to_whatsapp"
             db.session.add(log_entry)
             db.session.commit()
-            logger.info(f"Text message sent successfully via service. API Response: {response}")
+            logger.debug("Text message sent successfully via service. API Response: %s", response)
             return jsonify({"message": "Text message sent successfully", "api_response": response, "log_id": log_entry.id}), 200
+        elif response and response.get("delivery_unknown"):
+            # Meta may have accepted it: not reported as failed (a retry could send it twice); its status webhook settles it
+            log_entry.status = "send_unknown"
+            log_entry.failure_reason = response.get("details")
+            db.session.add(log_entry)
+            db.session.commit()
+            logger.warning("No response to the text message sent to %s for client ID %s", recipient_phone_number, client_profile.user_id)
+            return jsonify({
+                "message": "No response from WhatsApp: the message may have been sent. It is not retried; its status is updated when WhatsApp reports it.",
+                "delivery_unknown": True,
+                "log_id": log_entry.id
+            }), 202
         else:
             log_entry.status = "failed_to_send"
             log_entry.failure_reason = response.get("error", {}).get("message") if response and response.get("error") else response.get("details", "Unknown error from WhatsApp service")
             db.session.add(log_entry)
             db.session.commit()
-            logger.error(f"Failed to send text message via service. Error: {log_entry.failure_reason}")
+            logger.error("Failed to send text message via service. Error: %s", log_entry.failure_reason)
             return jsonify({
                 "message": "Failed to send text message", 
                 "error_details": log_entry.failure_reason,
@@ -1,15 +1,24 @@
 # backend/src/routes/meta_integration.py
 
-from flask import Blueprint, request, jsonify
-from ..models.user import User, ClientProfile, db
-from ..models.message_log import MessageLog # Import MessageLog model
+from flask import Blueprint, request, jsonify, current_app
+from ..models.user import User, db
+from ..services.whatsapp_service import whatsapp_services
+from ..services.sender_health import sender_circuit_breaker
+from ..services.media_cache import media_cache
+from ..services.webhook_queue import webhook_queue
+from ..logging_config import RateLimitedLog
 from ..routes.auth import SECRET_KEY # For token decoding to identify the user
 import jwt # PyJWT library
-import json
+import hashlib
 import logging
-from datetime import datetime
+import hmac
+import os
 
 logger = logging.getLogger(__name__)
+webhook_warnings = RateLimitedLog(logger)
+
+# When set, webhook POSTs must carry Meta's X-Hub-Signature-256 (HMAC-SHA256 of the body with the app secret)
+META_APP_SECRET = os.getenv("META_APP_SECRET")
 
 # In a real application, use a proper encryption library like Fernet from cryptography
 # For now, this is a placeholder for where encryption/decryption would occur.
@@ -57,18 +66,37 @@ def manage_meta_credentials():
     access_token = data.get("access_token")
     phone_number_id = data.get("phone_number_id")
     waba_id = data.get("waba_id")
+    messages_per_second = data.get("messages_per_second") # Optional: the number's Meta throughput tier
 
     if not access_token or not phone_number_id or not waba_id:
         return jsonify({"message": "Missing one or more required credentials: access_token, phone_number_id, waba_id"}), 400
 
+    if messages_per_second is not None:
+        try:
+            messages_per_second = int(messages_per_second)
+            if messages_per_second <= 0:
+                raise ValueError()
+        except (TypeError, ValueError):
+            return jsonify({"message": "messages_per_second must be a positive integer"}), 400
+
     client_profile = request.current_client_profile
 
     try:
+        previous_phone_number_id = client_profile.meta_phone_number_id
         client_profile.meta_access_token_encrypted = access_token 
         client_profile.meta_phone_number_id = phone_number_id
         client_profile.meta_waba_id = waba_id
+        if "messages_per_second" in data:
+            client_profile.meta_messages_per_second = messages_per_second
         
         db.session.commit()
+        # Pooled service instances still carry the old token; the next send builds one with the new credentials
+        whatsapp_services.invalidate(previous_phone_number_id)
+        whatsapp_services.invalidate(phone_number_id)
+        # New credentials get a fresh start instead of waiting out the open circuit of the old ones
+        sender_circuit_breaker.reset(previous_phone_number_id)
+        sender_circuit_breaker.reset(phone_number_id)
+        media_cache.invalidate(previous_phone_number_id) # Media ids belong to the old number / token
         return jsonify({"message": "Meta API credentials updated successfully."}), 200
     except Exception as e:
         db.session.rollback()
@@ -87,9 +115,19 @@ def get_meta_credentials_status():
     return jsonify({
         "credentials_set": credentials_set,
         "phone_number_id": client_profile.meta_phone_number_id if credentials_set else None,
-        "waba_id": client_profile.meta_waba_id if credentials_set else None
+        "waba_id": client_profile.meta_waba_id if credentials_set else None,
+        "messages_per_second": client_profile.meta_messages_per_second
     }), 200
 
+@meta_bp.route("/sender-health", methods=["GET"])
+@token_required
+def get_sender_health():
+    """Circuit state of the client's sending number as seen by this instance ("closed" means healthy)."""
+    client_profile = request.current_client_profile
+    if not client_profile.meta_phone_number_id:
+        return jsonify({"message": "Meta API credentials not configured for this client."}), 400
+    return jsonify(sender_circuit_breaker.health(client_profile.meta_phone_number_id)), 200
+
 @meta_bp.route("/webhook", methods=["GET", "POST"])
 def whatsapp_webhook():
     if request.method == "GET":
@@ -105,90 +143,30 @@ def whatsapp_webhook():
             return jsonify({"message": "Invalid verification token or challenge missing"}), 403
 
     elif request.method == "POST":
-        data = request.get_json()
-        logger.info(f"Received WhatsApp Webhook: {json.dumps(data, indent=2)}")
+        # Validate and enqueue only: Meta gets its 200 as soon as the raw body is stored, and the
+        # webhook_queue consumers apply status updates and incoming messages in the background.
+        raw_body = request.get_data()
+        if META_APP_SECRET:
+            expected_signature = "sha256=" + hmac.new(META_APP_SECRET.encode(), raw_body, hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected_signature, request.headers.get("X-Hub-Signature-256", "")):
+                webhook_warnings.warning("bad_signature", "Rejected WhatsApp webhook with a missing or invalid signature")
+                return jsonify({"message": "Invalid signature"}), 403
+
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"message": "Invalid JSON payload"}), 400
+        if data.get("object") != "whatsapp_business_account":
+            return jsonify({"status": "ignored"}), 200
 
         try:
-            if data.get("object") == "whatsapp_business_account":
-                for entry in data.get("entry", []):
-                    for change in entry.get("changes", []):
-                        value = change.get("value", {})
-                        metadata = value.get("metadata", {})
-                        
-                        # Determine client_id based on WABA ID or phone_number_id
-                        # This part needs careful implementation to map webhook to your internal client_id
-                        # Assuming metadata.phone_number_id is the recipient of the webhook (i.e., your app's WABA phone number)
-                        client_waba_id = entry.get("id") # This is the WABA ID
-                        client_profile = ClientProfile.query.filter_by(meta_waba_id=client_waba_id).first()
-                        if not client_profile:
-                            logger.warning(f"No client profile found for WABA ID: {client_waba_id}. Skipping webhook processing.")
-                            continue
-                        
-                        client_id = client_profile.user_id
-                        sender_phone_number_id_from_meta = metadata.get("phone_number_id") # This is the app's sending number ID
-
-                        # Handle message status updates
-                        if value.get("statuses"):
-                            for status_update in value.get("statuses", []):
-                                whatsapp_msg_id = status_update.get("id")
-                                status = status_update.get("status")
-                                timestamp = datetime.fromtimestamp(int(status_update.get("timestamp")))
-                                
-                                msg_log = MessageLog.query.filter_by(whatsapp_message_id=whatsapp_msg_id, client_id=client_id).first()
-                                if msg_log:
-                                    msg_log.status = status
-                                    msg_log.status_updated_at = datetime.utcnow()
-                                    if status == "sent":
-                                        msg_log.sent_at = timestamp
-                                    elif status == "delivered":
-                                        msg_log.delivered_at = timestamp
-                                    elif status == "read":
-                                        msg_log.read_at = timestamp
-                                    elif status == "failed":
-                                        msg_log.failure_reason = status_update.get("errors", [{}])[0].get("title", "Unknown error")
-                                    db.session.add(msg_log)
-                                else:
-                                    logger.warning(f"MessageLog not found for status update. WhatsApp ID: {whatsapp_msg_id}, Client ID: {client_id}")
-                        
-                        # Handle incoming messages
-                        if value.get("messages"):
-                            for message_data in value.get("messages", []):
-                                incoming_msg_id = message_data.get("id")
-                                from_phone = message_data.get("from")
-                                timestamp = datetime.fromtimestamp(int(message_data.get("timestamp")))
-                                msg_type = message_data.get("type")
-                                content = None
-
-                                if msg_type == "text":
-                                    content = message_data.get("text", {}).get("body")
-                                elif msg_type == "image":
-                                    content = f"Image received (ID: {message_data.get('image',{}).get('id')})" # Store ID or caption
-                                # Add more types as needed (audio, video, document, location, contacts, interactive)
-                                else:
-                                    content = f"Unsupported message type: {msg_type}"
-
-                                if content:
-                                    new_log = MessageLog(
-                                        client_id=client_id,
-                                        whatsapp_message_id=incoming_msg_id,
-                                        recipient_phone_number=sender_phone_number_id_from_meta, # The app's number received the message
-                                        sender_phone_number_id=from_phone, # The user who sent the message
-                                        message_type=f"incoming_{msg_type}",
-                                        direction="incoming",
-                                        incoming_message_content=content,
-                                        status="received", # Or map to a specific incoming status
-                                        created_at=timestamp, # Use WhatsApp timestamp for creation
-                                        status_updated_at=datetime.utcnow()
-                                    )
-                                    db.session.add(new_log)
-                                    logger.info(f"Logged incoming message from {from_phone} for client ID {client_id}")
-            db.session.commit()
+            webhook_queue.append(raw_body.decode("utf-8"))
         except Exception as e:
             db.session.rollback()
-            logger.error(f"Error processing WhatsApp webhook: {str(e)}", exc_info=True)
-            # Still return 200 to Meta, as they will retry if they don't get it.
-            # Log the error for debugging.
-        
+            logger.error(f"Could not enqueue WhatsApp webhook: {str(e)}", exc_info=True)
+            # Not stored: let Meta retry it
+            return jsonify({"message": "Webhook could not be stored"}), 500
+        webhook_queue.start(current_app._get_current_object())
+
         return jsonify({"status": "success"}), 200
 
     return jsonify({"message": "Method not allowed"}), 405
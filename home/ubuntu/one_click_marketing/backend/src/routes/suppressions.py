@@ -0,0 +1,91 @@
+# backend/src/routes/suppressions.py
+
+from flask import Blueprint, request, jsonify
+from sqlalchemy import desc
+from ..models.user import db
+from ..models.suppressed_number import SuppressedNumber
+from ..services.audience_service import normalize_phone_number
+from ..services.suppression_service import suppression_index
+from ..routes.meta_integration import token_required
+import logging
+
+logger = logging.getLogger(__name__)
+
+suppressions_bp = Blueprint("suppressions_bp", __name__, url_prefix="/api/v1/suppressions")
+
+# Numbers accepted per POST / DELETE request
+MAX_SUPPRESSION_BATCH = 10000
+
+@suppressions_bp.route("", methods=["GET"])
+@token_required
+def get_suppressed_numbers():
+    client_id = request.current_user_id
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get("per_page", 50, type=int)
+    phone_number = request.args.get("phone_number")
+
+    try:
+        query = SuppressedNumber.query.filter_by(client_id=client_id)
+        if phone_number:
+            query = query.filter_by(phone_number=normalize_phone_number(phone_number) or phone_number)
+        paginated = query.order_by(desc(SuppressedNumber.created_at)).paginate(page=page, per_page=per_page, error_out=False)
+        return jsonify({
+            "suppressed_numbers": [{
+                "phone_number": entry.phone_number,
+                "reason": entry.reason,
+                "notes": entry.notes,
+                "created_at": entry.created_at.isoformat()
+            } for entry in paginated.items],
+            "total": paginated.total,
+            "current_page": paginated.page,
+            "total_pages": paginated.pages,
+            "per_page": paginated.per_page
+        }), 200
+    except Exception as e:
+        logger.error(f"Error fetching suppressed numbers for client {client_id}: {str(e)}")
+        return jsonify({"message": "Failed to retrieve suppressed numbers", "error": str(e)}), 500
+
+def _phone_numbers_from_request():
+    data = request.get_json(silent=True) or {}
+    phone_numbers = data.get("phone_numbers")
+    if not isinstance(phone_numbers, list) or not phone_numbers:
+        return None, data
+    return [str(phone) for phone in phone_numbers], data
+
+@suppressions_bp.route("", methods=["POST"])
+@token_required
+def add_suppressed_numbers():
+    client_id = request.current_user_id
+    phone_numbers, data = _phone_numbers_from_request()
+    if phone_numbers is None:
+        return jsonify({"message": "phone_numbers must be a non-empty list"}), 400
+    if len(phone_numbers) > MAX_SUPPRESSION_BATCH:
+        return jsonify({"message": f"At most {MAX_SUPPRESSION_BATCH} phone numbers per request"}), 400
+
+    try:
+        added, invalid = suppression_index.add(client_id, phone_numbers, reason="manual", notes=data.get("notes"))
+        logger.info(f"Client {client_id} suppressed {len(added)} numbers")
+        return jsonify({"message": "Numbers suppressed.", "added": len(added), "invalid_numbers": invalid}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error adding suppressed numbers for client {client_id}: {str(e)}", exc_info=True)
+        return jsonify({"message": "Failed to suppress numbers", "error": str(e)}), 500
+
+@suppressions_bp.route("", methods=["DELETE"])
+@token_required
+def remove_suppressed_numbers():
+    client_id = request.current_user_id
+    phone_numbers, _ = _phone_numbers_from_request()
+    if phone_numbers is None:
+        return jsonify({"message": "phone_numbers must be a non-empty list"}), 400
+    if len(phone_numbers) > MAX_SUPPRESSION_BATCH:
+        return jsonify({"message": f"At most {MAX_SUPPRESSION_BATCH} phone numbers per request"}), 400
+
+    try:
+        removed = suppression_index.remove(client_id, phone_numbers)
+        logger.info(f"Client {client_id} removed {removed} numbers from their suppression list")
+        return jsonify({"message": "Numbers removed from the suppression list.", "removed": removed}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error removing suppressed numbers for client {client_id}: {str(e)}", exc_info=True)
+        return jsonify({"message": "Failed to remove suppressed numbers", "error": str(e)}), 500
@@ -0,0 +1,368 @@
+# backend/src/services/audience_service.py
+
+from sqlalchemy import insert, select, delete, func, update as update_stmt
+from ..models.user import db
+from ..models.campaign import Campaign
+from ..models.campaign_recipient import CampaignRecipient
+import logging
+import json
+import csv
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Rows per executemany when writing campaign_recipients
+RECIPIENT_WRITE_CHUNK_SIZE = int(os.getenv("RECIPIENT_WRITE_CHUNK_SIZE", "1000"))
+
+# Column / key names accepted as the phone number in uploaded audience files
+PHONE_FIELD_NAMES = ("phone", "phone_number", "recipient_phone_number", "msisdn")
+
+# Rejected rows are counted in full, but only this many are echoed back in the upload report
+MAX_REJECTED_SAMPLES = 100
+
+# Recipients normalized per chunk by the pre-send pass
+AUDIENCE_NORMALIZE_CHUNK_SIZE = int(os.getenv("AUDIENCE_NORMALIZE_CHUNK_SIZE", "5000"))
+
+# Country calling code (digits only, e.g. "44") used for national numbers written with a leading trunk "0".
+# Without it such numbers are rejected, as the country can't be inferred.
+AUDIENCE_DEFAULT_COUNTRY_CODE = os.getenv("AUDIENCE_DEFAULT_COUNTRY_CODE", "").lstrip("+")
+
+PHONE_SEPARATORS = str.maketrans("", "", " -.()/\t\u00a0")
+E164_DIGITS_RE = re.compile(r"[1-9]\d{7,14}") # Country code + subscriber number, 8 to 15 digits
+
+
+def normalize_phone_number(raw):
+    """
+    Normalizes a phone number to E.164 ("+<country code><number>").
+    Separators are dropped and a "00" international prefix is treated like "+".
+    Returns:
+        str: The E.164 number, or None if the input can't be one.
+    """
+    number = str(raw).strip().translate(PHONE_SEPARATORS)
+    if number.startswith("+"):
+        number = number[1:]
+    elif number.startswith("00"):
+        number = number[2:]
+    elif number.startswith("0") and AUDIENCE_DEFAULT_COUNTRY_CODE:
+        number = AUDIENCE_DEFAULT_COUNTRY_CODE + number[1:]
+    return "+" + number if E164_DIGITS_RE.fullmatch(number) else None
+
+
+class AudienceUploadReport:
+    """Running counters for a streamed audience upload."""
+
+    def __init__(self):
+        self.rows_received = 0
+        self.rows_accepted = 0
+        self.rows_rejected = 0
+        self.rejected_samples = []
+
+    def reject(self, line_number, reason):
+        self.rows_rejected += 1
+        if len(self.rejected_samples) < MAX_REJECTED_SAMPLES:
+            self.rejected_samples.append({"line": line_number, "reason": reason})
+
+    def to_dict(self):
+        return {
+            "rows_received": self.rows_received,
+            "rows_accepted": self.rows_accepted,
+            "rows_rejected": self.rows_rejected,
+            "rejected_samples": self.rejected_samples
+        }
+
+class AudienceService:
+
+    @staticmethod
+    def add_recipients(campaign_id: int, recipients, commit_each_chunk: bool = False):
+        """
+        Bulk-inserts recipients for a campaign.
+        Args:
+            campaign_id (int): The campaign the recipients belong to.
+            recipients (iterable): (phone_number, variables_dict) pairs. Consumed lazily, so a generator keeps memory flat.
+            commit_each_chunk (bool): Commit after every executemany instead of leaving the transaction open,
+                                      so very large uploads don't build one huge transaction.
+        Returns:
+            int: Number of recipients written.
+        """
+        written = 0
+        rows = []
+        for phone_number, variables in recipients:
+            rows.append({
+                "campaign_id": campaign_id,
+                "phone_number": str(phone_number),
+                "variables_json": json.dumps(variables) if variables else None,
+                "state": "pending"
+            })
+            if len(rows) >= RECIPIENT_WRITE_CHUNK_SIZE:
+                db.session.execute(insert(CampaignRecipient), rows)
+                written += len(rows)
+                rows = []
+                if commit_each_chunk:
+                    db.session.commit()
+        if rows:
+            db.session.execute(insert(CampaignRecipient), rows)
+            written += len(rows)
+            if commit_each_chunk:
+                db.session.commit()
+        return written
+
+    @staticmethod
+    def replace_recipients(campaign: Campaign, audience_list: list, personalization_map: dict = None):
+        """Replaces a campaign's audience and updates total_recipients. Does not commit."""
+        personalization_map = personalization_map or {}
+        db.session.execute(delete(CampaignRecipient).where(CampaignRecipient.campaign_id == campaign.id))
+        campaign.total_recipients = AudienceService.add_recipients(
+            campaign.id,
+            ((phone, personalization_map.get(str(phone), {})) for phone in audience_list) # Ensure phone is string key
+        )
+        return campaign.total_recipients
+
+    @staticmethod
+    def update_personalization(campaign_id: int, personalization_map: dict):
+        """Re-applies personalization variables to a campaign's existing recipients. Does not commit."""
+        last_id = 0
+        while True:
+            chunk = db.session.execute(
+                select(CampaignRecipient.id, CampaignRecipient.phone_number)
+                .where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.id > last_id)
+                .order_by(CampaignRecipient.id)
+                .limit(RECIPIENT_WRITE_CHUNK_SIZE)
+            ).all()
+            if not chunk:
+                break
+            db.session.execute(update_stmt(CampaignRecipient), [{
+                "id": recipient_id,
+                "variables_json": json.dumps(personalization_map[phone]) if personalization_map.get(phone) else None
+            } for recipient_id, phone in chunk])
+            last_id = chunk[-1][0]
+
+    @staticmethod
+    def iter_recipient_chunks(campaign_id: int, after_id: int = 0, chunk_size: int = RECIPIENT_WRITE_CHUNK_SIZE, state: str = "pending"):
+        """
+        Yields lists of (id, phone_number, variables_json) rows in id order, `chunk_size` at a time
+        (keyset pagination). Only one chunk is held in memory, whatever the size of the campaign.
+        """
+        last_id = after_id or 0
+        while True:
+            chunk = db.session.execute(
+                select(CampaignRecipient.id, CampaignRecipient.phone_number, CampaignRecipient.variables_json)
+                .where(
+                    CampaignRecipient.campaign_id == campaign_id,
+                    CampaignRecipient.state == state,
+                    CampaignRecipient.id > last_id
+                )
+                .order_by(CampaignRecipient.id)
+                .limit(chunk_size)
+            ).all()
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1].id
+
+    @staticmethod
+    def iter_chunk_ranges(campaign_id: int, after_id: int = 0, chunk_size: int = RECIPIENT_WRITE_CHUNK_SIZE, state: str = "pending"):
+        """
+        Yields (first_id, last_id) bounds of consecutive runs of `chunk_size` recipients in the given state.
+        Each step reads two ids from the (campaign_id, state) index; the rows in between are never fetched.
+        """
+        last_id = after_id or 0
+        base = select(CampaignRecipient.id).where(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.state == state)
+        while True:
+            first_id = db.session.execute(
+                base.where(CampaignRecipient.id > last_id).order_by(CampaignRecipient.id).limit(1)
+            ).scalar()
+            if first_id is None:
+                return
+            chunk_last_id = db.session.execute(
+                base.where(CampaignRecipient.id >= first_id).order_by(CampaignRecipient.id).offset(chunk_size - 1).limit(1)
+            ).scalar()
+            if chunk_last_id is None: # Final, partial run
+                chunk_last_id = db.session.execute(select(func.max(CampaignRecipient.id)).where(
+                    CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.state == state)).scalar()
+            yield first_id, chunk_last_id
+            last_id = chunk_last_id
+
+    @staticmethod
+    def get_recipients_in_range(campaign_id: int, first_id: int, last_id: int, state: str = "pending"):
+        """Returns the (id, phone_number, variables_json) rows with ids in [first_id, last_id] in the given state, in id order."""
+        return db.session.execute(
+            select(CampaignRecipient.id, CampaignRecipient.phone_number, CampaignRecipient.variables_json)
+            .where(
+                CampaignRecipient.campaign_id == campaign_id,
+                CampaignRecipient.state == state,
+                CampaignRecipient.id.between(first_id, last_id)
+            )
+            .order_by(CampaignRecipient.id)
+        ).all()
+
+    @staticmethod
+    def count_recipients(campaign_id: int) -> int:
+        return db.session.query(func.count(CampaignRecipient.id)).filter(CampaignRecipient.campaign_id == campaign_id).scalar() or 0
+
+    @staticmethod
+    def prepare_audience(campaign: Campaign, is_suppressed=None):
+        """
+        Pre-send pass over a campaign's pending recipients: normalizes phone numbers to E.164, marks
+        unparseable ones as "invalid", numbers for which `is_suppressed(e164_number)` is true as
+        "suppressed", and all but the first occurrence of each number as "duplicate".
+        Sets campaign.total_recipients to the number of recipients left to send and stores the drop report
+        on campaign.audience_report_json. Commits after every chunk; safe to re-run after an interruption.
+        Returns:
+            dict: The drop report.
+        """
+        normalized_count = 0
+        invalid_samples = []
+        last_id = 0
+        while True:
+            chunk = db.session.execute(
+                select(CampaignRecipient.id, CampaignRecipient.phone_number)
+                .where(
+                    CampaignRecipient.campaign_id == campaign.id,
+                    CampaignRecipient.state == "pending",
+                    CampaignRecipient.id > last_id
+                )
+                .order_by(CampaignRecipient.id)
+                .limit(AUDIENCE_NORMALIZE_CHUNK_SIZE)
+            ).all()
+            if not chunk:
+                break
+            renamed = []
+            dropped = []
+            for recipient_id, phone_number in chunk:
+                normalized = normalize_phone_number(phone_number)
+                if normalized is None:
+                    dropped.append({"id": recipient_id, "state": "invalid"})
+                    if len(invalid_samples) < MAX_REJECTED_SAMPLES:
+                        invalid_samples.append(phone_number)
+                    continue
+                if normalized != phone_number:
+                    renamed.append({"id": recipient_id, "phone_number": normalized})
+                if is_suppressed and is_suppressed(normalized):
+                    dropped.append({"id": recipient_id, "state": "suppressed"})
+            if renamed:
+                db.session.execute(update_stmt(CampaignRecipient), renamed)
+            if dropped:
+                db.session.execute(update_stmt(CampaignRecipient), dropped)
+            db.session.commit()
+            normalized_count += len(renamed)
+            last_id = chunk[-1].id
+
+        # Deduplicate in the database with one set-based UPDATE: keep the lowest id per number.
+        # The ids to keep are read through a derived table, which MySQL allows in an UPDATE of the same table.
+        first_ids = (
+            select(func.min(CampaignRecipient.id).label("recipient_id"))
+            .where(CampaignRecipient.campaign_id == campaign.id, CampaignRecipient.state == "pending")
+            .group_by(CampaignRecipient.phone_number)
+            .subquery()
+        )
+        db.session.execute(
+            update_stmt(CampaignRecipient)
+            .where(
+                CampaignRecipient.campaign_id == campaign.id,
+                CampaignRecipient.state == "pending",
+                CampaignRecipient.id.not_in(select(first_ids.c.recipient_id))
+            )
+            .values(state="duplicate")
+            .execution_options(synchronize_session=False)
+        )
+
+        counts = dict(db.session.execute(
+            select(CampaignRecipient.state, func.count(CampaignRecipient.id))
+            .where(CampaignRecipient.campaign_id == campaign.id)
+            .group_by(CampaignRecipient.state)
+        ).all())
+        report = {
+            "recipients_received": sum(counts.values()),
+            "numbers_normalized": normalized_count,
+            "invalid_dropped": counts.get("invalid", 0),
+            "duplicates_dropped": counts.get("duplicate", 0),
+            "suppressed_dropped": counts.get("suppressed", 0),
+            "recipients_to_send": counts.get("pending", 0),
+            "invalid_samples": invalid_samples
+        }
+        campaign.total_recipients = report["recipients_to_send"]
+        campaign.audience_report_json = json.dumps(report)
+        db.session.commit()
+        logger.info(f"Campaign {campaign.id} audience prepared: {report['recipients_to_send']} to send, "
+                    f"{report['invalid_dropped']} invalid, {report['duplicates_dropped']} duplicate and {report['suppressed_dropped']} opted-out dropped")
+        return report
+
+    @staticmethod
+    def migrate_legacy_audience(campaign: Campaign):
+        """
+        Moves audience_json / personalization_data_json of a campaign created before campaign_recipients
+        existed into the recipients table, then clears the blobs. Commits.
+        """
+        if not campaign.audience_json:
+            return
+        if AudienceService.count_recipients(campaign.id) == 0:
+            audience_list = json.loads(campaign.audience_json)
+            personalization_map = json.loads(campaign.personalization_data_json or "{}")
+            AudienceService.replace_recipients(campaign, audience_list, personalization_map)
+            logger.info(f"Migrated {campaign.total_recipients} recipients of campaign {campaign.id} from audience_json")
+        campaign.audience_json = None
+        campaign.personalization_data_json = None
+        db.session.commit()
+
+    @staticmethod
+    def parse_csv_stream(text_stream, report: AudienceUploadReport):
+        """
+        Incrementally parses a CSV audience with a header row. The phone column is one of PHONE_FIELD_NAMES;
+        every other non-empty column becomes a personalization variable.
+        Yields (phone_number, variables_dict) pairs; bad rows are recorded on `report` and skipped.
+        """
+        reader = csv.DictReader(text_stream)
+        if not reader.fieldnames:
+            return
+        field_lookup = {name.strip().lower(): name for name in reader.fieldnames if name}
+        phone_field = next((field_lookup[name] for name in PHONE_FIELD_NAMES if name in field_lookup), None)
+        if phone_field is None:
+            raise ValueError(f"CSV header must contain a phone column (one of: {', '.join(PHONE_FIELD_NAMES)})")
+
+        for row in reader:
+            report.rows_received += 1
+            line_number = reader.line_num
+            if None in row: # More values than header columns
+                report.reject(line_number, "Row has more columns than the header")
+                continue
+            phone_number = (row.pop(phone_field) or "").strip()
+            if not phone_number:
+                report.reject(line_number, "Missing phone number")
+                continue
+            variables = {key.strip(): value for key, value in row.items() if key and value not in (None, "")}
+            report.rows_accepted += 1
+            yield phone_number, variables
+
+    @staticmethod
+    def parse_ndjson_stream(text_stream, report: AudienceUploadReport):
+        """
+        Incrementally parses newline-delimited JSON: one object per line with a phone field (one of
+        PHONE_FIELD_NAMES) and either a "variables" object or the variables as the remaining keys.
+        Yields (phone_number, variables_dict) pairs; bad lines are recorded on `report` and skipped.
+        """
+        for line_number, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                continue
+            report.rows_received += 1
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                report.reject(line_number, f"Invalid JSON: {e.msg}")
+                continue
+            if not isinstance(record, dict):
+                report.reject(line_number, "Line is not a JSON object")
+                continue
+            phone_field = next((name for name in PHONE_FIELD_NAMES if name in record), None)
+            phone_number = str(record.pop(phone_field) or "").strip() if phone_field else ""
+            if not phone_number:
+                report.reject(line_number, "Missing phone number")
+                continue
+            variables = record.pop("variables", None)
+            if variables is None:
+                variables = record
+            elif not isinstance(variables, dict):
+                report.reject(line_number, "\"variables\" must be an object")
+                continue
+            report.rows_accepted += 1
+            yield phone_number, variables
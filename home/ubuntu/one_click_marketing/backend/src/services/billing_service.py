@@ -0,0 +1,144 @@
+# backend/src/services/billing_service.py
+
+from ..models.user import db, ClientProfile
+from ..models.campaign import Campaign
+from ..models.campaign_chunk import CampaignChunk
+from ..models.wallet_transaction import WalletTransaction, TransactionType
+from .reporting_service import ReportingService
+from sqlalchemy import select, func, update as update_stmt
+from datetime import datetime
+import logging
+import decimal
+import os
+
+logger = logging.getLogger(__name__)
+
+# How often a sending campaign converts its sent messages into a CAMPAIGN_COST ledger entry
+BILLING_SETTLE_INTERVAL_SECONDS = int(os.getenv("BILLING_SETTLE_INTERVAL_SECONDS", "30"))
+
+CENT = decimal.Decimal("0.01")
+
+
+def _to_cents(amount, rounding=decimal.ROUND_HALF_UP):
+    return decimal.Decimal(amount).quantize(CENT, rounding=rounding)
+
+
+class CampaignBilling:
+    """
+    Campaign billing with an up-front wallet hold.
+
+    `reserve` holds total_recipients x price on ClientProfile.wallet_reserved_balance in the same transaction
+    that starts the send, refusing it if the available balance (balance - reserved) is too low, so a campaign
+    can never overdraw the wallet mid-flight. `settle` charges the messages sent since the last settlement with
+    one CAMPAIGN_COST ledger entry, moving that amount out of both the balance and the hold; with release=True
+    it also returns whatever is left of the hold. A charge past the hold only takes the available balance, and
+    any shortfall is logged and noted on the ledger entry. Nothing is written per message.
+    """
+
+    @staticmethod
+    def reserve(camp: Campaign):
+        """
+        Places the campaign's hold. Does not commit (the caller commits it together with the SENDING status).
+        Returns:
+            tuple: (bool reserved, Decimal amount required, str currency)
+        """
+        price, currency = ReportingService.get_client_message_price(camp.client_id)
+        amount = _to_cents(decimal.Decimal(price) * (camp.total_recipients or 0), rounding=decimal.ROUND_UP)
+        if amount > 0:
+            result = db.session.execute(
+                update_stmt(ClientProfile)
+                .where(
+                    ClientProfile.user_id == camp.client_id,
+                    ClientProfile.wallet_balance - func.coalesce(ClientProfile.wallet_reserved_balance, 0) >= amount
+                )
+                .values(wallet_reserved_balance=func.coalesce(ClientProfile.wallet_reserved_balance, 0) + amount)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                return False, amount, currency
+        camp.billing_price_per_message = price
+        camp.billing_reserved_amount = amount
+        camp.billing_settled_count = 0
+        logger.info(f"Reserved {amount} {currency} for campaign {camp.id} ({camp.total_recipients} recipients at {price})")
+        return True, amount, currency
+
+    @staticmethod
+    def has_chunk_in_flight(campaign_id: int):
+        """True while an instance holds an unexpired lease on one of the campaign's chunks (it may still send)."""
+        return db.session.execute(
+            select(CampaignChunk.id).where(
+                CampaignChunk.campaign_id == campaign_id,
+                CampaignChunk.state == "leased",
+                CampaignChunk.lease_expires_at >= datetime.utcnow()
+            ).limit(1)
+        ).first() is not None
+
+    @staticmethod
+    def settle(campaign_id: int, release: bool = False, commit: bool = True):
+        """
+        Charges the campaign's sent-but-unbilled messages in one ledger entry and, with release=True,
+        returns the rest of its hold to the wallet, unless a chunk is still being sent. Locks the campaign
+        and client rows, so concurrent and repeated releases return the hold only once.
+        Commits, unless commit=False (the caller commits it together with its own changes).
+        Returns:
+            Decimal: The amount charged by this settlement.
+        """
+        camp = db.session.get(Campaign, campaign_id, with_for_update=True, populate_existing=True)
+        if not camp or camp.billing_price_per_message is None:
+            if commit:
+                db.session.rollback()
+            return decimal.Decimal("0")
+        client_profile = ClientProfile.query.filter_by(user_id=camp.client_id).with_for_update().populate_existing().first()
+        if not client_profile:
+            if commit:
+                db.session.rollback()
+            return decimal.Decimal("0")
+
+        price = decimal.Decimal(camp.billing_price_per_message)
+        sent = camp.messages_sent_count or 0
+        billed = camp.billing_settled_count or 0
+        hold = decimal.Decimal(camp.billing_reserved_amount or 0)
+        reserved_balance = decimal.Decimal(client_profile.wallet_reserved_balance or 0)
+        cost = decimal.Decimal("0")
+        if sent > billed:
+            # Cumulative rounding, so batching never changes the total charged
+            due = _to_cents(price * sent) - _to_cents(price * billed)
+            hold_used = min(due, hold)
+            # Past the hold (late-confirmed sends, a hold already released), only the available balance is
+            # charged, never other campaigns' holds or below zero; the uncharged rest is flagged, not owed
+            wallet_balance = decimal.Decimal(client_profile.wallet_balance)
+            available = max(wallet_balance - reserved_balance, decimal.Decimal("0"))
+            cost = hold_used + min(due - hold_used, available)
+            hold -= hold_used
+            reserved_balance -= hold_used
+            client_profile.wallet_balance = wallet_balance - cost
+            camp.billing_settled_count = sent
+            description = f"Campaign {camp.id}: {sent - billed} messages at {price}"
+            if cost < due:
+                description += f" ({due - cost} over the hold not charged)"
+                logger.warning(
+                    "Campaign %s sent past its billing hold: %s of %s due for %s messages could not be charged",
+                    camp.id, due - cost, due, sent - billed
+                )
+            db.session.add(WalletTransaction(
+                client_id=camp.client_id,
+                campaign_id=camp.id,
+                transaction_type=TransactionType.CAMPAIGN_COST,
+                amount=-cost,
+                currency=client_profile.currency,
+                description=description
+            ))
+        if release and hold > 0 and CampaignBilling.has_chunk_in_flight(campaign_id):
+            # Another instance is still sending a chunk; the hold is released by the settlement after its last chunk
+            logger.info(f"Campaign {camp.id}: hold kept while a chunk is still being sent")
+        elif release and hold > 0:
+            reserved_balance -= hold
+            logger.info(f"Released {hold} unused from the hold of campaign {camp.id}")
+            hold = decimal.Decimal("0")
+        camp.billing_reserved_amount = hold
+        client_profile.wallet_reserved_balance = max(reserved_balance, decimal.Decimal("0"))
+        if commit:
+            db.session.commit()
+        if cost:
+            logger.info(f"Campaign {campaign_id} charged {cost} for {sent - billed} messages")
+        return cost
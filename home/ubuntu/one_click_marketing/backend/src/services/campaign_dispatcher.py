@@ -0,0 +1,700 @@
+# backend/src/services/campaign_dispatcher.py
+
+from ..models.user import ClientProfile, db
+from ..models.campaign import Campaign
+from ..models.message_log import MessageLog
+from ..models.campaign_recipient import CampaignRecipient
+from ..models.campaign_chunk import CampaignChunk
+from .whatsapp_service import whatsapp_services
+from .audience_service import AudienceService
+from .template_renderer import get_compiled_template
+from .send_results import build_send_outcome, finalize_campaign_if_done
+from .retry_queue import retry_queue
+from .suppression_service import suppression_index
+from .billing_service import CampaignBilling, BILLING_SETTLE_INTERVAL_SECONDS
+from .fair_send_queue import FairSendQueue
+from .campaign_progress import campaign_progress
+from .idempotency_service import campaign_message_key
+from .sender_health import sender_circuit_breaker
+from .media_cache import media_cache
+from sqlalchemy import insert, select, delete, func, or_, and_, update as update_stmt
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import threading
+import logging
+import socket
+import json
+import time
+import uuid
+import os
+
+logger = logging.getLogger(__name__)
+
+# Number of chunks this process sends at the same time. Campaigns don't own a dispatch thread: each thread
+# sends one chunk and then takes the next one from the fair send queue, so every active campaign makes progress.
+# Dispatch threads are separate from the gunicorn request threads, so busy campaigns never block the API.
+CAMPAIGN_DISPATCH_WORKERS = int(os.getenv("CAMPAIGN_DISPATCH_WORKERS", "4"))
+
+# Recipients per campaign chunk, handed to WhatsAppService.send_template_batch at a time.
+# Log rows for a chunk are bulk-inserted before its API calls are made and bulk-updated afterwards.
+CAMPAIGN_SEND_BATCH_SIZE = int(os.getenv("CAMPAIGN_SEND_BATCH_SIZE", "500"))
+
+# A SENDING campaign whose heartbeat is older than this is considered abandoned (crash, redeploy)
+# and is resumed from its checkpoint. Must comfortably exceed the time needed to send one chunk.
+CAMPAIGN_STALE_AFTER_SECONDS = int(os.getenv("CAMPAIGN_STALE_AFTER_SECONDS", "300"))
+CAMPAIGN_RECOVERY_INTERVAL_SECONDS = int(os.getenv("CAMPAIGN_RECOVERY_INTERVAL_SECONDS", "60"))
+
+# How long an instance may hold a chunk lease. The lease is renewed right before the chunk's API calls,
+# so this must comfortably exceed the time needed to send one chunk. Expired leases are taken over by any instance.
+CAMPAIGN_CHUNK_LEASE_SECONDS = int(os.getenv("CAMPAIGN_CHUNK_LEASE_SECONDS", "300"))
+
+
+class _CampaignSend:
+    """What the chunks of one campaign send share, kept between its turns in the fair send queue."""
+
+    __slots__ = ("campaign_id", "client_id", "sender_phone_number_id", "template_name", "language_code",
+                 "compiled_template", "whatsapp_service", "settled_at")
+
+    def __init__(self, campaign_id, client_id, sender_phone_number_id, template_name, language_code, compiled_template, whatsapp_service):
+        self.campaign_id = campaign_id
+        self.client_id = client_id
+        self.sender_phone_number_id = sender_phone_number_id
+        self.template_name = template_name
+        self.language_code = language_code
+        self.compiled_template = compiled_template
+        self.whatsapp_service = whatsapp_service
+        self.settled_at = time.monotonic() # Last billing settlement
+
+
+class CampaignDispatcher:
+    """
+    Runs campaign sends in background threads so the HTTP request that triggers a
+    campaign can return immediately.
+
+    The route marks the campaign as SENDING and calls `enqueue`; the campaign then joins the fair send
+    queue, where dispatch threads take it one chunk at a time (interleaved with other clients' campaigns
+    according to their weights) inside their own application context, until it is moved to
+    COMPLETED / PARTIALLY_COMPLETED / FAILED.
+
+    When a send starts, the audience is split into campaign_chunks. A turn leases one chunk with
+    SELECT ... FOR UPDATE SKIP LOCKED, so every instance (and every dispatch thread) that has the campaign
+    queued sends different chunks in parallel. Instances join SENDING campaigns with unleased chunks from the
+    recovery monitor, which also hands chunks whose lease expired (dead instance) to a live one.
+
+    Pausing or cancelling a campaign sets its new status in the database and, if this process
+    is sending it, an in-memory stop signal. The worker checks both between chunks (the campaign
+    row is re-read anyway after each chunk commit), so it stops within one chunk of the request.
+    """
+
+    def __init__(self, max_workers=CAMPAIGN_DISPATCH_WORKERS):
+        self.max_workers = max_workers
+        self._threads = [] # Started lazily so importing the module doesn't spawn threads
+        self._lock = threading.Lock()
+        self._active_campaign_ids = set()
+        self._stop_signals = {} # campaign_id -> "PAUSED" / "CANCELLED", set by the pause/cancel routes
+        self._send_queue = FairSendQueue()
+        self._sends = {} # campaign_id -> _CampaignSend, from the campaign's first chunk to its last
+        self.worker_id = None # Lease owner identity, set when the dispatch threads start (i.e. after any fork)
+
+    def enqueue(self, app, campaign_id):
+        """
+        Queues a campaign for background sending.
+        Args:
+            app (Flask): The application object, used to push an app context in the worker thread.
+            campaign_id (int): ID of a campaign already marked as SENDING.
+        Returns:
+            bool: False if the campaign is already queued or being sent by this process.
+        """
+        client_id = db.session.execute(select(Campaign.client_id).where(Campaign.id == campaign_id)).scalar()
+        with self._lock:
+            if campaign_id in self._active_campaign_ids:
+                return False
+            if not self._threads:
+                self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+                for index in range(self.max_workers):
+                    thread = threading.Thread(target=self._worker, args=(app,), name=f"campaign-dispatch-{index}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+            self._active_campaign_ids.add(campaign_id)
+        retry_queue.start(app) # Transient send failures are retried off the dispatch threads
+        self._send_queue.add(client_id, campaign_id)
+        logger.info(f"Campaign {campaign_id} queued for dispatch")
+        return True
+
+    def is_active(self, campaign_id):
+        with self._lock:
+            return campaign_id in self._active_campaign_ids
+
+    def request_stop(self, campaign_id, status):
+        """
+        Asks the worker sending a campaign in this process to stop after its current chunk.
+        Args:
+            campaign_id (int): ID of the campaign.
+            status (str): "PAUSED" or "CANCELLED", already committed to the campaign row.
+        """
+        with self._lock:
+            if campaign_id in self._active_campaign_ids:
+                self._stop_signals[campaign_id] = status
+
+    def clear_stop(self, campaign_id):
+        with self._lock:
+            self._stop_signals.pop(campaign_id, None)
+
+    def _stop_requested(self, camp):
+        """Returns the status a running send should stop for, or None to keep sending."""
+        with self._lock:
+            signal = self._stop_signals.get(camp.id)
+        if signal:
+            return signal
+        return camp.status if camp.status != "SENDING" else None # Paused/cancelled through another instance
+
+    def claim_stalled(self, campaign_id):
+        """
+        Atomically takes over a SENDING campaign whose worker stopped sending heartbeats
+        (e.g. the instance was recycled mid-send). Safe to call from several instances at once.
+        Returns:
+            bool: True if this process now owns the campaign and should enqueue it.
+        """
+        if self.is_active(campaign_id):
+            return False
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=CAMPAIGN_STALE_AFTER_SECONDS)
+        result = db.session.execute(
+            update_stmt(Campaign)
+            .where(
+                Campaign.id == campaign_id,
+                Campaign.status == "SENDING",
+                or_(Campaign.send_heartbeat_at.is_(None), Campaign.send_heartbeat_at < stale_before)
+            )
+            .values(send_heartbeat_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def resume_stalled_campaigns(self, app):
+        """
+        Joins SENDING campaigns that have chunks left to lease (started by another instance, or whose chunk
+        leases expired), and resumes campaigns abandoned by a dead worker before their audience was split.
+        """
+        with self._lock:
+            local_campaign_ids = list(self._active_campaign_ids)
+        if local_campaign_ids:
+            # Campaigns waiting for their next turn in the send queue are alive; keep other instances off them
+            db.session.execute(
+                update_stmt(Campaign)
+                .where(Campaign.id.in_(local_campaign_ids), Campaign.status == "SENDING")
+                .values(send_heartbeat_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+
+        resumed = []
+        for (campaign_id,) in db.session.execute(
+            select(Campaign.id).where(Campaign.status == "SENDING", self._leasable_chunk_filter(Campaign.id).exists())
+        ).all():
+            if self.enqueue(app, campaign_id):
+                logger.info(f"Joining campaign {campaign_id}: it has chunks ready to lease")
+                resumed.append(campaign_id)
+
+        stale_before = datetime.utcnow() - timedelta(seconds=CAMPAIGN_STALE_AFTER_SECONDS)
+        campaign_ids = [campaign_id for (campaign_id,) in db.session.execute(
+            select(Campaign.id).where(
+                Campaign.status == "SENDING",
+                Campaign.chunked_at.is_(None),
+                or_(Campaign.send_heartbeat_at.is_(None), Campaign.send_heartbeat_at < stale_before)
+            )
+        )]
+        for campaign_id in campaign_ids:
+            if self.claim_stalled(campaign_id) and self.enqueue(app, campaign_id):
+                logger.warning(f"Resuming stalled campaign {campaign_id} from its last checkpoint")
+                resumed.append(campaign_id)
+
+        self._release_finished_holds()
+        return resumed
+
+    @staticmethod
+    def _release_finished_holds():
+        """
+        Releases holds still left on campaigns that won't send again, e.g. because the worker that held
+        their last chunk lease died before settling. `settle` keeps the hold while a lease is live.
+        """
+        for (campaign_id,) in db.session.execute(
+            select(Campaign.id).where(
+                Campaign.status.in_(("COMPLETED", "PARTIALLY_COMPLETED", "FAILED", "CANCELLED")),
+                Campaign.billing_reserved_amount > 0
+            )
+        ).all():
+            CampaignBilling.settle(campaign_id, release=True)
+
+    def start_recovery_monitor(self, app, interval_seconds=CAMPAIGN_RECOVERY_INTERVAL_SECONDS):
+        """Starts a daemon thread that periodically resumes stalled campaigns (call once at app startup)."""
+        def monitor():
+            while True:
+                try:
+                    with app.app_context():
+                        try:
+                            self.resume_stalled_campaigns(app)
+                        finally:
+                            db.session.remove()
+                except Exception as e:
+                    logger.error(f"Campaign recovery check failed: {str(e)}", exc_info=True)
+                time.sleep(interval_seconds)
+
+        threading.Thread(target=monitor, name="campaign-recovery", daemon=True).start()
+
+    def _worker(self, app):
+        while True:
+            campaign_id = self._send_queue.get(CAMPAIGN_SEND_BATCH_SIZE)
+            attempted, more = 0, False
+            try:
+                attempted, more = self._run_chunk(app, campaign_id)
+            except Exception as e:
+                logger.error(f"Dispatch worker failed on campaign {campaign_id}: {str(e)}", exc_info=True)
+            finally:
+                self._send_queue.task_done(campaign_id, CAMPAIGN_SEND_BATCH_SIZE, attempted, requeue=more)
+                if not more:
+                    with self._lock:
+                        self._active_campaign_ids.discard(campaign_id)
+                        self._stop_signals.pop(campaign_id, None)
+                        self._sends.pop(campaign_id, None)
+
+    def _run_chunk(self, app, campaign_id):
+        """
+        Sends the next chunk of a campaign, setting the send up first if this is its first turn.
+        Returns:
+            tuple: (messages attempted, True if the campaign has more chunks to send)
+        """
+        attempted, more = 0, False
+        with app.app_context():
+            try:
+                send = self._sends.get(campaign_id) or self._start_send(campaign_id)
+                if send:
+                    attempted = self._send_next_chunk(send)
+                    more = attempted is not None
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Unhandled error while dispatching campaign {campaign_id}: {str(e)}", exc_info=True)
+                camp = Campaign.query.get(campaign_id)
+                if camp:
+                    camp.status = "FAILED"
+                    camp.failure_reason = f"Internal error during dispatch: {str(e)}"
+                    db.session.commit()
+            finally:
+                if not more:
+                    self._settle_billing(campaign_id)
+                db.session.remove()
+        return attempted or 0, more
+
+    def _start_send(self, campaign_id):
+        """
+        Validates a campaign and prepares everything its chunks share (credentials, compiled template,
+        pooled API session). Returns None, after recording why, if the campaign can't be sent.
+        """
+        camp = Campaign.query.get(campaign_id)
+        if not camp or camp.status != "SENDING":
+            logger.warning(f"Campaign {campaign_id} is no longer in SENDING state. Skipping dispatch.")
+            return None
+        camp.send_heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+        client_id = camp.client_id
+        client_profile = ClientProfile.query.filter_by(user_id=client_id).first()
+        if not client_profile or not client_profile.meta_access_token_encrypted or not client_profile.meta_phone_number_id:
+            camp.status = "FAILED"
+            camp.failure_reason = "Meta API credentials not configured for this client."
+            db.session.commit()
+            return None
+        self._send_queue.set_weight(client_id, client_profile.send_weight)
+
+        template = camp.template
+        if not template or template.status != "APPROVED_BY_META":
+            camp.status = "FAILED"
+            camp.failure_reason = "Template not found or not approved by Meta."
+            db.session.commit()
+            return None
+
+        try:
+            AudienceService.migrate_legacy_audience(camp) # Campaigns created before campaign_recipients existed
+            compiled_template = get_compiled_template(template) # Compiled once, cached per template version
+        except Exception as e:
+            db.session.rollback()
+            camp.status = "FAILED"
+            camp.failure_reason = f"Error parsing campaign data (audience, personalization, or template variables): {str(e)}"
+            db.session.commit()
+            return None
+
+        if camp.audience_report_json is None:
+            # First run: normalize and deduplicate the audience so only real, distinct numbers are paid for
+            AudienceService.prepare_audience(camp, is_suppressed=lambda phone: suppression_index.is_suppressed(client_id, phone))
+            if not camp.total_recipients:
+                camp.status = "FAILED"
+                camp.failure_reason = "No valid recipients left after removing invalid, duplicate and opted-out phone numbers."
+                db.session.commit()
+                return None
+
+        send = _CampaignSend(
+            campaign_id=campaign_id,
+            client_id=client_id,
+            sender_phone_number_id=client_profile.meta_phone_number_id,
+            template_name=template.template_name,
+            language_code=template.language_code,
+            compiled_template=compiled_template,
+            whatsapp_service=whatsapp_services.get(
+                access_token=client_profile.meta_access_token_encrypted,
+                phone_number_id=client_profile.meta_phone_number_id,
+                messages_per_second=client_profile.meta_messages_per_second
+            )
+        )
+
+        if camp.chunked_at is None:
+            self._split_into_chunks(camp)
+        with self._lock:
+            self._sends[campaign_id] = send
+        return send
+
+    def _send_next_chunk(self, send):
+        """
+        Sends the chunk after the campaign's checkpoint and commits its results together with the advanced checkpoint.
+        Returns:
+            int: Messages attempted, or None once the campaign was stopped or has no chunks left.
+        """
+        camp = Campaign.query.get(send.campaign_id)
+        if not camp:
+            return None
+        stop_status = self._stop_requested(camp)
+        if stop_status:
+            logger.info(f"Campaign {camp.id} stopped ({stop_status}) after recipient {camp.send_cursor}")
+            return None
+        if sender_circuit_breaker.is_open(send.sender_phone_number_id):
+            self._pause_for_sender(camp, send.sender_phone_number_id)
+            return None
+        lease = self._lease_chunk(camp.id)
+        if lease is None:
+            if self._has_unfinished_chunks(camp.id):
+                return None # The remaining chunks are leased by other instances, which finish the campaign
+            if not finalize_campaign_if_done(camp.id):
+                logger.info(f"Campaign {camp.id}: all recipients attempted, waiting for scheduled retries to settle")
+            return None
+        chunk_id, first_recipient_id, last_recipient_id, lease_count = lease
+        if lease_count > 1:
+            # An earlier lease on this chunk expired: its worker died or stalled mid-chunk
+            self._reconcile_interrupted_recipients(camp.id, first_recipient_id, last_recipient_id)
+
+        client_id = send.client_id
+        chunk = AudienceService.get_recipients_in_range(camp.id, first_recipient_id, last_recipient_id)
+        # Numbers that opted out after the audience was prepared are skipped without an API call
+        suppressed = suppression_index.suppressed_among(client_id, [recipient.phone_number for recipient in chunk])
+        recipient_updates = [{"id": recipient.id, "state": "suppressed"} for recipient in chunk if recipient.phone_number in suppressed]
+        if suppressed:
+            chunk = [recipient for recipient in chunk if recipient.phone_number not in suppressed]
+
+        # A static media header is uploaded once per sender and referenced by id (refreshed before Meta expires it)
+        header_media = media_cache.resolve_header(send.whatsapp_service, send.compiled_template.header_media) if chunk else None
+        log_rows = []
+        batch = []
+        for recipient in chunk:
+            recipient_phone = recipient.phone_number
+            recipient_personalization = json.loads(recipient.variables_json) if recipient.variables_json else {}
+            components = send.compiled_template.render(recipient_personalization, header_media=header_media)
+            batch.append((recipient_phone, components if components else None))
+            log_rows.append({
+                "client_id": client_id,
+                "campaign_id": camp.id,
+                "recipient_phone_number": recipient_phone,
+                "sender_phone_number_id": send.sender_phone_number_id,
+                "message_type": "template",
+                "direction": "outgoing",
+                "template_name": send.template_name,
+                "message_content_rendered": f"Personalized template {send.template_name} to {recipient_phone} with vars: {recipient_personalization}",
+                "status": "pending_api_call",
+                "attempt_count": 1,
+                "idempotency_key": campaign_message_key(camp.id, recipient.id)
+            })
+
+        # Renew the lease and record the attempt before any API call is made: one executemany for the whole
+        # chunk, committed together with the recipients' "sending" marker. If the lease was lost meanwhile,
+        # nothing is sent; the new holder sends the chunk.
+        if not self._renew_lease(chunk_id):
+            db.session.rollback()
+            logger.warning(f"Campaign {camp.id}: lease on chunk {chunk_id} expired before sending; leaving it to its new holder")
+            return 0
+        try:
+            log_ids = self._insert_pending_logs(log_rows) if log_rows else []
+        except IntegrityError:
+            # Another sender already logged (and so sent) some of these recipients
+            db.session.rollback()
+            logger.warning(f"Campaign {camp.id}: recipients of chunk {chunk_id} already have messages; not sending them again")
+            return 0
+        if log_ids:
+            db.session.execute(update_stmt(CampaignRecipient), [
+                {"id": recipient.id, "state": "sending", "message_log_id": log_id}
+                for recipient, log_id in zip(chunk, log_ids)
+            ])
+        db.session.commit()
+
+        # The whole chunk is sent concurrently over one pooled connection set
+        api_responses = send.whatsapp_service.send_template_batch(
+            batch,
+            template_name=send.template_name,
+            language_code=send.language_code
+        ) if batch else []
+
+        log_updates = []
+        retries = []
+        held = [] # (recipient, log_id) not sent because the sender's circuit opened mid-chunk
+        chunk_sent = chunk_failed = 0
+        for recipient, log_id, api_response in zip(chunk, log_ids, api_responses):
+            if api_response and api_response.get("circuit_open"):
+                held.append((recipient, log_id))
+                continue
+            try:
+                update, state, retry_at = build_send_outcome(log_id, 1, api_response)
+            except Exception as e_send:
+                logger.error(f"Exception handling send result for {recipient.phone_number} in campaign {camp.id}: {str(e_send)}")
+                update = {"id": log_id, "whatsapp_message_id": None, "attempt_count": 1, "next_retry_at": None,
+                          "status": "failed_internal_error_on_send", "failure_reason": str(e_send)}
+                state, retry_at = "failed", None
+            if state == "sent":
+                chunk_sent += 1
+            elif state == "failed":
+                chunk_failed += 1
+            elif state == "retrying":
+                retries.append((log_id, retry_at)) # Transient failure: settled later by the retry queue
+            # "unconfirmed" is neither counted nor retried: its status webhook settles it
+            log_updates.append(update)
+            recipient_updates.append({"id": recipient.id, "state": state})
+
+        # The chunk is completed first, conditional on this worker still holding its lease. If the lease expired
+        # while the chunk was being sent, the new holder settles these recipients as interrupted; recording them
+        # here as well would count them twice.
+        chunk_values = dict(state="pending", lease_owner=None, lease_expires_at=None) if held else \
+            dict(state="done", completed_at=datetime.utcnow(), lease_expires_at=None)
+        completed = db.session.execute(
+            update_stmt(CampaignChunk)
+            .where(
+                CampaignChunk.id == chunk_id,
+                CampaignChunk.state == "leased",
+                CampaignChunk.lease_owner == self.worker_id,
+                CampaignChunk.lease_count == lease_count # Not re-leased meanwhile, even by another thread of this process
+            )
+            .values(**chunk_values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not completed:
+            db.session.rollback()
+            logger.warning(f"Campaign {camp.id}: lease on chunk {chunk_id} expired while it was being sent (raise CAMPAIGN_CHUNK_LEASE_SECONDS); "
+                           f"leaving its results to the new holder")
+            return 0
+
+        # Bulk UPDATEs by primary key (executemany), committed atomically with the checkpoint.
+        # Counters are incremented in SQL because the retry queue updates them concurrently.
+        if log_updates:
+            db.session.execute(update_stmt(MessageLog), log_updates)
+        if held:
+            # Never sent: drop their logs and hand them back as pending, to be sent when the chunk is leased again
+            db.session.execute(delete(MessageLog).where(MessageLog.id.in_([log_id for _, log_id in held])))
+            recipient_updates.extend({"id": recipient.id, "state": "pending", "message_log_id": None} for recipient, _ in held)
+        if recipient_updates:
+            db.session.execute(update_stmt(CampaignRecipient), recipient_updates)
+        campaign_values = dict(
+            total_recipients=func.coalesce(Campaign.total_recipients, 0) - len(suppressed),
+            messages_sent_count=func.coalesce(Campaign.messages_sent_count, 0) + chunk_sent,
+            messages_failed_count=func.coalesce(Campaign.messages_failed_count, 0) + chunk_failed,
+            send_heartbeat_at=datetime.utcnow()
+        )
+        if not held:
+            campaign_values["send_cursor"] = last_recipient_id
+        db.session.execute(
+            update_stmt(Campaign)
+            .where(Campaign.id == camp.id)
+            .values(**campaign_values)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        campaign_progress.record(camp.id, total_recipients=-len(suppressed), messages_sent_count=chunk_sent, messages_failed_count=chunk_failed)
+        for log_id, retry_at in retries:
+            retry_queue.schedule(log_id, retry_at)
+        if time.monotonic() - send.settled_at >= BILLING_SETTLE_INTERVAL_SECONDS:
+            CampaignBilling.settle(camp.id) # One ledger entry for everything sent since the last settlement
+            send.settled_at = time.monotonic()
+        if held:
+            logger.warning(f"Campaign {camp.id}: {len(held)} recipients of chunk {chunk_id} held back, sender {send.sender_phone_number_id} is failing")
+            if sender_circuit_breaker.is_open(send.sender_phone_number_id):
+                self._pause_for_sender(camp, send.sender_phone_number_id)
+                return None
+        return len(batch) - len(held)
+
+    @staticmethod
+    def _pause_for_sender(camp, phone_number_id):
+        """Pauses a SENDING campaign whose sender's circuit is open, recording why. Commits."""
+        health = sender_circuit_breaker.health(phone_number_id)
+        reason = f"Paused: sender {phone_number_id} keeps failing ({health['last_error']}). Check the Meta credentials, then resume."
+        paused = db.session.execute(
+            update_stmt(Campaign)
+            .where(Campaign.id == camp.id, Campaign.status == "SENDING")
+            .values(status="PAUSED", failure_reason=reason)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if paused:
+            logger.warning(f"Campaign {camp.id} paused: circuit of sender {phone_number_id} is open")
+            campaign_progress.record(camp.id, status="PAUSED")
+
+    @staticmethod
+    def _settle_billing(campaign_id):
+        """Charges what the worker sent; releases the rest of the hold if the campaign won't send any more."""
+        try:
+            db.session.rollback()
+            camp = Campaign.query.get(campaign_id)
+            if camp:
+                campaign_progress.record(campaign_id, status=camp.status) # The send ended: completed, failed or stopped
+                CampaignBilling.settle(campaign_id, release=camp.status in ("COMPLETED", "PARTIALLY_COMPLETED", "FAILED", "CANCELLED"))
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Billing settlement failed for campaign {campaign_id}: {str(e)}", exc_info=True)
+
+    def _split_into_chunks(self, camp):
+        """
+        Splits the campaign's pending recipients into leasable chunks, once. Commits.
+
+        Runs before any chunk exists, so only the instance that started (or took over) the campaign gets here;
+        the conditional UPDATE on chunked_at keeps a second instance from splitting it again.
+        """
+        # Recipients a pre-chunking run left in flight (the instance died mid-chunk) are settled first
+        self._reconcile_interrupted_recipients(camp.id)
+        claimed = db.session.execute(
+            update_stmt(Campaign)
+            .where(Campaign.id == camp.id, Campaign.chunked_at.is_(None))
+            .values(chunked_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed:
+            chunk_rows = [
+                {"campaign_id": camp.id, "first_recipient_id": first_id, "last_recipient_id": last_id, "state": "pending"}
+                for first_id, last_id in AudienceService.iter_chunk_ranges(camp.id, after_id=camp.send_cursor, chunk_size=CAMPAIGN_SEND_BATCH_SIZE)
+            ]
+            if chunk_rows:
+                db.session.execute(insert(CampaignChunk), chunk_rows)
+            logger.info(f"Campaign {camp.id} split into {len(chunk_rows)} chunks of up to {CAMPAIGN_SEND_BATCH_SIZE} recipients")
+        db.session.commit() # Chunks and chunked_at become visible together
+
+    @staticmethod
+    def _leasable_chunk_filter(campaign_id):
+        """Chunks of a campaign (an id or a correlated column) that are pending or whose lease expired."""
+        now = datetime.utcnow()
+        return select(CampaignChunk.id).where(
+            CampaignChunk.campaign_id == campaign_id,
+            or_(
+                CampaignChunk.state == "pending",
+                and_(CampaignChunk.state == "leased", CampaignChunk.lease_expires_at < now)
+            )
+        )
+
+    def _lease_chunk(self, campaign_id):
+        """
+        Leases the campaign's first chunk that is pending or whose lease expired. Commits.
+        Rows locked by other instances are skipped rather than waited for, so concurrent workers get different chunks.
+        Returns:
+            tuple: (chunk_id, first_recipient_id, last_recipient_id, lease_count) or None if no chunk is available.
+        """
+        for _ in range(3):
+            row = db.session.execute(
+                self._leasable_chunk_filter(campaign_id)
+                .with_only_columns(CampaignChunk.id, CampaignChunk.first_recipient_id, CampaignChunk.last_recipient_id, CampaignChunk.lease_count)
+                .order_by(CampaignChunk.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).first()
+            if row is None:
+                db.session.commit()
+                return None
+            now = datetime.utcnow()
+            # Re-checked in the UPDATE so the claim also holds where row locks aren't available
+            leased = db.session.execute(
+                update_stmt(CampaignChunk)
+                .where(
+                    CampaignChunk.id == row.id,
+                    or_(CampaignChunk.state == "pending", and_(CampaignChunk.state == "leased", CampaignChunk.lease_expires_at < now))
+                )
+                .values(
+                    state="leased",
+                    lease_owner=self.worker_id,
+                    lease_expires_at=now + timedelta(seconds=CAMPAIGN_CHUNK_LEASE_SECONDS),
+                    lease_count=CampaignChunk.lease_count + 1
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            if leased:
+                return row.id, row.first_recipient_id, row.last_recipient_id, (row.lease_count or 0) + 1
+        return None # Lost every race to other instances; the recovery monitor rejoins if chunks are still left
+
+    def _renew_lease(self, chunk_id):
+        """Extends this worker's lease on a chunk. Does not commit. Returns False if the lease was lost."""
+        return db.session.execute(
+            update_stmt(CampaignChunk)
+            .where(CampaignChunk.id == chunk_id, CampaignChunk.state == "leased", CampaignChunk.lease_owner == self.worker_id)
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=CAMPAIGN_CHUNK_LEASE_SECONDS))
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    @staticmethod
+    def _has_unfinished_chunks(campaign_id):
+        return db.session.execute(
+            select(CampaignChunk.id).where(CampaignChunk.campaign_id == campaign_id, CampaignChunk.state != "done").limit(1)
+        ).first() is not None
+
+    @staticmethod
+    def _reconcile_interrupted_recipients(campaign_id, first_recipient_id=None, last_recipient_id=None):
+        """
+        Settles recipients a dead worker was sending, optionally only within one chunk's id range. Commits.
+
+        A chunk's recipients are moved to "sending" (with their "pending_api_call" MessageLog rows) in one
+        transaction, and their final states are committed together with the chunk's completion. Recipients
+        still in "sending" therefore belong to an interrupted chunk. Some of them may have reached Meta, so
+        they are marked as interrupted and skipped rather than re-sent: a resumed campaign never double-messages.
+        """
+        query = select(CampaignRecipient.id, CampaignRecipient.message_log_id).where(
+            CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.state == "sending")
+        if first_recipient_id is not None:
+            query = query.where(CampaignRecipient.id.between(first_recipient_id, last_recipient_id))
+        interrupted = db.session.execute(query).all()
+        if not interrupted:
+            return
+        db.session.execute(update_stmt(CampaignRecipient), [
+            {"id": recipient_id, "state": "interrupted"} for recipient_id, _ in interrupted
+        ])
+        db.session.execute(update_stmt(MessageLog), [{
+            "id": log_id,
+            "status": "failed_interrupted",
+            "failure_reason": "Sending was interrupted before the API response was recorded; not retried to avoid a duplicate message."
+        } for _, log_id in interrupted if log_id])
+        db.session.execute(
+            update_stmt(Campaign)
+            .where(Campaign.id == campaign_id)
+            .values(messages_failed_count=func.coalesce(Campaign.messages_failed_count, 0) + len(interrupted))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        campaign_progress.record(campaign_id, messages_failed_count=len(interrupted))
+        logger.warning(f"Campaign {campaign_id}: {len(interrupted)} recipients from an interrupted chunk marked as interrupted")
+
+    @staticmethod
+    def _insert_pending_logs(log_rows):
+        """
+        Inserts the chunk's MessageLog rows with a single executemany and returns their IDs
+        in the same order as `log_rows`. Raises IntegrityError if a recipient already has a log. Does not commit.
+        """
+        db.session.execute(insert(MessageLog), log_rows)
+
+        # MySQL's executemany doesn't return generated keys, so read them back by idempotency key (unique index)
+        keys = [row["idempotency_key"] for row in log_rows]
+        ids_by_key = dict(db.session.execute(
+            select(MessageLog.idempotency_key, MessageLog.id).where(MessageLog.idempotency_key.in_(keys))
+        ).all())
+        return [ids_by_key[key] for key in keys]
+
+
+# Process-wide dispatcher used by the campaign routes
+campaign_dispatcher = CampaignDispatcher()
@@ -0,0 +1,149 @@
+# backend/src/services/campaign_progress.py
+
+from ..models.user import db
+from ..models.campaign import Campaign
+from sqlalchemy import select
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Watched campaigns are re-read from the campaigns table at most this often (one query per campaign, however many
+# streams are open), which folds in progress made by other instances. Changes made in this process are pushed at once.
+CAMPAIGN_PROGRESS_REFRESH_SECONDS = float(os.getenv("CAMPAIGN_PROGRESS_REFRESH_SECONDS", "10"))
+
+# Each open stream holds a request thread (gunicorn runs 8 per worker), so only this many may be open per process;
+# further requests get a 503 and fall back to polling. Streams end after CAMPAIGN_PROGRESS_STREAM_SECONDS and the
+# browser's EventSource reconnects on its own, which spreads long-lived streams over threads and instances.
+CAMPAIGN_PROGRESS_MAX_STREAMS = int(os.getenv("CAMPAIGN_PROGRESS_MAX_STREAMS", "4"))
+CAMPAIGN_PROGRESS_STREAM_SECONDS = int(os.getenv("CAMPAIGN_PROGRESS_STREAM_SECONDS", "300"))
+
+# Lifetime of the campaign-scoped token that opens a progress stream (EventSource passes it in the URL, so it is
+# not the API token). It is checked on every (re)connect: once it expires the page requests a new one.
+CAMPAIGN_PROGRESS_STREAM_TOKEN_SECONDS = int(os.getenv("CAMPAIGN_PROGRESS_STREAM_TOKEN_SECONDS", "900"))
+
+# Counters exposed by the progress stream, named like the fields of GET /campaigns/<id>
+PROGRESS_FIELDS = ("total_recipients", "messages_sent_count", "messages_failed_count", "messages_delivered_count", "messages_read_count")
+
+
+class _WatchedCampaign:
+    __slots__ = ("status", "counters", "version", "watchers", "loaded_at")
+
+    def __init__(self):
+        self.status = None
+        self.counters = dict.fromkeys(PROGRESS_FIELDS, 0)
+        self.version = 0 # Bumped on every change; streams send an event when it moves
+        self.watchers = 0
+        self.loaded_at = None # None until the first read from the database
+
+
+class CampaignProgress:
+    """
+    Live counters and status of the campaigns someone is watching, kept in memory.
+
+    The send path, the retry queue, the status routes and the webhook call `record` after committing their
+    changes; for campaigns nobody watches that is a dictionary miss. Streams block in `wait` until the version
+    of their campaign moves, so pushing an update costs no database access.
+    """
+
+    def __init__(self, refresh_seconds=CAMPAIGN_PROGRESS_REFRESH_SECONDS, max_streams=CAMPAIGN_PROGRESS_MAX_STREAMS):
+        self.refresh_seconds = refresh_seconds
+        self.max_streams = max_streams
+        self._campaigns = {} # campaign_id -> _WatchedCampaign
+        self._open_streams = 0
+        self._condition = threading.Condition()
+
+    def record(self, campaign_id, status=None, **increments):
+        """
+        Applies committed changes to a watched campaign and wakes its streams.
+        Args:
+            campaign_id (int): ID of the campaign.
+            status (str, optional): New campaign status.
+            **increments: Deltas for PROGRESS_FIELDS, e.g. messages_sent_count=500.
+        """
+        with self._condition:
+            entry = self._campaigns.get(campaign_id)
+            if entry is None or entry.loaded_at is None:
+                return
+            changed = False
+            if status and status != entry.status:
+                entry.status = status
+                changed = True
+            for field, delta in increments.items():
+                if delta:
+                    entry.counters[field] += delta
+                    changed = True
+            if changed:
+                entry.version += 1
+                self._condition.notify_all()
+
+    def watch(self, campaign_id):
+        """
+        Registers a stream for a campaign. Returns False if this process already serves max_streams streams.
+        Every successful call must be paired with `unwatch`.
+        """
+        with self._condition:
+            if self._open_streams >= self.max_streams:
+                return False
+            self._open_streams += 1
+            entry = self._campaigns.get(campaign_id)
+            if entry is None:
+                entry = self._campaigns[campaign_id] = _WatchedCampaign()
+            entry.watchers += 1
+            return True
+
+    def unwatch(self, campaign_id):
+        with self._condition:
+            self._open_streams -= 1
+            entry = self._campaigns.get(campaign_id)
+            if entry:
+                entry.watchers -= 1
+                if entry.watchers <= 0:
+                    del self._campaigns[campaign_id]
+
+    def _refresh_if_due(self, campaign_id):
+        """Re-reads a watched campaign from the database when its snapshot is older than refresh_seconds."""
+        with self._condition:
+            entry = self._campaigns.get(campaign_id)
+            if entry is None or (entry.loaded_at is not None and time.monotonic() - entry.loaded_at < self.refresh_seconds):
+                return
+            entry.loaded_at = time.monotonic() # Claimed: other streams of this campaign don't query too
+        row = db.session.execute(
+            select(Campaign.status, *(getattr(Campaign, field) for field in PROGRESS_FIELDS)).where(Campaign.id == campaign_id)
+        ).first()
+        db.session.rollback() # Hand the connection back to the pool while the stream idles
+        if row is None:
+            return
+        with self._condition:
+            if self._campaigns.get(campaign_id) is not entry:
+                return # No longer watched
+            counters = {field: value or 0 for field, value in zip(PROGRESS_FIELDS, row[1:])}
+            if row.status != entry.status or counters != entry.counters:
+                entry.status = row.status
+                entry.counters = counters
+                entry.version += 1
+                self._condition.notify_all()
+
+    def wait(self, campaign_id, since_version, timeout):
+        """
+        Blocks until the campaign's version differs from `since_version` or `timeout` seconds pass. Must run
+        inside an application context (the periodic refresh reads the database). Call `watch` first.
+        Returns:
+            tuple: (version, snapshot dict with "status" and PROGRESS_FIELDS)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self._refresh_if_due(campaign_id)
+            with self._condition:
+                entry = self._campaigns[campaign_id]
+                remaining = deadline - time.monotonic()
+                if entry.version == since_version and remaining > 0:
+                    self._condition.wait(min(remaining, self.refresh_seconds))
+                if entry.version != since_version or time.monotonic() >= deadline:
+                    return entry.version, {"status": entry.status, **entry.counters}
+
+
+# Process-wide progress hub read by the campaign progress stream
+campaign_progress = CampaignProgress()
@@ -0,0 +1,180 @@
+# backend/src/services/campaign_scheduler.py
+
+from ..models.user import db
+from ..models.campaign import Campaign
+from .audience_service import AudienceService
+from .campaign_dispatcher import campaign_dispatcher
+from .billing_service import CampaignBilling
+from .campaign_progress import campaign_progress
+from sqlalchemy import select, update as update_stmt
+from datetime import datetime, timedelta
+import threading
+import logging
+import heapq
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# The scheduler only holds campaigns due within the look-ahead window in memory. The window is
+# re-read from the (status, scheduled_at) index every refresh interval, which also picks up campaigns
+# scheduled through another instance.
+SCHEDULER_LOOKAHEAD_SECONDS = int(os.getenv("SCHEDULER_LOOKAHEAD_SECONDS", "900"))
+SCHEDULER_REFRESH_INTERVAL_SECONDS = int(os.getenv("SCHEDULER_REFRESH_INTERVAL_SECONDS", "60"))
+
+
+class CampaignScheduler:
+    """
+    Fires SCHEDULED campaigns at their scheduled_at time.
+
+    Due campaigns are kept in a min-heap ordered by scheduled_at. Rescheduling or cancelling a campaign
+    doesn't search the heap: `_scheduled` holds the current due time of every campaign and heap entries
+    that no longer match it are dropped when they reach the top. When a campaign is due it is moved from
+    SCHEDULED to SENDING with a conditional UPDATE (so only one instance fires it) and handed to the
+    campaign dispatcher.
+    """
+
+    def __init__(self, lookahead_seconds=SCHEDULER_LOOKAHEAD_SECONDS, refresh_interval=SCHEDULER_REFRESH_INTERVAL_SECONDS):
+        self.lookahead_seconds = lookahead_seconds
+        self.refresh_interval = refresh_interval
+        self._heap = [] # (scheduled_at, campaign_id)
+        self._scheduled = {} # campaign_id -> scheduled_at of its live heap entry
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self, app):
+        """Starts the scheduler thread once per process. Safe to call repeatedly."""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._worker, args=(app,), name="campaign-scheduler", daemon=True)
+            self._thread.start()
+
+    def schedule(self, campaign_id, scheduled_at):
+        """
+        Adds or moves a SCHEDULED campaign. Campaigns due beyond the look-ahead window are left to the next refresh.
+        Args:
+            campaign_id (int): ID of the campaign.
+            scheduled_at (datetime): Naive UTC time at which the campaign should be sent.
+        """
+        if scheduled_at is None:
+            self.unschedule(campaign_id)
+            return
+        with self._condition:
+            if scheduled_at > datetime.utcnow() + timedelta(seconds=self.lookahead_seconds):
+                self._scheduled.pop(campaign_id, None) # Any earlier entry is now stale
+                return
+            if self._scheduled.get(campaign_id) == scheduled_at:
+                return
+            self._scheduled[campaign_id] = scheduled_at
+            heapq.heappush(self._heap, (scheduled_at, campaign_id))
+            self._condition.notify()
+
+    def unschedule(self, campaign_id):
+        """Forgets a campaign that was deleted, sent manually or is no longer SCHEDULED."""
+        with self._condition:
+            self._scheduled.pop(campaign_id, None)
+
+    def sync(self, camp):
+        """Schedules or unschedules a campaign according to its current status and scheduled_at."""
+        if camp.status == "SCHEDULED" and camp.scheduled_at:
+            self.schedule(camp.id, camp.scheduled_at)
+        else:
+            self.unschedule(camp.id)
+
+    def _pop_due(self, max_wait):
+        with self._condition:
+            if not self._heap or self._heap[0][0] > datetime.utcnow():
+                wait = max_wait
+                if self._heap:
+                    wait = min(wait, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+                self._condition.wait(max(wait, 0))
+            due = []
+            now = datetime.utcnow()
+            while self._heap and self._heap[0][0] <= now:
+                scheduled_at, campaign_id = heapq.heappop(self._heap)
+                if self._scheduled.get(campaign_id) != scheduled_at:
+                    continue # Rescheduled or unscheduled since this entry was pushed
+                del self._scheduled[campaign_id]
+                due.append(campaign_id)
+            return due
+
+    def _worker(self, app):
+        next_refresh_at = 0.0
+        while True:
+            try:
+                campaign_ids = self._pop_due(max(next_refresh_at - time.monotonic(), 0))
+                with app.app_context():
+                    try:
+                        if time.monotonic() >= next_refresh_at:
+                            self.refresh()
+                            next_refresh_at = time.monotonic() + self.refresh_interval
+                        for campaign_id in campaign_ids:
+                            self.fire(app, campaign_id)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                logger.error(f"Campaign scheduler pass failed: {str(e)}", exc_info=True)
+                time.sleep(1)
+
+    def refresh(self):
+        """Loads SCHEDULED campaigns due within the look-ahead window (including overdue ones)."""
+        horizon = datetime.utcnow() + timedelta(seconds=self.lookahead_seconds)
+        rows = db.session.execute(
+            select(Campaign.id, Campaign.scheduled_at)
+            .where(Campaign.status == "SCHEDULED", Campaign.scheduled_at <= horizon)
+        ).all()
+        for campaign_id, scheduled_at in rows:
+            self.schedule(campaign_id, scheduled_at)
+        return len(rows)
+
+    def fire(self, app, campaign_id):
+        """
+        Moves a due campaign from SCHEDULED to SENDING and queues it for dispatch. Commits.
+        Returns:
+            bool: True if this process started the campaign.
+        """
+        now = datetime.utcnow()
+        result = db.session.execute(
+            update_stmt(Campaign)
+            .where(Campaign.id == campaign_id, Campaign.status == "SCHEDULED", Campaign.scheduled_at <= now)
+            .values(
+                status="SENDING",
+                actual_sent_at=now,
+                failure_reason=None,
+                send_cursor=0,
+                messages_sent_count=0,
+                messages_failed_count=0,
+                send_heartbeat_at=now
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            return False # Sent manually, edited, deleted or fired by another instance
+
+        camp = Campaign.query.get(campaign_id)
+        if not camp.audience_json and not AudienceService.count_recipients(campaign_id):
+            camp.status = "FAILED"
+            camp.failure_reason = "Campaign has no recipients."
+            db.session.commit()
+            logger.warning(f"Scheduled campaign {campaign_id} has no recipients and was not sent")
+            return False
+
+        reserved, amount, currency = CampaignBilling.reserve(camp)
+        if not reserved:
+            camp.status = "FAILED"
+            camp.failure_reason = f"Insufficient wallet balance: {amount} {currency} is needed to send this campaign."
+            db.session.commit()
+            logger.warning(f"Scheduled campaign {campaign_id} not sent: insufficient wallet balance for {amount} {currency}")
+            return False
+        db.session.commit()
+        campaign_progress.record(campaign_id, status="SENDING")
+
+        campaign_dispatcher.enqueue(app, campaign_id)
+        logger.info(f"Scheduled campaign {campaign_id} started (scheduled for {camp.scheduled_at})")
+        return True
+
+
+# Process-wide scheduler; the campaign routes keep it in sync with the campaigns table
+campaign_scheduler = CampaignScheduler()
@@ -0,0 +1,110 @@
+# backend/src/services/fair_send_queue.py
+
+from collections import deque
+import threading
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Share of send capacity a client gets relative to others when ClientProfile.send_weight is not set.
+# A client with weight 4 is handed four chunks for every chunk of a weight-1 client while both have work queued.
+SEND_DEFAULT_CLIENT_WEIGHT = float(os.getenv("SEND_DEFAULT_CLIENT_WEIGHT", "1"))
+
+
+class _ClientQueue:
+    __slots__ = ("campaign_ids", "weight", "virtual_time", "running")
+
+    def __init__(self, weight, virtual_time):
+        self.campaign_ids = deque() # Campaigns with a chunk ready to send, served round-robin
+        self.weight = weight
+        self.virtual_time = virtual_time # Messages handed out so far, divided by the weight
+        self.running = 0 # Chunks of this client currently being sent
+
+
+class FairSendQueue:
+    """
+    Weighted fair queue of campaign chunks, keyed by client.
+
+    Each client has a virtual time that advances by (messages sent / weight) whenever one of its chunks is
+    handed out; the next chunk always goes to the waiting client with the lowest virtual time. A client that
+    starts sending joins at the current minimum instead of its old value, so idle time isn't banked as credit.
+    The result: a small campaign is interleaved with a large one from its first chunk instead of queueing
+    behind it, while workers never idle as long as any campaign has work.
+
+    A campaign is handed to one worker of this process at a time (`get` removes it until `task_done` puts it
+    back). Which chunk that worker sends is decided by the campaign_chunks leases, so other instances may be
+    sending other chunks of the same campaign meanwhile; this queue only orders turns within the process.
+    """
+
+    def __init__(self, default_weight=SEND_DEFAULT_CLIENT_WEIGHT):
+        self.default_weight = default_weight
+        self._clients = {} # client_id -> _ClientQueue
+        self._client_by_campaign = {} # campaign_id -> client_id
+        self._condition = threading.Condition()
+
+    def _weight(self, weight):
+        return float(weight) if weight and float(weight) > 0 else self.default_weight
+
+    def _minimum_virtual_time(self):
+        return min((client.virtual_time for client in self._clients.values()), default=0.0)
+
+    def add(self, client_id, campaign_id):
+        """Queues a campaign's first chunk behind those of its client's other campaigns."""
+        with self._condition:
+            client = self._clients.get(client_id)
+            if client is None:
+                client = _ClientQueue(self.default_weight, self._minimum_virtual_time())
+                self._clients[client_id] = client
+            self._client_by_campaign[campaign_id] = client_id
+            client.campaign_ids.append(campaign_id)
+            self._condition.notify()
+
+    def set_weight(self, client_id, weight):
+        """Applies a client's configured weight (read from its profile once its first campaign is set up)."""
+        with self._condition:
+            client = self._clients.get(client_id)
+            if client:
+                client.weight = self._weight(weight)
+
+    def get(self, expected_cost):
+        """
+        Blocks until a chunk is ready and returns the campaign it belongs to. The client is charged
+        `expected_cost` messages right away so concurrent workers spread over other clients; `task_done`
+        corrects the charge with what was actually sent.
+        """
+        with self._condition:
+            while True:
+                ready = [client for client in self._clients.values() if client.campaign_ids]
+                if ready:
+                    break
+                self._condition.wait()
+            client = min(ready, key=lambda c: c.virtual_time)
+            campaign_id = client.campaign_ids.popleft()
+            client.running += 1
+            client.virtual_time += expected_cost / client.weight
+            return campaign_id
+
+    def task_done(self, campaign_id, expected_cost, actual_cost, requeue):
+        """
+        Settles a chunk handed out by `get`.
+        Args:
+            campaign_id (int): The campaign returned by `get`.
+            expected_cost (int): The cost passed to `get`.
+            actual_cost (int): Messages the chunk actually sent.
+            requeue (bool): True if the campaign has more chunks to send.
+        """
+        with self._condition:
+            client_id = self._client_by_campaign.get(campaign_id)
+            client = self._clients.get(client_id)
+            if client is None:
+                return
+            client.running -= 1
+            client.virtual_time += (actual_cost - expected_cost) / client.weight
+            if requeue:
+                client.campaign_ids.append(campaign_id)
+                self._condition.notify()
+                return
+            del self._client_by_campaign[campaign_id]
+            if not client.campaign_ids and not client.running:
+                del self._clients[client_id] # Rejoins at the current minimum next time
@@ -0,0 +1,179 @@
+# backend/src/services/idempotency_service.py
+
+from ..models.user import db
+from ..models.idempotency_key import IdempotencyKey
+from sqlalchemy import select, delete, update as update_stmt
+from sqlalchemy.exc import IntegrityError
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import threading
+import hashlib
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# How long a client's Idempotency-Key is remembered. A retry within this window gets the original response;
+# after it the key may be reused for a new request. Expired rows are purged at most once per purge interval.
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = int(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "3600"))
+
+# A key still "in_progress" after this long belongs to a request that died (worker crash or kill) before it
+# completed or released the key; the next retry takes it over. Must exceed the longest send request
+# (rate limiter wait plus WHATSAPP_CONNECT_TIMEOUT_SECONDS and WHATSAPP_SEND_TIMEOUT_SECONDS).
+IDEMPOTENCY_IN_PROGRESS_SECONDS = int(os.getenv("IDEMPOTENCY_IN_PROGRESS_SECONDS", "120"))
+
+# Completed responses kept in memory per process, so retries of recent requests don't query the table
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def campaign_message_key(campaign_id, recipient_id):
+    """Idempotency key of a campaign recipient's message (MessageLog.idempotency_key); at most one log per recipient."""
+    return f"campaign:{campaign_id}:recipient:{recipient_id}"
+
+
+def request_fingerprint(path, body):
+    """SHA-256 of the route and raw request body, to detect a key reused for a different request."""
+    digest = hashlib.sha256(path.encode("utf-8"))
+    digest.update(b"\n")
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Idempotency-Key bookkeeping for the messaging routes, backed by the idempotency_keys table.
+
+    `begin` claims a key by inserting its row; the unique index on (client_id, key) lets exactly one of several
+    concurrent requests win, the others see the existing row. `complete` stores the response for replays and
+    `release` drops the claim of a request that may safely be sent again. Completed responses never change,
+    so they are also cached in a per-process LRU that answers most retries without a query.
+    """
+
+    def __init__(self, ttl_hours=IDEMPOTENCY_KEY_TTL_HOURS, cache_size=IDEMPOTENCY_CACHE_SIZE,
+                 purge_interval_seconds=IDEMPOTENCY_PURGE_INTERVAL_SECONDS, in_progress_seconds=IDEMPOTENCY_IN_PROGRESS_SECONDS):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.in_progress_timeout = timedelta(seconds=in_progress_seconds)
+        self.cache_size = cache_size
+        self.purge_interval_seconds = purge_interval_seconds
+        self._completed = OrderedDict() # (client_id, key) -> (fingerprint, status, body, expires_at)
+        self._lock = threading.Lock()
+        self._last_purge = None
+
+    def _cached(self, client_id, key):
+        with self._lock:
+            entry = self._completed.get((client_id, key))
+            if entry is None:
+                return None
+            if entry[3] <= datetime.utcnow():
+                del self._completed[(client_id, key)]
+                return None
+            self._completed.move_to_end((client_id, key))
+            return entry
+
+    def _cache(self, client_id, key, fingerprint, status, body, created_at):
+        with self._lock:
+            self._completed[(client_id, key)] = (fingerprint, status, body, created_at + self.ttl)
+            self._completed.move_to_end((client_id, key))
+            while len(self._completed) > self.cache_size:
+                self._completed.popitem(last=False)
+
+    def begin(self, client_id, key, fingerprint):
+        """
+        Claims an Idempotency-Key before the request is processed. Commits.
+        Returns:
+            tuple: (outcome, status, body) where outcome is "new" (go ahead, then call `complete` or `release`),
+                   "replay" (return the stored status and JSON body), "in_progress" (the original request hasn't
+                   finished) or "mismatch" (the key was used for a different request). A key left in progress for
+                   longer than IDEMPOTENCY_IN_PROGRESS_SECONDS is taken over and returns "new".
+        """
+        cached = self._cached(client_id, key)
+        if cached:
+            return ("replay", cached[1], cached[2]) if cached[0] == fingerprint else ("mismatch", None, None)
+
+        self._purge_if_due()
+        for _ in range(2):
+            try:
+                db.session.add(IdempotencyKey(client_id=client_id, idempotency_key=key, request_fingerprint=fingerprint,
+                                              state="in_progress", created_at=datetime.utcnow()))
+                db.session.commit()
+                return "new", None, None
+            except IntegrityError:
+                db.session.rollback()
+            existing = db.session.execute(
+                select(IdempotencyKey).where(IdempotencyKey.client_id == client_id, IdempotencyKey.idempotency_key == key)
+            ).scalar_one_or_none()
+            if existing is None:
+                continue # Released or purged in the meantime
+            if existing.created_at <= datetime.utcnow() - self.ttl:
+                # Expired but not purged yet: the key is free again
+                db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == existing.id))
+                db.session.commit()
+                continue
+            if existing.request_fingerprint != fingerprint:
+                return "mismatch", None, None
+            if existing.state != "completed":
+                if existing.created_at > datetime.utcnow() - self.in_progress_timeout:
+                    return "in_progress", None, None
+                # The original request died without completing or releasing the key. The UPDATE is conditional on
+                # the claim time read above, so only one of several concurrent retries takes the key over.
+                taken_over = db.session.execute(
+                    update_stmt(IdempotencyKey)
+                    .where(IdempotencyKey.id == existing.id, IdempotencyKey.state == "in_progress",
+                           IdempotencyKey.created_at == existing.created_at)
+                    .values(created_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                db.session.commit()
+                if taken_over:
+                    logger.warning(f"Idempotency key {key} of client {client_id} was abandoned in progress; taken over by a retry")
+                    return "new", None, None
+                return "in_progress", None, None
+            self._cache(client_id, key, fingerprint, existing.response_status, existing.response_body, existing.created_at)
+            return "replay", existing.response_status, existing.response_body
+        return "in_progress", None, None
+
+    def complete(self, client_id, key, fingerprint, status, body):
+        """Stores the response of a request claimed with `begin`, to be replayed for retries. Commits."""
+        now = datetime.utcnow()
+        db.session.execute(
+            update_stmt(IdempotencyKey)
+            .where(IdempotencyKey.client_id == client_id, IdempotencyKey.idempotency_key == key, IdempotencyKey.state == "in_progress")
+            .values(state="completed", response_status=status, response_body=body, completed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        self._cache(client_id, key, fingerprint, status, body, now)
+
+    def release(self, client_id, key):
+        """Drops the claim of a request that ended without a result worth replaying, so a retry is processed anew. Commits."""
+        db.session.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.client_id == client_id, IdempotencyKey.idempotency_key == key, IdempotencyKey.state == "in_progress")
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _purge_if_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._last_purge is not None and now - self._last_purge < self.purge_interval_seconds:
+                return
+            self._last_purge = now
+        try:
+            purged = db.session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.created_at < datetime.utcnow() - self.ttl)
+            ).rowcount
+            db.session.commit()
+            if purged:
+                logger.info(f"Purged {purged} expired idempotency keys")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error purging expired idempotency keys: {str(e)}")
+
+
+# Process-wide store used by the messaging routes
+idempotency_store = IdempotencyStore()
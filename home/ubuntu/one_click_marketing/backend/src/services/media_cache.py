@@ -0,0 +1,101 @@
+# backend/src/services/media_cache.py
+
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Meta keeps uploaded media for 30 days; ids are re-uploaded once older than this, well before they expire
+WHATSAPP_MEDIA_ID_TTL_HOURS = float(os.getenv("WHATSAPP_MEDIA_ID_TTL_HOURS", "600"))
+
+# After a failed upload the asset is sent by link (Meta fetches it per message) and the upload is retried after this long
+WHATSAPP_MEDIA_RETRY_SECONDS = float(os.getenv("WHATSAPP_MEDIA_RETRY_SECONDS", "300"))
+
+
+class MediaIdCache:
+    """
+    Graph API media ids of header assets, keyed by (phone_number_id, asset URL).
+
+    A media header given as a link makes Meta download the asset for every message. The campaign path asks
+    `resolve_header` for the header of each chunk instead: the asset is uploaded once per sender, on first use
+    or when its id is about to expire, and every message references the id. Concurrent callers for the same
+    asset wait for the one upload in progress.
+    """
+
+    def __init__(self, ttl_hours=WHATSAPP_MEDIA_ID_TTL_HOURS, retry_seconds=WHATSAPP_MEDIA_RETRY_SECONDS):
+        self.ttl_seconds = ttl_hours * 3600
+        self.retry_seconds = retry_seconds
+        self._media_ids = {} # (phone_number_id, link) -> (media_id, refresh_at)
+        self._failed_until = {} # (phone_number_id, link) -> time before which no upload is attempted
+        self._upload_locks = {} # (phone_number_id, link) -> Lock held while uploading; removed once the upload is done
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._media_ids.get(key)
+            if entry and time.monotonic() < entry[1]:
+                return entry[0]
+            if time.monotonic() < self._failed_until.get(key, 0):
+                return False # Recently failed: use the link
+            return None
+
+    def media_id(self, whatsapp_service, link):
+        """
+        Returns the sender's media id for an asset URL, uploading it if it has none or it is due for refresh.
+        Returns None if the asset can't be uploaded right now.
+        """
+        key = (whatsapp_service.phone_number_id, link)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached or None
+        with self._lock:
+            upload_lock = self._upload_locks.setdefault(key, threading.Lock())
+        with upload_lock:
+            cached = self._cached(key) # Uploaded by another thread while this one waited
+            if cached is not None:
+                return cached or None
+            result = whatsapp_service.upload_media_from_url(link)
+            media_id = result.get("id") if result else None
+            with self._lock:
+                if media_id:
+                    self._media_ids[key] = (media_id, time.monotonic() + self.ttl_seconds)
+                    self._failed_until.pop(key, None)
+                else:
+                    self._failed_until[key] = time.monotonic() + self.retry_seconds
+                # The outcome is recorded, so later callers return before needing the lock; threads already
+                # waiting on it still get it and find the outcome
+                if self._upload_locks.get(key) is upload_lock:
+                    del self._upload_locks[key]
+        if media_id:
+            logger.info(f"Media {link} uploaded for sender {whatsapp_service.phone_number_id} as {media_id}")
+        else:
+            logger.warning(f"Could not upload media {link} for sender {whatsapp_service.phone_number_id}, sending it by link: {result}")
+        return media_id
+
+    def resolve_header(self, whatsapp_service, header_media):
+        """
+        Turns a (type, {"link": ...}) media header into (type, {"id": ...}) with the sender's cached media id.
+        Headers that already use an id, and links that can't be uploaded, are returned unchanged.
+        """
+        if not header_media:
+            return header_media
+        media_type, media_ref = header_media
+        link = media_ref.get("link")
+        if not link:
+            return header_media
+        media_id = self.media_id(whatsapp_service, link)
+        return (media_type, {"id": media_id}) if media_id else header_media
+
+    def invalidate(self, phone_number_id):
+        """Forgets a sender's media ids, e.g. after its credentials were changed."""
+        with self._lock:
+            for key in [key for key in self._media_ids if key[0] == phone_number_id]:
+                del self._media_ids[key]
+            for key in [key for key in self._failed_until if key[0] == phone_number_id]:
+                del self._failed_until[key]
+
+
+# Process-wide media id cache used by the campaign dispatcher and the retry queue
+media_cache = MediaIdCache()
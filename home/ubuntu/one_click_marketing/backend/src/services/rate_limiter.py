@@ -0,0 +1,99 @@
+# backend/src/services/rate_limiter.py
+
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Meta's default throughput for a WhatsApp Business phone number is 80 messages per second.
+# Numbers upgraded to a higher tier can set ClientProfile.meta_messages_per_second instead.
+WHATSAPP_DEFAULT_MESSAGES_PER_SECOND = float(os.getenv("WHATSAPP_DEFAULT_MESSAGES_PER_SECOND", "80"))
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens are added per second up to `capacity`.
+
+    `acquire` reserves its tokens immediately (the balance may go negative) and then sleeps
+    outside the lock until the reservation is covered, so concurrent callers are served in
+    arrival order without holding the lock while they wait.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` tokens are available. Returns the number of seconds waited."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def set_rate(self, rate, capacity=None):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+            self.capacity = float(capacity if capacity is not None else max(rate, 1))
+            self.tokens = min(self.tokens, self.capacity)
+
+    def penalize(self, seconds):
+        """Empties the bucket and pushes the next token `seconds` into the future (used after a 429)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class SenderRateLimiter:
+    """Process-wide registry of token buckets keyed by the Meta phone_number_id that sends the message."""
+
+    def __init__(self, default_rate=WHATSAPP_DEFAULT_MESSAGES_PER_SECOND):
+        self.default_rate = default_rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, phone_number_id, rate=None):
+        rate = float(rate or self.default_rate)
+        with self._lock:
+            bucket = self._buckets.get(phone_number_id)
+            if bucket is None:
+                bucket = TokenBucket(rate)
+                self._buckets[phone_number_id] = bucket
+                return bucket
+        if bucket.rate != rate: # The sender's tier was changed since the bucket was created
+            bucket.set_rate(rate)
+        return bucket
+
+    def acquire(self, phone_number_id, rate=None, tokens=1):
+        """
+        Blocks until the sender may make `tokens` more API calls.
+        Args:
+            phone_number_id (str): The sending WhatsApp Business Phone Number ID.
+            rate (float, optional): Messages per second allowed for this sender; defaults to the system default.
+            tokens (int): Number of messages about to be sent.
+        Returns:
+            float: Seconds spent waiting.
+        """
+        return self.get_bucket(phone_number_id, rate).acquire(tokens)
+
+    def penalize(self, phone_number_id, seconds=1.0):
+        with self._lock:
+            bucket = self._buckets.get(phone_number_id)
+        if bucket:
+            logger.warning(f"Throttling sender {phone_number_id} for {seconds}s after a rate limit response from Meta")
+            bucket.penalize(seconds)
+
+
+# Shared by every WhatsAppService instance in this process
+sender_rate_limiter = SenderRateLimiter()
@@ -0,0 +1,319 @@
+# backend/src/services/retry_queue.py
+
+from ..models.user import ClientProfile, db
+from ..models.campaign import Campaign
+from ..models.message_log import MessageLog
+from ..models.campaign_recipient import CampaignRecipient
+from .whatsapp_service import whatsapp_services
+from .sender_health import sender_circuit_breaker
+from .media_cache import media_cache
+from .template_renderer import get_compiled_template
+from .send_results import build_send_outcome, finalize_campaign_if_done
+from .campaign_progress import campaign_progress
+from sqlalchemy import select, func, update as update_stmt
+from collections import defaultdict
+from datetime import datetime, timedelta
+import threading
+import logging
+import socket
+import heapq
+import json
+import time
+import uuid
+import os
+
+logger = logging.getLogger(__name__)
+
+# Messages re-sent per pass of the retry worker
+RETRY_BATCH_SIZE = int(os.getenv("RETRY_BATCH_SIZE", "200"))
+
+# How often the worker also looks in the database for due retries it doesn't hold in memory
+# (scheduled by an instance that has since restarted) and for retries stuck in flight.
+RETRY_POLL_INTERVAL_SECONDS = int(os.getenv("RETRY_POLL_INTERVAL_SECONDS", "30"))
+RETRY_IN_FLIGHT_TIMEOUT_SECONDS = int(os.getenv("RETRY_IN_FLIGHT_TIMEOUT_SECONDS", "300"))
+
+
+class RetryQueue:
+    """
+    Re-sends campaign messages that failed with a transient error (throttling, 5xx, network errors).
+
+    The campaign send loop records such messages as "retry_scheduled" with a `next_retry_at` and hands
+    them to `schedule`. A single worker thread keeps them in a min-heap ordered by due time, so the
+    dispatch threads never sleep on a backoff. Due messages are claimed in one conditional UPDATE
+    ("retry_scheduled" -> "retry_in_flight", tagged with a claim token) before they are re-sent, which
+    makes it safe for several instances to poll the same table.
+    """
+
+    def __init__(self, batch_size=RETRY_BATCH_SIZE, poll_interval=RETRY_POLL_INTERVAL_SECONDS):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._heap = [] # (due_at, log_id)
+        self._queued_log_ids = set()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self, app):
+        """Starts the worker thread once per process. Safe to call repeatedly."""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._worker, args=(app,), name="send-retry", daemon=True)
+            self._thread.start()
+
+    def schedule(self, log_id, due_at):
+        """
+        Queues a "retry_scheduled" MessageLog row for re-sending.
+        Args:
+            log_id (int): ID of the MessageLog row.
+            due_at (datetime): UTC time after which the message may be re-sent.
+        """
+        with self._condition:
+            if log_id in self._queued_log_ids:
+                return
+            self._queued_log_ids.add(log_id)
+            heapq.heappush(self._heap, (due_at, log_id))
+            self._condition.notify()
+
+    def _pop_due(self, max_wait):
+        with self._condition:
+            if not self._heap or self._heap[0][0] > datetime.utcnow():
+                wait = max_wait
+                if self._heap:
+                    wait = min(wait, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+                self._condition.wait(max(wait, 0))
+            due = []
+            now = datetime.utcnow()
+            while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                _, log_id = heapq.heappop(self._heap)
+                self._queued_log_ids.discard(log_id)
+                due.append(log_id)
+            return due
+
+    def _worker(self, app):
+        next_poll_at = 0.0
+        while True:
+            try:
+                log_ids = self._pop_due(max(next_poll_at - time.monotonic(), 0))
+                with app.app_context():
+                    try:
+                        if time.monotonic() >= next_poll_at:
+                            self._poll_database()
+                            next_poll_at = time.monotonic() + self.poll_interval
+                        if log_ids:
+                            self.process(log_ids)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                logger.error(f"Retry worker pass failed: {str(e)}", exc_info=True)
+                time.sleep(1)
+
+    def _poll_database(self):
+        """Picks up persisted retries not held in memory and settles retries whose sender died mid-flight."""
+        now = datetime.utcnow()
+        due_rows = db.session.execute(
+            select(MessageLog.id, MessageLog.next_retry_at)
+            .where(MessageLog.status == "retry_scheduled", MessageLog.next_retry_at <= now + timedelta(seconds=self.poll_interval))
+            .order_by(MessageLog.next_retry_at)
+            .limit(self.batch_size * 10)
+        ).all()
+        for log_id, due_at in due_rows:
+            self.schedule(log_id, due_at)
+
+        stuck = db.session.execute(
+            select(MessageLog.id, MessageLog.campaign_id)
+            .where(
+                MessageLog.status == "retry_in_flight",
+                MessageLog.status_updated_at < now - timedelta(seconds=RETRY_IN_FLIGHT_TIMEOUT_SECONDS)
+            )
+        ).all()
+        if not stuck:
+            return
+        # Like an interrupted campaign chunk: the message may have reached Meta, so it is not re-sent again
+        db.session.execute(update_stmt(MessageLog), [{
+            "id": log_id,
+            "status": "failed_interrupted",
+            "next_retry_at": None,
+            "failure_reason": "Retry was interrupted before the API response was recorded; not retried to avoid a duplicate message."
+        } for log_id, _ in stuck])
+        self._settle_recipients({log_id: "interrupted" for log_id, _ in stuck})
+        failed_by_campaign = defaultdict(int)
+        for _, campaign_id in stuck:
+            failed_by_campaign[campaign_id] += 1
+        self._increment_counters({campaign_id: (0, failed) for campaign_id, failed in failed_by_campaign.items()})
+        db.session.commit()
+        logger.warning(f"{len(stuck)} in-flight retries timed out and were marked as interrupted")
+        for campaign_id in failed_by_campaign:
+            finalize_campaign_if_done(campaign_id)
+
+    def _claim(self, log_ids):
+        """
+        Moves due rows to "retry_in_flight" with one conditional UPDATE that tags them with a claim token. Commits.
+        Returns:
+            list: The IDs this process won (read back by claim token when another instance took some of them).
+        """
+        log_ids = list(set(log_ids))
+        claim_token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        won = db.session.execute(
+            update_stmt(MessageLog)
+            .where(MessageLog.id.in_(log_ids), MessageLog.status == "retry_scheduled")
+            .values(status="retry_in_flight", retry_claimed_by=claim_token, status_updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if won == len(log_ids):
+            claimed = log_ids
+        elif won:
+            claimed = db.session.execute(
+                select(MessageLog.id).where(MessageLog.id.in_(log_ids), MessageLog.retry_claimed_by == claim_token)
+            ).scalars().all()
+        else:
+            claimed = []
+        db.session.commit()
+        return claimed
+
+    def process(self, log_ids):
+        """Claims and re-sends the given due MessageLog rows, grouped by campaign. Commits."""
+        claimed = self._claim(log_ids)
+        if not claimed:
+            return
+        rows = db.session.execute(
+            select(MessageLog.id, MessageLog.campaign_id, MessageLog.recipient_phone_number, MessageLog.attempt_count)
+            .where(MessageLog.id.in_(claimed))
+        ).all()
+        rows_by_campaign = defaultdict(list)
+        for row in rows:
+            rows_by_campaign[row.campaign_id].append(row)
+        for campaign_id, campaign_rows in rows_by_campaign.items():
+            try:
+                self._resend_for_campaign(campaign_id, campaign_rows)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Retrying {len(campaign_rows)} messages of campaign {campaign_id} failed: {str(e)}", exc_info=True)
+                self._fail_rows(campaign_id, campaign_rows, f"Internal error during retry: {str(e)}")
+
+    def _resend_for_campaign(self, campaign_id, rows):
+        camp = Campaign.query.get(campaign_id) if campaign_id else None
+        if camp and camp.status == "PAUSED":
+            self._defer_rows(rows) # Held until the campaign is resumed
+            return
+        if not camp or camp.status != "SENDING":
+            self._fail_rows(campaign_id, rows, "Campaign is no longer sending; retry abandoned.")
+            return
+        client_profile = ClientProfile.query.filter_by(user_id=camp.client_id).first()
+        template = camp.template
+        if not client_profile or not client_profile.meta_access_token_encrypted or not client_profile.meta_phone_number_id:
+            self._fail_rows(campaign_id, rows, "Meta API credentials not configured for this client.")
+            return
+        if not template or template.status != "APPROVED_BY_META":
+            self._fail_rows(campaign_id, rows, "Template not found or not approved by Meta.")
+            return
+        if sender_circuit_breaker.is_open(client_profile.meta_phone_number_id):
+            self._defer_rows(rows) # Held until the sender's circuit lets requests through again
+            return
+        compiled_template = get_compiled_template(template)
+
+        whatsapp_service = whatsapp_services.get(
+            access_token=client_profile.meta_access_token_encrypted,
+            phone_number_id=client_profile.meta_phone_number_id,
+            messages_per_second=client_profile.meta_messages_per_second
+        )
+        header_media = media_cache.resolve_header(whatsapp_service, compiled_template.header_media)
+
+        variables_by_log_id = dict(db.session.execute(
+            select(CampaignRecipient.message_log_id, CampaignRecipient.variables_json)
+            .where(CampaignRecipient.message_log_id.in_([row.id for row in rows]))
+        ).all())
+        batch = []
+        for row in rows:
+            variables_json = variables_by_log_id.get(row.id)
+            components = compiled_template.render(json.loads(variables_json) if variables_json else {}, header_media=header_media)
+            batch.append((row.recipient_phone_number, components if components else None))
+
+        api_responses = whatsapp_service.send_template_batch(
+            batch,
+            template_name=template.template_name,
+            language_code=template.language_code
+        )
+
+        log_updates = []
+        recipient_states = {}
+        retries = []
+        held = [] # Not sent because the sender's circuit opened during the batch
+        sent = failed = 0
+        now = datetime.utcnow()
+        for row, api_response in zip(rows, api_responses):
+            if api_response and api_response.get("circuit_open"):
+                held.append(row)
+                continue
+            update, state, retry_at = build_send_outcome(row.id, (row.attempt_count or 1) + 1, api_response, now)
+            log_updates.append(update)
+            recipient_states[row.id] = state
+            if state == "sent":
+                sent += 1
+            elif state == "failed":
+                failed += 1
+            elif state == "retrying":
+                retries.append((row.id, retry_at))
+
+        if log_updates:
+            db.session.execute(update_stmt(MessageLog), log_updates)
+            self._settle_recipients(recipient_states)
+            self._increment_counters({campaign_id: (sent, failed)})
+            db.session.commit()
+        if held:
+            self._defer_rows(held)
+        for log_id, retry_at in retries:
+            self.schedule(log_id, retry_at)
+        logger.info(f"Campaign {campaign_id}: retried {len(rows) - len(held)} messages. Sent: {sent}, Failed: {failed}, Rescheduled: {len(retries)}, Held: {len(held)}")
+        finalize_campaign_if_done(campaign_id)
+
+    def _defer_rows(self, rows):
+        """Puts claimed rows back as "retry_scheduled", due again after the next database poll."""
+        due_at = datetime.utcnow() + timedelta(seconds=self.poll_interval)
+        db.session.execute(update_stmt(MessageLog), [
+            {"id": row.id, "status": "retry_scheduled", "next_retry_at": due_at} for row in rows
+        ])
+        db.session.commit()
+        for row in rows:
+            self.schedule(row.id, due_at)
+
+    def _fail_rows(self, campaign_id, rows, reason):
+        db.session.execute(update_stmt(MessageLog), [
+            {"id": row.id, "status": "failed_on_send", "next_retry_at": None, "failure_reason": reason} for row in rows
+        ])
+        self._settle_recipients({row.id: "failed" for row in rows})
+        if campaign_id:
+            self._increment_counters({campaign_id: (0, len(rows))})
+        db.session.commit()
+        if campaign_id:
+            finalize_campaign_if_done(campaign_id)
+
+    @staticmethod
+    def _settle_recipients(states_by_log_id):
+        """Sets the state of the campaign recipients whose current attempt is the given MessageLog rows. Does not commit."""
+        recipients = db.session.execute(
+            select(CampaignRecipient.id, CampaignRecipient.message_log_id)
+            .where(CampaignRecipient.message_log_id.in_(list(states_by_log_id)))
+        ).all()
+        if recipients:
+            db.session.execute(update_stmt(CampaignRecipient), [
+                {"id": recipient_id, "state": states_by_log_id[log_id]} for recipient_id, log_id in recipients
+            ])
+
+    @staticmethod
+    def _increment_counters(counts_by_campaign):
+        """Adds (sent, failed) deltas to campaign counters in SQL and to live progress streams. Does not commit."""
+        for campaign_id, (sent, failed) in counts_by_campaign.items():
+            db.session.execute(
+                update_stmt(Campaign)
+                .where(Campaign.id == campaign_id)
+                .values(
+                    messages_sent_count=func.coalesce(Campaign.messages_sent_count, 0) + sent,
+                    messages_failed_count=func.coalesce(Campaign.messages_failed_count, 0) + failed
+                )
+                .execution_options(synchronize_session=False)
+            )
+            campaign_progress.record(campaign_id, messages_sent_count=sent, messages_failed_count=failed) # Every caller commits right after
+
+
+# Process-wide retry queue fed by the campaign dispatcher
+retry_queue = RetryQueue()
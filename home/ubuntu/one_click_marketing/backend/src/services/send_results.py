@@ -0,0 +1,154 @@
+# backend/src/services/send_results.py
+
+from ..models.user import db
+from ..models.campaign import Campaign
+from ..models.campaign_recipient import CampaignRecipient
+from .billing_service import CampaignBilling
+from .campaign_progress import campaign_progress
+from sqlalchemy import func
+from datetime import datetime, timedelta
+import logging
+import random
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+# Retry policy for transient Graph API failures
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5")) # Total attempts, including the first send
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "5"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "900"))
+
+# HTTP statuses worth retrying: throttling and server-side errors
+RETRYABLE_HTTP_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Meta error codes that are transient (see the WhatsApp Cloud API error code reference):
+# 1/2 API unknown/service, 4 app rate limit, 80007 WABA rate limit, 130429 throughput limit,
+# 131000 something went wrong, 131016 service unavailable, 131048 spam rate limit,
+# 131056 pair rate limit, 133004 server temporarily unavailable
+RETRYABLE_META_ERROR_CODES = {1, 2, 4, 80007, 130429, 131000, 131016, 131048, 131056, 133004}
+
+# Recipient states that still need work before a campaign can be marked as finished. "unconfirmed" (no
+# response to the send, so Meta may have accepted it) is settled: it is never sent again, and the message's
+# status webhook, if one arrives, turns it into "sent" or "failed".
+UNSETTLED_RECIPIENT_STATES = ("pending", "sending", "retrying")
+
+
+def parse_meta_error(api_response):
+    """
+    Extracts (error_code, error_message) from an error returned by WhatsAppService.
+    The service returns Meta's response body as text in "details"; its JSON has the shape
+    {"error": {"code": 131000, "message": "..."}}.
+    """
+    if not api_response:
+        return None, "No response from WhatsApp service"
+    error = api_response.get("error")
+    if isinstance(error, dict): # Already-parsed Meta error
+        return error.get("code"), error.get("message")
+    details = api_response.get("details")
+    try:
+        meta_error = json.loads(details).get("error", {}) if details else {}
+    except (TypeError, ValueError, AttributeError):
+        meta_error = {}
+    if isinstance(meta_error, dict) and meta_error:
+        return meta_error.get("code"), meta_error.get("message") or str(error)
+    return None, str(details or error or "Unknown API error")
+
+
+def is_send_success(api_response):
+    return bool(api_response and "error" not in api_response and api_response.get("messages"))
+
+
+def classify_send_result(api_response):
+    """
+    Returns:
+        str: "sent", "retryable" (throttling, 5xx, connection failures, transient Meta codes), "unknown" (the
+        request was sent but got no response, e.g. a read timeout: Meta may have accepted the message, so
+        sending it again could deliver and bill it twice) or "permanent".
+    """
+    if is_send_success(api_response):
+        return "sent"
+    if not api_response:
+        return "retryable"
+    if api_response.get("delivery_unknown"):
+        return "unknown"
+    error_code, _ = parse_meta_error(api_response)
+    if error_code in RETRYABLE_META_ERROR_CODES:
+        return "retryable"
+    status_code = api_response.get("status_code")
+    if status_code is None or status_code in RETRYABLE_HTTP_STATUSES:
+        return "retryable" # No status code means the request never reached the Graph API (connection error)
+    return "permanent"
+
+
+def failure_reason_for(api_response):
+    error_code, error_message = parse_meta_error(api_response)
+    return f"[{error_code}] {error_message}" if error_code else error_message
+
+
+def compute_backoff_seconds(attempt):
+    """Exponential backoff with jitter for the given (1-based) attempt that just failed."""
+    delay = min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1)))
+    return random.uniform(delay / 2, delay) # "Equal jitter": spreads retries without collapsing the delay to zero
+
+
+def build_send_outcome(log_id, attempt, api_response, now=None):
+    """
+    Turns one Graph API response into the MessageLog update and CampaignRecipient state to record.
+    Args:
+        log_id (int): The MessageLog row of the attempt.
+        attempt (int): 1-based number of this attempt.
+        api_response (dict): What WhatsAppService returned for the message.
+    Returns:
+        tuple: (log update dict for a bulk UPDATE, recipient state, retry due datetime or None). The recipient
+        state is "sent", "retrying", "failed" or "unconfirmed" (left for the status webhook to settle).
+    """
+    now = now or datetime.utcnow()
+    update = {"id": log_id, "whatsapp_message_id": None, "attempt_count": attempt, "next_retry_at": None, "failure_reason": None}
+    outcome = classify_send_result(api_response)
+    if outcome == "sent":
+        update["whatsapp_message_id"] = api_response.get("messages", [{}])[0].get("id")
+        update["status"] = "sent_to_whatsapp" # Will be updated by webhook later
+        return update, "sent", None
+
+    update["failure_reason"] = failure_reason_for(api_response)
+    if outcome == "unknown":
+        update["status"] = "send_unknown" # Matched to its status webhook by recipient (see webhook_queue)
+        return update, "unconfirmed", None
+    if outcome == "retryable" and attempt < RETRY_MAX_ATTEMPTS:
+        due_at = now + timedelta(seconds=compute_backoff_seconds(attempt))
+        update["status"] = "retry_scheduled"
+        update["next_retry_at"] = due_at
+        return update, "retrying", due_at
+
+    update["status"] = "failed_on_send"
+    return update, "failed", None
+
+
+def finalize_campaign_if_done(campaign_id):
+    """
+    Moves a SENDING campaign to its final status once none of its recipients are pending, in flight
+    or waiting for a retry. Commits.
+    Returns:
+        bool: True if the campaign was finalized.
+    """
+    camp = Campaign.query.get(campaign_id)
+    if not camp or camp.status != "SENDING":
+        return False
+    unsettled = db.session.query(func.count(CampaignRecipient.id)).filter(
+        CampaignRecipient.campaign_id == campaign_id,
+        CampaignRecipient.state.in_(UNSETTLED_RECIPIENT_STATES)
+    ).scalar()
+    if unsettled:
+        return False
+
+    sent_count = camp.messages_sent_count or 0
+    failed_count = camp.messages_failed_count or 0 # Initial failed count, webhooks might update this
+    camp.status = "COMPLETED" if failed_count == 0 else "PARTIALLY_COMPLETED"
+    if sent_count == 0 and failed_count > 0:
+        camp.status = "FAILED"
+    db.session.commit()
+    campaign_progress.record(campaign_id, status=camp.status)
+    logger.info(f"Campaign {campaign_id} processing finished. Sent: {sent_count}, Failed: {failed_count}")
+    CampaignBilling.settle(campaign_id, release=True) # Final charge; unused funds go back to the wallet
+    return True
@@ -0,0 +1,171 @@
+# backend/src/services/sender_health.py
+
+from .send_results import classify_send_result, parse_meta_error, failure_reason_for
+from datetime import datetime
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# A sender's circuit opens after this many consecutive sender-level failures (authorization errors, or network
+# errors, timeouts and 5xx responses from the Graph API) with no successful send in between, or after
+# SENDER_BREAKER_AUTH_FAILURE_THRESHOLD consecutive authorization errors (expired token, revoked permission,
+# blocked number), which no other recipient will get past either. Errors about one recipient (invalid or
+# unreachable number, re-engagement window) and throttling don't count: they say nothing about the sender. While open, sends to the
+# sender fail fast without calling Meta; after SENDER_BREAKER_OPEN_SECONDS one probe request is let through.
+SENDER_BREAKER_FAILURE_THRESHOLD = int(os.getenv("SENDER_BREAKER_FAILURE_THRESHOLD", "25"))
+SENDER_BREAKER_AUTH_FAILURE_THRESHOLD = int(os.getenv("SENDER_BREAKER_AUTH_FAILURE_THRESHOLD", "3"))
+SENDER_BREAKER_OPEN_SECONDS = float(os.getenv("SENDER_BREAKER_OPEN_SECONDS", "300"))
+
+# Meta error codes that concern the sender rather than the recipient (see the Cloud API error code reference):
+# 0 AuthException, 3 capability, 10 permission denied, 190 access token expired/invalid, 200-299 permissions,
+# 368 temporarily blocked for policy violations, 131005 access denied, 131031 account locked,
+# 131042 business eligibility payment issue, 131045 incorrect certificate, 133010 phone number not registered
+SENDER_ERROR_CODES = {0, 3, 10, 190, 368, 131005, 131031, 131042, 131045, 133010}
+SENDER_ERROR_HTTP_STATUSES = {401, 403}
+
+
+def is_sender_error(api_response):
+    """True if a failed send was rejected because of the sender's credentials or standing."""
+    if not api_response:
+        return False
+    if api_response.get("status_code") in SENDER_ERROR_HTTP_STATUSES:
+        return True
+    error_code, _ = parse_meta_error(api_response)
+    return isinstance(error_code, int) and (error_code in SENDER_ERROR_CODES or 200 <= error_code <= 299)
+
+
+def is_breaker_failure(api_response):
+    """True if a failed send counts towards the sender's circuit: a sender error, or the Graph API being unreachable or failing."""
+    if is_sender_error(api_response):
+        return True
+    if classify_send_result(api_response) == "sent":
+        return False
+    status_code = api_response.get("status_code") if api_response else None
+    return status_code is None or status_code >= 500
+
+
+class _SenderCircuit:
+    __slots__ = ("state", "consecutive_failures", "consecutive_sender_errors", "last_error", "opened_at", "retry_at", "probe_in_flight")
+
+    def __init__(self):
+        self.state = "closed" # closed, open, half_open
+        self.consecutive_failures = 0
+        self.consecutive_sender_errors = 0
+        self.last_error = None
+        self.opened_at = None # datetime, for display
+        self.retry_at = None # time.monotonic() after which a probe is let through
+        self.probe_in_flight = False
+
+
+class SenderCircuitBreaker:
+    """
+    Process-wide circuit breakers keyed by the Meta phone_number_id, fed with every send result by WhatsAppService.
+
+    Only failures that concern the sender count here (see `is_breaker_failure`): recipient-level errors are the
+    recipient's problem, and throttling is left to the rate limiter. Campaigns pause while their sender's circuit is open, the retry queue holds their
+    retries, and single sends are answered with a 503 without calling Meta.
+    """
+
+    def __init__(self, failure_threshold=SENDER_BREAKER_FAILURE_THRESHOLD,
+                 sender_error_threshold=SENDER_BREAKER_AUTH_FAILURE_THRESHOLD, open_seconds=SENDER_BREAKER_OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.sender_error_threshold = sender_error_threshold
+        self.open_seconds = open_seconds
+        self._circuits = {} # phone_number_id -> _SenderCircuit
+        self._lock = threading.Lock()
+
+    def allow(self, phone_number_id):
+        """
+        Returns True if a request may be sent. Once an open circuit's wait is over, exactly one caller
+        gets True (the probe); the probe's result, passed to `record`, closes or re-opens the circuit.
+        """
+        with self._lock:
+            circuit = self._circuits.get(phone_number_id)
+            if circuit is None or circuit.state == "closed":
+                return True
+            if circuit.state == "open":
+                if time.monotonic() < circuit.retry_at:
+                    return False
+                circuit.state = "half_open"
+                circuit.probe_in_flight = False
+            if circuit.probe_in_flight:
+                return False
+            circuit.probe_in_flight = True
+            return True
+
+    def record(self, phone_number_id, api_response):
+        """Counts the result of a request let through by `allow`."""
+        outcome = classify_send_result(api_response)
+        failure = is_breaker_failure(api_response)
+        with self._lock:
+            circuit = self._circuits.get(phone_number_id)
+            if circuit is None:
+                if not failure:
+                    return # Healthy senders have no entry
+                circuit = self._circuits[phone_number_id] = _SenderCircuit()
+            circuit.probe_in_flight = False # A throttled probe lets the next request probe again
+            if outcome == "sent" or (outcome == "permanent" and not failure and circuit.state == "half_open"):
+                # A probe rejected because of its recipient still shows the sender is accepted again
+                if circuit.state != "closed":
+                    logger.info(f"Sender {phone_number_id} is sending again; circuit closed")
+                del self._circuits[phone_number_id]
+                return
+            if not failure:
+                return
+            circuit.consecutive_failures += 1
+            circuit.consecutive_sender_errors = circuit.consecutive_sender_errors + 1 if is_sender_error(api_response) else 0
+            circuit.last_error = failure_reason_for(api_response)
+            if circuit.state == "half_open" or (circuit.state == "closed" and (
+                    circuit.consecutive_sender_errors >= self.sender_error_threshold
+                    or circuit.consecutive_failures >= self.failure_threshold)):
+                circuit.state = "open"
+                circuit.opened_at = datetime.utcnow()
+                circuit.retry_at = time.monotonic() + self.open_seconds
+                logger.warning(f"Sender {phone_number_id} circuit opened after {circuit.consecutive_failures} consecutive sender-level failures "
+                               f"(last: {circuit.last_error}); sends fail fast for {self.open_seconds:.0f}s")
+
+    def is_open(self, phone_number_id):
+        """True while the sender's circuit is open and its probe isn't due yet."""
+        with self._lock:
+            circuit = self._circuits.get(phone_number_id)
+            return bool(circuit and circuit.state == "open" and time.monotonic() < circuit.retry_at)
+
+    def reset(self, phone_number_id):
+        """Closes a sender's circuit, e.g. after its credentials were replaced."""
+        with self._lock:
+            self._circuits.pop(phone_number_id, None)
+
+    def open_error(self, phone_number_id):
+        """The result returned instead of calling Meta while the circuit is open (retryable: status 503)."""
+        with self._lock:
+            circuit = self._circuits.get(phone_number_id)
+            last_error = circuit.last_error if circuit else None
+        return {
+            "error": f"Sender {phone_number_id} is paused after repeated sender-level failures (authorization or account errors, or the Graph API being unreachable or failing)",
+            "status_code": 503,
+            "details": last_error or "Sender circuit open",
+            "circuit_open": True
+        }
+
+    def health(self, phone_number_id):
+        """Returns the sender's circuit state for display."""
+        with self._lock:
+            circuit = self._circuits.get(phone_number_id)
+            if circuit is None:
+                return {"phone_number_id": phone_number_id, "state": "closed", "consecutive_failures": 0, "last_error": None,
+                        "opened_at": None, "retry_in_seconds": None}
+            return {
+                "phone_number_id": phone_number_id,
+                "state": circuit.state,
+                "consecutive_failures": circuit.consecutive_failures,
+                "last_error": circuit.last_error,
+                "opened_at": circuit.opened_at.isoformat() if circuit.opened_at else None,
+                "retry_in_seconds": round(max(0.0, circuit.retry_at - time.monotonic()), 1) if circuit.state == "open" else None
+            }
+
+
+# Shared by every WhatsAppService instance in this process
+sender_circuit_breaker = SenderCircuitBreaker()
@@ -0,0 +1,160 @@
+# backend/src/services/suppression_service.py
+
+from ..models.user import db
+from ..models.suppressed_number import SuppressedNumber
+from .audience_service import normalize_phone_number
+from sqlalchemy import insert, select, delete
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# How long a client's in-memory suppression set is trusted before it is reloaded from the table.
+# Changes made through this process apply immediately; the reload picks up changes from other instances.
+SUPPRESSION_INDEX_TTL_SECONDS = int(os.getenv("SUPPRESSION_INDEX_TTL_SECONDS", "60"))
+
+# Inbound replies (whole message, case-insensitive) that opt the sender out of / back into messages
+OPT_OUT_KEYWORDS = {keyword.strip().upper() for keyword in os.getenv(
+    "OPT_OUT_KEYWORDS", "STOP,STOPALL,UNSUBSCRIBE,CANCEL,END,QUIT,OPT OUT,OPTOUT").split(",") if keyword.strip()}
+OPT_IN_KEYWORDS = {keyword.strip().upper() for keyword in os.getenv(
+    "OPT_IN_KEYWORDS", "START,UNSTOP,SUBSCRIBE").split(",") if keyword.strip()}
+
+
+def _number_key(phone_number):
+    """E.164 digits as an int: a much smaller set entry than the string, and format-independent."""
+    normalized = normalize_phone_number(phone_number)
+    return int(normalized[1:]) if normalized else None
+
+
+def match_keyword(text):
+    """Returns "opt_out", "opt_in" or None for an inbound text message."""
+    keyword = " ".join(str(text or "").split()).upper().strip(".!")
+    if keyword in OPT_OUT_KEYWORDS:
+        return "opt_out"
+    if keyword in OPT_IN_KEYWORDS:
+        return "opt_in"
+    return None
+
+
+class SuppressionIndex:
+    """
+    Per-client hash sets of suppressed numbers, loaded from the suppressed_numbers table with one query
+    the first time a client is checked. Membership checks at send time never hit the database.
+    """
+
+    def __init__(self, ttl_seconds=SUPPRESSION_INDEX_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._numbers_by_client = {} # client_id -> (loaded_at, set of int keys)
+        self._lock = threading.Lock()
+
+    def _numbers_for(self, client_id):
+        with self._lock:
+            entry = self._numbers_by_client.get(client_id)
+        if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+            return entry[1]
+        numbers = set()
+        for (phone_number,) in db.session.execute(select(SuppressedNumber.phone_number).where(SuppressedNumber.client_id == client_id)):
+            key = _number_key(phone_number)
+            if key is not None:
+                numbers.add(key)
+        with self._lock:
+            self._numbers_by_client[client_id] = (time.monotonic(), numbers)
+        return numbers
+
+    def is_suppressed(self, client_id, phone_number):
+        key = _number_key(phone_number)
+        return key is not None and key in self._numbers_for(client_id)
+
+    def suppressed_among(self, client_id, phone_numbers):
+        """Returns the subset of `phone_numbers` (as given) that the client must not message."""
+        numbers = self._numbers_for(client_id)
+        if not numbers:
+            return set()
+        return {phone for phone in phone_numbers if _number_key(phone) in numbers}
+
+    @staticmethod
+    def _insert_ignoring_duplicates(rows):
+        """
+        Inserts suppression rows, skipping numbers already on the client's list: another request or webhook
+        consumer may have added the same number (e.g. the same STOP delivered twice) since it was checked.
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect == "mysql":
+            stmt = mysql_insert(SuppressedNumber)
+            stmt = stmt.on_duplicate_key_update(phone_number=stmt.inserted.phone_number) # No-op: keep the existing row
+        elif dialect == "sqlite":
+            stmt = sqlite_insert(SuppressedNumber).on_conflict_do_nothing()
+        else:
+            stmt = insert(SuppressedNumber)
+        db.session.execute(stmt, rows)
+
+    def add(self, client_id, phone_numbers, reason="manual", notes=None, commit=True):
+        """
+        Suppresses numbers for a client; numbers already on the list are left unchanged. Commits, unless
+        commit=False: the caller then commits with its own changes and calls `remember` afterwards.
+        Returns:
+            tuple: (list of E.164 numbers added, list of inputs that aren't valid phone numbers)
+        """
+        normalized, invalid = [], []
+        for phone in phone_numbers:
+            number = normalize_phone_number(phone)
+            if number:
+                normalized.append(number)
+            else:
+                invalid.append(phone)
+        normalized = list(dict.fromkeys(normalized))
+        if not normalized:
+            return [], invalid
+
+        existing = {phone for (phone,) in db.session.execute(
+            select(SuppressedNumber.phone_number)
+            .where(SuppressedNumber.client_id == client_id, SuppressedNumber.phone_number.in_(normalized))
+        )}
+        added = [phone for phone in normalized if phone not in existing]
+        if added:
+            self._insert_ignoring_duplicates([
+                {"client_id": client_id, "phone_number": phone, "reason": reason, "notes": notes} for phone in added
+            ])
+        if commit:
+            db.session.commit()
+            self.remember(client_id, normalized)
+        return added, invalid
+
+    def remember(self, client_id, phone_numbers):
+        """Adds committed suppressions to the client's in-memory set."""
+        keys = {key for key in (_number_key(phone) for phone in phone_numbers) if key is not None}
+        numbers = self._numbers_for(client_id)
+        with self._lock:
+            numbers.update(keys)
+
+    def forget(self, client_id):
+        """Drops the client's in-memory set after committed removals; it is reloaded on the next check."""
+        with self._lock:
+            self._numbers_by_client.pop(client_id, None)
+
+    def remove(self, client_id, phone_numbers, reason=None, commit=True):
+        """
+        Lifts suppression for numbers (only entries with the given reason, if one is passed). Commits, unless
+        commit=False: the caller then commits with its own changes and calls `forget` afterwards.
+        Returns:
+            int: Number of entries removed.
+        """
+        normalized = [number for number in (normalize_phone_number(phone) for phone in phone_numbers) if number]
+        if not normalized:
+            return 0
+        stmt = delete(SuppressedNumber).where(SuppressedNumber.client_id == client_id, SuppressedNumber.phone_number.in_(normalized))
+        if reason:
+            stmt = stmt.where(SuppressedNumber.reason == reason)
+        removed = db.session.execute(stmt).rowcount
+        if commit:
+            db.session.commit()
+            self.forget(client_id) # Reload on next check; some numbers may have been kept
+        return removed
+
+
+# Process-wide index used by the campaign send path, the messaging routes and the webhook
+suppression_index = SuppressionIndex()
@@ -0,0 +1,184 @@
+# backend/src/services/template_renderer.py
+
+from collections import OrderedDict
+import threading
+import logging
+import json
+import re
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_RE = re.compile(r"\{\{\s*(\d+)\s*\}\}")
+
+# Media header formats and the parameter type Meta expects for each
+MEDIA_HEADER_FORMATS = {"IMAGE": "image", "VIDEO": "video", "DOCUMENT": "document"}
+
+# Compiled templates kept in memory (least recently used are evicted first)
+TEMPLATE_CACHE_SIZE = 512
+
+
+def _placeholder_count(text):
+    """
+    Number of parameters a text needs: its distinct {{n}} placeholders ("Hi {{1}}, {{1}}" needs one).
+    Counting distinct indexes works for both Meta's per-component numbering and templates numbered
+    across components (header "{{1}}", body "{{2}}").
+    """
+    if not isinstance(text, str):
+        return 0
+    return len(set(PLACEHOLDER_RE.findall(text)))
+
+
+class CompiledTemplate:
+    """
+    A MessageTemplate turned into a list of component slots once, so that rendering a recipient
+    only fills in parameter values.
+
+    Variables from variables_expected_json are assigned to placeholders in template order:
+    header first, then body, then buttons (URL / quick reply / copy code) in their listed order.
+    Templates whose structure has no placeholders keep the original behaviour of sending every
+    expected variable as a body parameter.
+    """
+
+    def __init__(self, template_structure, variables_expected):
+        self.variables_expected = list(variables_expected or [])
+        self.header_media = None # (parameter type, {"link": ...} or {"id": ...}) for media headers
+        self._slots = [] # (kind, extra, [variable keys])
+        self._compile(template_structure or {})
+
+    @staticmethod
+    def _normalize_structure(structure):
+        """Accepts both our {"header": ..., "body": ..., "buttons": [...]} shape and Meta's list of components."""
+        if isinstance(structure, list):
+            normalized = {}
+            for component in structure:
+                if not isinstance(component, dict):
+                    continue
+                component_type = str(component.get("type", "")).upper()
+                if component_type == "HEADER":
+                    normalized["header"] = component
+                elif component_type == "BODY":
+                    normalized["body"] = component
+                elif component_type == "BUTTONS":
+                    normalized["buttons"] = component.get("buttons", [])
+            return normalized
+        return structure if isinstance(structure, dict) else {}
+
+    def _compile(self, structure):
+        structure = self._normalize_structure(structure)
+        header = structure.get("header") or {}
+        body = structure.get("body") or {}
+        buttons = structure.get("buttons") or []
+
+        # (kind, extra, placeholder count) in the order variables are consumed
+        layout = []
+        header_format = str(header.get("format") or header.get("type") or "TEXT").upper()
+        if header_format in MEDIA_HEADER_FORMATS:
+            media_type = MEDIA_HEADER_FORMATS[header_format]
+            link = header.get("media_url") or header.get("link")
+            if link:
+                self.header_media = (media_type, {"link": link})
+            else:
+                # Media supplied per recipient through a variable (a URL)
+                layout.append(("header_media", media_type, 1))
+        elif header:
+            layout.append(("header_text", None, _placeholder_count(header.get("text"))))
+
+        body_text = body.get("text") if isinstance(body, dict) else body
+        layout.append(("body", None, _placeholder_count(body_text)))
+
+        for index, button in enumerate(buttons):
+            if not isinstance(button, dict):
+                continue
+            button_type = str(button.get("type", "")).upper()
+            if button_type == "URL":
+                layout.append(("button_url", index, _placeholder_count(button.get("url"))))
+            elif button_type == "QUICK_REPLY":
+                layout.append(("button_quick_reply", index, _placeholder_count(button.get("payload"))))
+            elif button_type == "COPY_CODE":
+                layout.append(("button_copy_code", index, 1))
+
+        total_placeholders = sum(count for kind, _, count in layout if kind != "header_media")
+        if total_placeholders == 0 and not any(kind == "header_media" for kind, _, _ in layout):
+            # No placeholders found in the structure: all variables go to the body, as before
+            if self.variables_expected:
+                self._slots.append(("body", None, self.variables_expected))
+            return
+
+        position = 0
+        for kind, extra, count in layout:
+            if count == 0:
+                continue
+            keys = self.variables_expected[position:position + count]
+            keys += [None] * (count - len(keys)) # Missing variables render as empty strings
+            position += count
+            self._slots.append((kind, extra, keys))
+        if position != len(self.variables_expected):
+            logger.warning(f"Template expects {len(self.variables_expected)} variables but its structure has {position} placeholders")
+
+    def render(self, variables, header_media=None):
+        """
+        Builds the `components` list for one recipient.
+        Args:
+            variables (dict): The recipient's personalization values, keyed like variables_expected_json.
+            header_media (tuple, optional): (type, {"id": ...} or {"link": ...}) overriding the template's static media header.
+        Returns:
+            list: Components for WhatsAppService.send_template_message (empty if the template takes no parameters).
+        """
+        components = []
+        header_media = header_media or self.header_media
+        if header_media:
+            media_type, media_ref = header_media
+            components.append({"type": "header", "parameters": [{"type": media_type, media_type: media_ref}]})
+
+        for kind, extra, keys in self._slots:
+            values = [str(variables.get(key, "")) if key is not None else "" for key in keys] # Default to empty string if var not found
+            if kind == "body":
+                components.append({"type": "body", "parameters": [{"type": "text", "text": value} for value in values]})
+            elif kind == "header_text":
+                components.append({"type": "header", "parameters": [{"type": "text", "text": value} for value in values]})
+            elif kind == "header_media":
+                components.append({"type": "header", "parameters": [{"type": extra, extra: {"link": values[0]}}]})
+            elif kind == "button_url":
+                components.append({"type": "button", "sub_type": "url", "index": str(extra),
+                                   "parameters": [{"type": "text", "text": value} for value in values]})
+            elif kind == "button_quick_reply":
+                components.append({"type": "button", "sub_type": "quick_reply", "index": str(extra),
+                                   "parameters": [{"type": "payload", "payload": value} for value in values]})
+            elif kind == "button_copy_code":
+                components.append({"type": "button", "sub_type": "copy_code", "index": str(extra),
+                                   "parameters": [{"type": "coupon_code", "coupon_code": values[0]}]})
+        return components
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def get_compiled_template(template):
+    """
+    Returns the CompiledTemplate for a MessageTemplate, compiling it on first use.
+    Entries are keyed by template id and invalidated whenever the template's updated_at changes.
+    Raises:
+        ValueError: If template_structure_json or variables_expected_json is not valid JSON.
+    """
+    cache_key = template.id
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+        if cached and cached[0] == template.updated_at:
+            _cache.move_to_end(cache_key)
+            return cached[1]
+
+    try:
+        structure = json.loads(template.template_structure_json) if template.template_structure_json else {}
+    except json.JSONDecodeError:
+        structure = {} # Free-text structures can't be compiled; fall back to body-only variables
+    variables_expected = json.loads(template.variables_expected_json or "[]")
+    if not isinstance(variables_expected, list):
+        raise ValueError("variables_expected_json must be a JSON array")
+    compiled = CompiledTemplate(structure, variables_expected)
+
+    with _cache_lock:
+        _cache[cache_key] = (template.updated_at, compiled)
+        _cache.move_to_end(cache_key)
+        while len(_cache) > TEMPLATE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
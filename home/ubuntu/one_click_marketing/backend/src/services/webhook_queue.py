@@ -0,0 +1,458 @@
+# backend/src/services/webhook_queue.py
+
+from ..models.user import ClientProfile, db
+from ..models.message_log import MessageLog
+from ..models.campaign import Campaign
+from ..models.campaign_recipient import CampaignRecipient
+from ..models.webhook_event import WebhookEvent
+from .suppression_service import suppression_index, match_keyword
+from .campaign_progress import campaign_progress
+from .billing_service import CampaignBilling
+from ..logging_config import SummaryLog, RateLimitedLog
+from sqlalchemy import insert, select, delete, func, or_, and_, update as update_stmt
+from collections import defaultdict
+from datetime import datetime, timedelta
+import threading
+import logging
+import socket
+import json
+import time
+import uuid
+import os
+
+logger = logging.getLogger(__name__)
+# Webhook events are summarized (one line per LOG_SUMMARY_EVERY) instead of logged one by one
+webhook_summary = SummaryLog(logger, "whatsapp_webhook")
+webhook_warnings = RateLimitedLog(logger)
+
+# Consumer threads per instance, and webhook payloads each claims and applies in one transaction
+WEBHOOK_CONSUMER_WORKERS = int(os.getenv("WEBHOOK_CONSUMER_WORKERS", "2"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "200"))
+
+# Payloads appended by this instance wake its consumers at once; this interval picks up those of other instances
+WEBHOOK_POLL_INTERVAL_SECONDS = float(os.getenv("WEBHOOK_POLL_INTERVAL_SECONDS", "2"))
+
+# A claim older than this (its consumer died) is taken over; a payload failing this many times is set aside as "failed"
+WEBHOOK_CLAIM_TIMEOUT_SECONDS = int(os.getenv("WEBHOOK_CLAIM_TIMEOUT_SECONDS", "300"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+
+# Processed payloads are kept this long (for inspection), then purged
+WEBHOOK_EVENT_RETENTION_HOURS = float(os.getenv("WEBHOOK_EVENT_RETENTION_HOURS", "24"))
+
+
+def apply_webhook_payloads(payloads):
+    """
+    Applies WhatsApp webhook payloads, in order: message status updates, incoming messages and the opt-outs /
+    opt-ins they carry, so all of it is committed together with the events being marked done.
+    The message logs of all status updates are loaded with one query. Does not commit.
+    Returns:
+        tuple: (keyword replies, {campaign_id: [newly delivered, newly read]},
+        {campaign_id: [newly sent, newly failed]}) for `after_webhook_commit`.
+    """
+    keyword_replies = [] # (client_id, phone, "opt_out" / "opt_in", text)
+    receipts_by_campaign = defaultdict(lambda: [0, 0]) # campaign_id -> [newly delivered, newly read]
+    confirmed_by_campaign = defaultdict(lambda: [0, 0]) # campaign_id -> [newly sent, newly failed] unconfirmed sends
+    confirmed_recipients = {} # MessageLog id -> recipient state, for unconfirmed campaign sends
+
+    # Map each entry to the client owning the WABA (entry.id is the WABA ID)
+    client_ids_by_waba = {}
+    changes = [] # (client_id, change value)
+    for data in payloads:
+        if not isinstance(data, dict) or data.get("object") != "whatsapp_business_account":
+            continue
+        logger.debug("Applying WhatsApp webhook: %s", data)
+        for entry in data.get("entry", []):
+            client_waba_id = entry.get("id")
+            if client_waba_id not in client_ids_by_waba:
+                client_ids_by_waba[client_waba_id] = db.session.execute(
+                    select(ClientProfile.user_id).where(ClientProfile.meta_waba_id == client_waba_id)
+                ).scalars().first()
+            client_id = client_ids_by_waba[client_waba_id]
+            if client_id is None:
+                webhook_warnings.warning("unknown_waba", "No client profile found for WABA ID: %s. Skipping webhook processing.", client_waba_id)
+                continue
+            for change in entry.get("changes", []):
+                changes.append((client_id, change.get("value", {})))
+
+    message_ids = {status_update.get("id") for _, value in changes for status_update in value.get("statuses") or [] if status_update.get("id")}
+    logs_by_message = {}
+    if message_ids:
+        for msg_log in MessageLog.query.filter(MessageLog.whatsapp_message_id.in_(message_ids)):
+            logs_by_message[(msg_log.whatsapp_message_id, msg_log.client_id)] = msg_log
+    unconfirmed_by_recipient = _load_unconfirmed_logs(changes, logs_by_message)
+
+    for client_id, value in changes:
+        metadata = value.get("metadata", {})
+        sender_phone_number_id_from_meta = metadata.get("phone_number_id") # This is the app's sending number ID
+
+        # Handle message status updates
+        for status_update in value.get("statuses") or []:
+            whatsapp_msg_id = status_update.get("id")
+            status = status_update.get("status")
+            timestamp = datetime.fromtimestamp(int(status_update.get("timestamp")))
+
+            msg_log = logs_by_message.get((whatsapp_msg_id, client_id))
+            candidates = unconfirmed_by_recipient.get((client_id, str(status_update.get("recipient_id") or "").lstrip("+")))
+            if not msg_log and whatsapp_msg_id and candidates:
+                # A send that got no response: its first status update tells whether Meta accepted it
+                msg_log = candidates.pop(0)
+                msg_log.whatsapp_message_id = whatsapp_msg_id
+                logs_by_message[(whatsapp_msg_id, client_id)] = msg_log
+                if msg_log.campaign_id:
+                    state = "failed" if status == "failed" else "sent"
+                    confirmed_recipients[msg_log.id] = state
+                    confirmed_by_campaign[msg_log.campaign_id][0 if state == "sent" else 1] += 1
+                webhook_summary.record("unconfirmed_send_matched")
+            webhook_summary.record(f"status_{status}" if msg_log else "status_unknown_message")
+            if not msg_log:
+                webhook_warnings.warning("unknown_message", "MessageLog not found for status update. WhatsApp ID: %s, Client ID: %s", whatsapp_msg_id, client_id)
+                continue
+            previous_status = msg_log.status
+            if msg_log.campaign_id and status in ("delivered", "read"):
+                # Each message counts once towards a campaign's delivered / read totals, whatever the
+                # order or repetition of its receipts (a "read" implies delivery)
+                receipts = receipts_by_campaign[msg_log.campaign_id]
+                if previous_status not in ("delivered", "read"):
+                    receipts[0] += 1
+                if status == "read" and previous_status != "read":
+                    receipts[1] += 1
+            # A late receipt must not move a read message backwards (its timestamp is still recorded)
+            msg_log.status = previous_status if previous_status == "read" and status in ("sent", "delivered") else status
+            msg_log.status_updated_at = datetime.utcnow()
+            if status == "sent":
+                msg_log.sent_at = timestamp
+            elif status == "delivered":
+                msg_log.delivered_at = timestamp
+            elif status == "read":
+                msg_log.read_at = timestamp
+            elif status == "failed":
+                msg_log.failure_reason = status_update.get("errors", [{}])[0].get("title", "Unknown error")
+
+        # Handle incoming messages
+        incoming_rows = []
+        for message_data in value.get("messages") or []:
+            from_phone = message_data.get("from")
+            msg_type = message_data.get("type")
+            content = None
+
+            if msg_type == "text":
+                content = message_data.get("text", {}).get("body")
+                keyword = match_keyword(content)
+                if keyword:
+                    keyword_replies.append((client_id, from_phone, keyword, content))
+            elif msg_type == "image":
+                content = f"Image received (ID: {message_data.get('image',{}).get('id')})" # Store ID or caption
+            # Add more types as needed (audio, video, document, location, contacts, interactive)
+            else:
+                content = f"Unsupported message type: {msg_type}"
+
+            if content:
+                incoming_rows.append({
+                    "client_id": client_id,
+                    "whatsapp_message_id": message_data.get("id"),
+                    "recipient_phone_number": sender_phone_number_id_from_meta, # The app's number received the message
+                    "sender_phone_number_id": from_phone, # The user who sent the message
+                    "message_type": f"incoming_{msg_type}",
+                    "direction": "incoming",
+                    "incoming_message_content": content,
+                    "status": "received", # Or map to a specific incoming status
+                    "created_at": datetime.fromtimestamp(int(message_data.get("timestamp"))), # Use WhatsApp timestamp for creation
+                    "status_updated_at": datetime.utcnow()
+                })
+                webhook_summary.record("incoming")
+        if incoming_rows:
+            db.session.execute(insert(MessageLog), incoming_rows)
+
+    for campaign_id in set(receipts_by_campaign) | set(confirmed_by_campaign):
+        delivered, read = receipts_by_campaign.get(campaign_id, (0, 0))
+        sent, failed = confirmed_by_campaign.get(campaign_id, (0, 0))
+        db.session.execute(
+            update_stmt(Campaign)
+            .where(Campaign.id == campaign_id)
+            .values(
+                messages_sent_count=func.coalesce(Campaign.messages_sent_count, 0) + sent,
+                messages_failed_count=func.coalesce(Campaign.messages_failed_count, 0) + failed,
+                messages_delivered_count=func.coalesce(Campaign.messages_delivered_count, 0) + delivered,
+                messages_read_count=func.coalesce(Campaign.messages_read_count, 0) + read
+            )
+            .execution_options(synchronize_session=False)
+        )
+    for state in ("sent", "failed"):
+        log_ids = [log_id for log_id, recipient_state in confirmed_recipients.items() if recipient_state == state]
+        if log_ids:
+            db.session.execute(
+                update_stmt(CampaignRecipient)
+                .where(CampaignRecipient.message_log_id.in_(log_ids), CampaignRecipient.state == "unconfirmed")
+                .values(state=state)
+                .execution_options(synchronize_session=False)
+            )
+
+    for client_id, from_phone, keyword, content in keyword_replies:
+        if keyword == "opt_out":
+            suppression_index.add(client_id, [from_phone], reason="opt_out_keyword", notes=f"Replied: {content}", commit=False)
+        else:
+            # Only lifts opt-outs the recipient made themselves; numbers suppressed by the client stay suppressed
+            suppression_index.remove(client_id, [from_phone], reason="opt_out_keyword", commit=False)
+    return keyword_replies, dict(receipts_by_campaign), dict(confirmed_by_campaign)
+
+
+def _load_unconfirmed_logs(changes, logs_by_message):
+    """
+    Loads the "send_unknown" message logs (sends that got no response, so have no WhatsApp ID) of the
+    recipients of status updates matching no known message.
+    Returns:
+        dict: {(client_id, recipient number without "+"): [MessageLog, ...] oldest first}
+    """
+    wanted = set()
+    for client_id, value in changes:
+        for status_update in value.get("statuses") or []:
+            recipient_id = str(status_update.get("recipient_id") or "").lstrip("+")
+            if recipient_id and (status_update.get("id"), client_id) not in logs_by_message:
+                wanted.add((client_id, recipient_id))
+    unconfirmed = defaultdict(list)
+    if not wanted:
+        return unconfirmed
+    phone_numbers = {number for _, digits in wanted for number in (digits, "+" + digits)}
+    for msg_log in MessageLog.query.filter(
+            MessageLog.status == "send_unknown",
+            MessageLog.whatsapp_message_id.is_(None),
+            MessageLog.client_id.in_({client_id for client_id, _ in wanted}),
+            MessageLog.recipient_phone_number.in_(phone_numbers)).order_by(MessageLog.id):
+        unconfirmed[(msg_log.client_id, msg_log.recipient_phone_number.lstrip("+"))].append(msg_log)
+    return unconfirmed
+
+
+def after_webhook_commit(keyword_replies, receipts_by_campaign, confirmed_by_campaign):
+    """
+    Pushes committed receipts to progress streams and committed opt-outs / opt-ins to the suppression index,
+    and bills unconfirmed campaign sends that turned out to have been accepted.
+    """
+    try:
+        for campaign_id, (delivered, read) in receipts_by_campaign.items():
+            campaign_progress.record(campaign_id, messages_delivered_count=delivered, messages_read_count=read)
+        for campaign_id, (sent, failed) in confirmed_by_campaign.items():
+            campaign_progress.record(campaign_id, messages_sent_count=sent, messages_failed_count=failed)
+            if sent:
+                CampaignBilling.settle(campaign_id)
+
+        for client_id, from_phone, keyword, _ in keyword_replies:
+            if keyword == "opt_out":
+                suppression_index.remember(client_id, [from_phone])
+                logger.info("%s opted out of messages from client ID %s", from_phone, client_id)
+            else:
+                suppression_index.forget(client_id)
+                logger.info("%s opted back in to messages from client ID %s", from_phone, client_id)
+    except Exception as e:
+        # Already committed; the suppression index catches up when it reloads (SUPPRESSION_INDEX_TTL_SECONDS)
+        db.session.rollback()
+        logger.error("Updating progress and suppressions after webhook events failed: %s", e, exc_info=True)
+
+
+class _ClaimLost(Exception):
+    """The consumer's claim on a payload expired and another consumer took it over."""
+
+
+class WebhookQueue:
+    """
+    Durable queue of WhatsApp webhook payloads in the webhook_events table.
+
+    `append` is all the webhook route does: one INSERT, so Meta gets its 200 in milliseconds however busy
+    the database is with the rest of the work. Consumer threads claim batches of pending rows with a
+    conditional UPDATE (SKIP LOCKED on MySQL, so instances get different rows), apply them with
+    `apply_webhook_payloads` and mark them done in the same transaction, so a payload's effects are
+    committed exactly once even if its consumer dies and the claim is taken over.
+    """
+
+    def __init__(self, workers=WEBHOOK_CONSUMER_WORKERS, batch_size=WEBHOOK_BATCH_SIZE, poll_interval=WEBHOOK_POLL_INTERVAL_SECONDS):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.worker_id = None
+        self._threads = []
+        self._condition = threading.Condition()
+        self._pending_signals = 0 # Payloads appended by this process since the consumers last looked
+        self._last_purge = None
+
+    def start(self, app):
+        """Starts the consumer threads once per process. Safe to call repeatedly."""
+        with self._condition:
+            if self._threads:
+                return
+            self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, args=(app,), name=f"webhook-consumer-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def append(self, payload):
+        """Stores a raw webhook body for processing. Commits."""
+        db.session.execute(insert(WebhookEvent).values(payload=payload, state="pending", received_at=datetime.utcnow()))
+        db.session.commit()
+        with self._condition:
+            self._pending_signals += 1
+            self._condition.notify()
+
+    def _worker(self, app):
+        while True:
+            with self._condition:
+                if not self._pending_signals:
+                    self._condition.wait(self.poll_interval)
+                self._pending_signals = 0
+            with app.app_context():
+                try:
+                    self._fail_exhausted()
+                    while self.process_batch() >= self.batch_size:
+                        pass # Keep draining a backlog without waiting
+                    self._purge_if_due()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error("Webhook consumer pass failed: %s", e, exc_info=True)
+                finally:
+                    db.session.remove()
+
+    @staticmethod
+    def _claimable_filter():
+        stale_before = datetime.utcnow() - timedelta(seconds=WEBHOOK_CLAIM_TIMEOUT_SECONDS)
+        return or_(
+            WebhookEvent.state == "pending",
+            # A payload whose consumer keeps dying on it is not taken over forever: see _fail_exhausted
+            and_(WebhookEvent.state == "processing", WebhookEvent.claimed_at < stale_before, WebhookEvent.attempts < WEBHOOK_MAX_ATTEMPTS)
+        )
+
+    @staticmethod
+    def _fail_exhausted():
+        """Sets aside abandoned payloads that already used up their attempts (e.g. they crash the process). Commits."""
+        stale_before = datetime.utcnow() - timedelta(seconds=WEBHOOK_CLAIM_TIMEOUT_SECONDS)
+        failed = db.session.execute(
+            update_stmt(WebhookEvent)
+            .where(WebhookEvent.state == "processing", WebhookEvent.claimed_at < stale_before, WebhookEvent.attempts >= WEBHOOK_MAX_ATTEMPTS)
+            .values(state="failed", claimed_by=None, processed_at=datetime.utcnow(),
+                    error=f"Abandoned by its consumer on each of {WEBHOOK_MAX_ATTEMPTS} attempts")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if failed:
+            logger.error("%d webhook events set aside as failed after %d abandoned attempts", failed, WEBHOOK_MAX_ATTEMPTS)
+
+    def _claim(self):
+        """
+        Claims up to batch_size of the oldest pending (or abandoned) payloads. Commits.
+        Returns:
+            tuple: (claim token, list of (id, payload, attempts) rows in id order).
+        """
+        event_ids = db.session.execute(
+            select(WebhookEvent.id)
+            .where(self._claimable_filter())
+            .order_by(WebhookEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not event_ids:
+            db.session.rollback()
+            return None, []
+        claim_token = f"{self.worker_id}:{uuid.uuid4().hex[:8]}"
+        db.session.execute(
+            update_stmt(WebhookEvent)
+            .where(WebhookEvent.id.in_(event_ids), self._claimable_filter())
+            .values(state="processing", claimed_by=claim_token, claimed_at=datetime.utcnow(), attempts=WebhookEvent.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return claim_token, db.session.execute(
+            select(WebhookEvent.id, WebhookEvent.payload, WebhookEvent.attempts)
+            .where(WebhookEvent.claimed_by == claim_token, WebhookEvent.state == "processing")
+            .order_by(WebhookEvent.id)
+        ).all()
+
+    def process_batch(self):
+        """
+        Claims and applies one batch of payloads. Commits.
+        Returns:
+            int: Number of payloads claimed.
+        """
+        claim_token, rows = self._claim()
+        if not rows:
+            return 0
+        parsed = []
+        for row in rows:
+            try:
+                parsed.append((row, json.loads(row.payload)))
+            except ValueError as e:
+                self._mark_failed(row, claim_token, f"Invalid JSON: {str(e)}", final=True)
+        if not parsed:
+            return len(rows)
+        try:
+            effects = apply_webhook_payloads([data for _, data in parsed])
+            self._mark_done([row.id for row, _ in parsed], claim_token)
+            db.session.commit()
+        except Exception as e:
+            # Find the payload that breaks the batch (or those still ours, if part of the claim was taken over):
+            # apply them one by one
+            db.session.rollback()
+            logger.warning("Applying %d webhook payloads together failed (%s); applying them one by one", len(parsed), e)
+            for row, data in parsed:
+                try:
+                    effects = apply_webhook_payloads([data])
+                    self._mark_done([row.id], claim_token)
+                    db.session.commit()
+                except _ClaimLost:
+                    db.session.rollback()
+                    logger.warning("Webhook event %s was taken over by another consumer; leaving it to that consumer", row.id)
+                    continue
+                except Exception as e_single:
+                    db.session.rollback()
+                    logger.error("Webhook event %s failed (attempt %s): %s", row.id, row.attempts, e_single, exc_info=True)
+                    self._mark_failed(row, claim_token, str(e_single), final=row.attempts >= WEBHOOK_MAX_ATTEMPTS)
+                    continue
+                after_webhook_commit(*effects)
+            return len(rows)
+        after_webhook_commit(*effects)
+        return len(rows)
+
+    @staticmethod
+    def _mark_done(event_ids, claim_token):
+        """
+        Marks payloads done, in the transaction that applied them. Does not commit.
+        Raises _ClaimLost if any of them is no longer claimed by this consumer (the caller must roll back,
+        or the payload would be applied by both consumers).
+        """
+        marked = db.session.execute(
+            update_stmt(WebhookEvent)
+            .where(WebhookEvent.id.in_(event_ids), WebhookEvent.claimed_by == claim_token, WebhookEvent.state == "processing")
+            .values(state="done", processed_at=datetime.utcnow(), claimed_by=None, error=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if marked != len(event_ids):
+            raise _ClaimLost(f"{len(event_ids) - marked} of {len(event_ids)} webhook events were taken over by another consumer")
+
+    @staticmethod
+    def _mark_failed(row, claim_token, reason, final):
+        """Sets a payload aside ("failed") or hands it back for another attempt, if it is still claimed by this consumer. Commits."""
+        db.session.execute(
+            update_stmt(WebhookEvent)
+            .where(WebhookEvent.id == row.id, WebhookEvent.claimed_by == claim_token, WebhookEvent.state == "processing")
+            .values(state="failed" if final else "pending", claimed_by=None, error=reason,
+                    processed_at=datetime.utcnow() if final else None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _purge_if_due(self):
+        now = time.monotonic()
+        with self._condition:
+            if self._last_purge is not None and now - self._last_purge < 3600:
+                return
+            self._last_purge = now
+        purged = db.session.execute(
+            delete(WebhookEvent).where(
+                WebhookEvent.state == "done",
+                WebhookEvent.processed_at < datetime.utcnow() - timedelta(hours=WEBHOOK_EVENT_RETENTION_HOURS)
+            )
+        ).rowcount
+        db.session.commit()
+        if purged:
+            logger.info("Purged %d processed webhook events", purged)
+
+
+# Process-wide queue fed by the webhook route
+webhook_queue = WebhookQueue()
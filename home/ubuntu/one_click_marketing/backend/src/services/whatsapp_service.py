@@ -1,51 +1,242 @@
 # backend/src/services/whatsapp_service.py
 
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+from .rate_limiter import sender_rate_limiter
+from .sender_health import sender_circuit_breaker
+from .send_results import classify_send_result
+from ..logging_config import SummaryLog, RateLimitedLog
+import threading
 import json
 import logging
+import time
+import uuid
+import os
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# Per-message results are aggregated into one line per LOG_SUMMARY_EVERY sends; repeated errors are rate limited
+send_summary = SummaryLog(logger, "whatsapp_send")
+error_log = RateLimitedLog(logger)
 
-# The Meta Graph API endpoint for sending messages
-WHATSAPP_API_VERSION = "v19.0" # It's good practice to use a specific version
+# The Meta Graph API endpoint for sending messages. Point WHATSAPP_API_BASE_URL at scripts/mock_graph_server.py
+# to load-test without messaging real phones.
+WHATSAPP_API_VERSION = os.getenv("WHATSAPP_API_VERSION", "v19.0") # It's good practice to use a specific version
+WHATSAPP_API_BASE_URL = os.getenv("WHATSAPP_API_BASE_URL", "https://graph.facebook.com")
+
+# Simulated-send mode: no HTTP request is made; every message succeeds with a synthetic id after the given latency.
+# Rate limiting still applies, so campaign throughput can be measured without any Graph API (real or mock).
+WHATSAPP_SIMULATE_SENDS = os.getenv("WHATSAPP_SIMULATE_SENDS", "false").lower() in ("1", "true", "yes")
+WHATSAPP_SIMULATED_LATENCY_MS = float(os.getenv("WHATSAPP_SIMULATED_LATENCY_MS", "0"))
+
+# Maximum number of concurrent requests kept in flight by send_template_batch
+WHATSAPP_MAX_IN_FLIGHT = int(os.getenv("WHATSAPP_MAX_IN_FLIGHT", "16"))
+
+# Template sends packed into one Graph API batch request by send_template_batch (POST /<version> with a "batch"
+# array of up to GRAPH_BATCH_MAX_REQUESTS sub-requests). 1 sends every message as its own POST /messages.
+GRAPH_BATCH_MAX_REQUESTS = 50
+WHATSAPP_BATCH_SIZE = min(GRAPH_BATCH_MAX_REQUESTS, max(1, int(os.getenv("WHATSAPP_BATCH_SIZE", "1"))))
+
+# Media assets for template headers are downloaded from their URL and uploaded to the sender's /media endpoint.
+# Meta accepts up to 100 MB (documents); images and videos have lower limits enforced by Meta itself.
+WHATSAPP_MEDIA_MAX_BYTES = int(os.getenv("WHATSAPP_MEDIA_MAX_BYTES", str(100 * 1024 * 1024)))
+WHATSAPP_MEDIA_TIMEOUT_SECONDS = float(os.getenv("WHATSAPP_MEDIA_TIMEOUT_SECONDS", "60"))
+
+# Timeouts for message sends (single and batch requests): connecting to the Graph API, and waiting for its response.
+# A send that times out is treated as transient and retried by the retry queue. Keep the total well below
+# CAMPAIGN_CHUNK_LEASE_SECONDS, or a hung connection lets another instance take over (and re-send) the chunk.
+WHATSAPP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("WHATSAPP_CONNECT_TIMEOUT_SECONDS", "5"))
+WHATSAPP_SEND_TIMEOUT_SECONDS = float(os.getenv("WHATSAPP_SEND_TIMEOUT_SECONDS", "30"))
+WHATSAPP_SEND_TIMEOUT = (WHATSAPP_CONNECT_TIMEOUT_SECONDS, WHATSAPP_SEND_TIMEOUT_SECONDS)
+
+# Keep-alive connections per host in the process-wide HTTP pool shared by all senders. Size it for the concurrent
+# sends of the process: CAMPAIGN_DISPATCH_WORKERS x WHATSAPP_MAX_IN_FLIGHT, plus the retry worker and request threads.
+# Requests beyond it still go out, but their connections are closed afterwards instead of being reused.
+WHATSAPP_HTTP_POOL_MAXSIZE = int(os.getenv("WHATSAPP_HTTP_POOL_MAXSIZE", "64"))
+
+
+def _pooled_session(pool_maxsize):
+    """A requests.Session whose connections are kept alive and reused, so only the first request pays the TCP/TLS handshake."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Content-Type": "application/json"})
+    return session
 
 class WhatsAppService:
-    def __init__(self, access_token, phone_number_id):
+    def __init__(self, access_token, phone_number_id, api_base_url=None, max_in_flight=WHATSAPP_MAX_IN_FLIGHT, messages_per_second=None, session=None,
+                 batch_size=WHATSAPP_BATCH_SIZE):
         """
         Initializes the WhatsAppService with the client's access token and phone number ID.
         Args:
             access_token (str): The client's Meta Graph API access token.
             phone_number_id (str): The client's WhatsApp Business Phone Number ID.
+            api_base_url (str, optional): Graph API host, e.g. a local mock server. Defaults to graph.facebook.com.
+            max_in_flight (int): Concurrency limit for batch sends; also sizes the HTTP connection pool.
+            messages_per_second (float, optional): Meta throughput tier of this sender. Defaults to the system default.
+            session (requests.Session, optional): Pooled session to send through (see `whatsapp_services`).
+                                                  Defaults to a session of this instance's own.
+            batch_size (int): Template sends per Graph API batch request in send_template_batch; 1 disables batching.
         """
         # TODO: Implement proper decryption for access_token if it's stored encrypted
         self.access_token = access_token 
         self.phone_number_id = phone_number_id
-        self.base_url = f"https://graph.facebook.com/{WHATSAPP_API_VERSION}/{self.phone_number_id}/messages"
+        self.max_in_flight = max(1, max_in_flight)
+        self.messages_per_second = messages_per_second
+        self.batch_size = min(GRAPH_BATCH_MAX_REQUESTS, max(1, batch_size))
+        self.batch_url = f"{(api_base_url or WHATSAPP_API_BASE_URL).rstrip('/')}/{WHATSAPP_API_VERSION}"
+        self.base_url = f"{self.batch_url}/{self.phone_number_id}/messages"
+        self.media_url = f"{self.batch_url}/{self.phone_number_id}/media"
 
-    def send_template_message(self, recipient_phone_number, template_name, language_code="en_US", components=None):
+        # The token travels with each request rather than on the session, so senders can share one connection pool
+        self.session = session or _pooled_session(self.max_in_flight)
+        self.auth_headers = {"Authorization": f"Bearer {self.access_token}"}
+
+    def _post_message(self, payload):
         """
-        Sends a template message to a recipient.
-        Args:
-            recipient_phone_number (str): The recipient's phone number with country code (e.g., "15550001234").
-            template_name (str): The name of the pre-approved message template.
-            language_code (str): The language code for the template (e.g., "en_US", "ar").
-            components (list, optional): A list of components for template variables (header, body, buttons).
-                                         Example: [{
-                                             "type": "body",
-                                             "parameters": [
-                                                 {"type": "text", "text": "Value1"},
-                                                 {"type": "text", "text": "Value2"}
-                                             ]
-                                         }]
+        POSTs a message payload to the /messages endpoint.
         Returns:
             dict: The JSON response from the Meta API or an error dictionary.
         """
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json",
+        # A sender with repeated sender-level failures (see is_breaker_failure) is not called until its circuit lets a probe through
+        if not sender_circuit_breaker.allow(self.phone_number_id):
+            send_summary.record("circuit_open")
+            return sender_circuit_breaker.open_error(self.phone_number_id)
+        # Every message from this sender, whichever route or campaign it comes from, shares one token bucket
+        sender_rate_limiter.acquire(self.phone_number_id, self.messages_per_second)
+        started_at = time.monotonic()
+        if WHATSAPP_SIMULATE_SENDS:
+            result = self._simulate_send(payload)
+        else:
+            try:
+                response = self.session.post(self.base_url, data=json.dumps(payload), headers=self.auth_headers,
+                                             timeout=WHATSAPP_SEND_TIMEOUT)
+                response.raise_for_status() # Raises an HTTPError for bad responses (4XX or 5XX)
+                result = response.json()
+                logger.debug("Message sent to %s: %s", payload.get("to"), result)
+            except requests.exceptions.RequestException as e:
+                result = self._request_error(e)
+        sender_circuit_breaker.record(self.phone_number_id, result)
+        send_summary.record(classify_send_result(result), time.monotonic() - started_at)
+        return result
+
+    def _request_error(self, e):
+        """Converts a failed request into the error dictionary returned for a message."""
+        if e.response is not None:
+            status_code = e.response.status_code
+            error_log.error(f"http_{status_code}", "Graph API request for %s failed with HTTP %s: %s", self.phone_number_id, status_code, e.response.text)
+            if status_code == 429 or "130429" in e.response.text: # Meta's throughput limit error
+                sender_rate_limiter.penalize(self.phone_number_id)
+            return {"error": str(e), "status_code": status_code, "details": e.response.text}
+        if isinstance(e, requests.exceptions.ConnectionError): # Includes ConnectTimeout
+            # Failed while connecting: the request never reached Meta, so it is safe to send again
+            category = "timeout" if isinstance(e, requests.exceptions.ConnectTimeout) else "network"
+            error_log.error(category, "Graph API request for %s failed to connect: %s", self.phone_number_id, e)
+            return {"error": str(e), "status_code": None, "details": "Could not connect to the Graph API"}
+        # Read timeout or broken response: Meta may already have accepted the message, so it is not sent
+        # again. The message's status webhook settles it instead (see webhook_queue).
+        category = "timeout" if isinstance(e, requests.exceptions.Timeout) else "network"
+        error_log.error(category, "No response to a Graph API request for %s: %s", self.phone_number_id, e)
+        return {"error": str(e), "status_code": None, "details": "No response from the Graph API; the message may have been sent",
+                "delivery_unknown": True}
+
+    def _post_batch(self, payloads):
+        """
+        Sends message payloads as one Graph API batch request: each becomes a POST <phone_number_id>/messages
+        sub-request, and Graph answers with one {"code", "headers", "body"} item per sub-request (null if it
+        didn't complete in time).
+        Returns:
+            list: One result per payload, in the same order, shaped like `_post_message`'s return value.
+        """
+        if not sender_circuit_breaker.allow(self.phone_number_id):
+            for _ in payloads:
+                send_summary.record("circuit_open")
+            return [sender_circuit_breaker.open_error(self.phone_number_id) for _ in payloads]
+        sender_rate_limiter.acquire(self.phone_number_id, self.messages_per_second, tokens=len(payloads))
+        started_at = time.monotonic()
+        results, request_failed = self._post_batch_request(payloads)
+        latency = time.monotonic() - started_at
+        if request_failed:
+            sender_circuit_breaker.record(self.phone_number_id, results[0]) # One failed request, not one per message
+        for result in results:
+            if not request_failed:
+                sender_circuit_breaker.record(self.phone_number_id, result)
+            send_summary.record(classify_send_result(result), latency)
+        return results
+
+    def _post_batch_request(self, payloads):
+        """
+        Returns:
+            tuple: (one result per payload, True if the batch request as a whole failed)
+        """
+        if WHATSAPP_SIMULATE_SENDS:
+            return [self._simulate_send(payload) for payload in payloads], False
+        batch = [
+            {"method": "POST", "relative_url": f"{self.phone_number_id}/messages", "body": self._form_body(payload)}
+            for payload in payloads
+        ]
+        try:
+            response = self.session.post(self.batch_url, data=json.dumps({"batch": batch}), headers=self.auth_headers,
+                                         timeout=WHATSAPP_SEND_TIMEOUT)
+            response.raise_for_status()
+            items = response.json()
+        except requests.exceptions.RequestException as e:
+            # The batch as a whole failed (network, token, throttling): every message gets the error
+            error = self._request_error(e)
+            return [dict(error) for _ in payloads], True
+        except ValueError as e:
+            error_log.error("batch_response", "Unreadable response to a Graph API batch request for %s: %s", self.phone_number_id, e)
+            return [{"error": str(e), "status_code": None, "details": "Invalid batch response", "delivery_unknown": True}
+                    for _ in payloads], True
+
+        results = []
+        throttled = False
+        for index in range(len(payloads)):
+            item = items[index] if isinstance(items, list) and index < len(items) else None
+            if not item:
+                results.append({"error": "Batch request item did not complete", "status_code": None,
+                                "details": "No response for this item of the batch request", "delivery_unknown": True})
+                continue
+            code = item.get("code")
+            body = item.get("body") or ""
+            if isinstance(code, int) and 200 <= code < 300:
+                try:
+                    results.append(json.loads(body))
+                    continue
+                except ValueError:
+                    pass
+            if code == 429 or "130429" in body:
+                throttled = True
+            results.append({"error": f"{code} Error in batch request item", "status_code": code, "details": body})
+        if throttled:
+            sender_rate_limiter.penalize(self.phone_number_id)
+        logger.debug("Batch request of %d messages sent for %s", len(payloads), self.phone_number_id)
+        return results, False
+
+    @staticmethod
+    def _form_body(payload):
+        """Form-encodes a message payload for a batch sub-request; object-valued fields are sent as JSON strings."""
+        return urlencode({
+            name: json.dumps(value) if isinstance(value, (dict, list, bool)) else value
+            for name, value in payload.items()
+        })
+
+    @staticmethod
+    def _simulate_send(payload):
+        """Returns the response shape of a successful Graph API send without calling the API."""
+        if WHATSAPP_SIMULATED_LATENCY_MS:
+            time.sleep(WHATSAPP_SIMULATED_LATENCY_MS / 1000)
+        recipient = str(payload.get("to", ""))
+        return {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": recipient, "wa_id": recipient.lstrip("+")}],
+            "messages": [{"id": f"wamid.SIMULATED{uuid.uuid4().hex.upper()}"}]
         }
+
+    @staticmethod
+    def build_template_payload(recipient_phone_number, template_name, language_code="en_US", components=None):
         payload = {
             "messaging_product": "whatsapp",
             "to": recipient_phone_number,
@@ -59,19 +250,117 @@ class WhatsAppService:
         }
         if components:
             payload["template"]["components"] = components
+        return payload
 
-        logger.info(f"Sending template message '{template_name}' to {recipient_phone_number}")
+    def send_template_message(self, recipient_phone_number, template_name, language_code="en_US", components=None):
+        """
+        Sends a template message to a recipient.
+        Args:
+            recipient_phone_number (str): The recipient's phone number with country code (e.g., "15550001234").
+            template_name (str): The name of the pre-approved message template.
+            language_code (str): The language code for the template (e.g., "en_US", "ar").
+            components (list, optional): A list of components for template variables (header, body, buttons).
+                                         Example: [{
+                                             "type": "body",
+                                             "parameters": [
+                                                 {"type": "text", "text": "Value1"},
+                                                 {"type": "text", "text": "Value2"}
+                                             ]
+                                         }]
+        Returns:
+            dict: The JSON response from the Meta API or an error dictionary.
+        """
+        payload = self.build_template_payload(recipient_phone_number, template_name, language_code, components)
+        logger.debug("Sending template message '%s' to %s", template_name, recipient_phone_number)
+        return self._post_message(payload)
+
+    def send_template_batch(self, recipients, template_name, language_code="en_US", max_in_flight=None):
+        """
+        Sends the same template to many recipients, keeping up to `max_in_flight` requests in flight
+        over the pooled session. With batch_size > 1, each request is a Graph API batch request carrying
+        up to batch_size messages.
+        Args:
+            recipients (list): (recipient_phone_number, components) pairs; components may be None.
+            template_name (str): The name of the pre-approved message template.
+            language_code (str): The language code for the template.
+            max_in_flight (int, optional): Overrides the instance concurrency limit for this batch.
+        Returns:
+            list: One result per recipient, in the same order, each shaped like send_template_message's return value.
+        """
+        if not recipients:
+            return []
+        groups = [recipients[i:i + self.batch_size] for i in range(0, len(recipients), self.batch_size)]
+        workers = min(max_in_flight or self.max_in_flight, self.max_in_flight, len(groups))
+
+        def send_group(group):
+            try:
+                if len(group) == 1:
+                    recipient_phone_number, components = group[0]
+                    return [self.send_template_message(recipient_phone_number, template_name, language_code, components)]
+                return self._post_batch([
+                    self.build_template_payload(recipient_phone_number, template_name, language_code, components)
+                    for recipient_phone_number, components in group
+                ])
+            except Exception as e: # Never let one request abort the whole batch
+                error_log.error("batch_exception", "Unexpected error sending template to %d recipient(s) starting with %s: %s", len(group), group[0][0], e)
+                return [{"error": str(e), "status_code": None, "details": "Internal error while sending"} for _ in group]
+
+        if workers == 1:
+            results = [send_group(group) for group in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whatsapp-send") as pool:
+                results = list(pool.map(send_group, groups)) # map() preserves input order
+        return [result for group_results in results for result in group_results]
+
+    def upload_media(self, content, mime_type, filename="media"):
+        """
+        Uploads a media asset to this sender's /media endpoint. The returned id can be sent in place of a
+        link (e.g. {"type": "image", "image": {"id": ...}}) for as long as Meta keeps the upload (30 days).
+        Args:
+            content (bytes): The file contents.
+            mime_type (str): e.g. "image/jpeg", "video/mp4", "application/pdf".
+            filename (str): File name shown for documents.
+        Returns:
+            dict: {"id": media id} or an error dictionary.
+        """
+        if WHATSAPP_SIMULATE_SENDS:
+            return {"id": f"{uuid.uuid4().int % 10**16}"}
+        try:
+            response = self.session.post(
+                self.media_url,
+                data={"messaging_product": "whatsapp", "type": mime_type},
+                files={"file": (filename, content, mime_type)},
+                headers={**self.auth_headers, "Content-Type": None}, # Let requests set the multipart boundary
+                timeout=WHATSAPP_MEDIA_TIMEOUT_SECONDS
+            )
+            response.raise_for_status()
+            response_json = response.json()
+            logger.info("Uploaded %s (%d bytes) for %s: media id %s", filename, len(content), self.phone_number_id, response_json.get("id"))
+            return response_json
+        except requests.exceptions.RequestException as e:
+            logger.error("Error uploading media for %s: %s", self.phone_number_id, e)
+            return self._request_error(e)
+
+    def upload_media_from_url(self, link):
+        """
+        Downloads an asset and uploads it with `upload_media`.
+        Returns:
+            dict: {"id": media id} or an error dictionary.
+        """
+        if WHATSAPP_SIMULATE_SENDS:
+            return self.upload_media(b"", "application/octet-stream")
         try:
-            response = requests.post(self.base_url, headers=headers, data=json.dumps(payload))
-            response.raise_for_status() # Raises an HTTPError for bad responses (4XX or 5XX)
-            logger.info(f"Message sent successfully. Response: {response.json()}")
-            return response.json()
+            with requests.get(link, stream=True, timeout=WHATSAPP_MEDIA_TIMEOUT_SECONDS) as download:
+                download.raise_for_status()
+                content = download.raw.read(WHATSAPP_MEDIA_MAX_BYTES + 1, decode_content=True)
+                mime_type = download.headers.get("Content-Type", "application/octet-stream").split(";")[0].strip()
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error sending WhatsApp message: {e}")
-            if e.response is not None:
-                logger.error(f"Error response content: {e.response.text}")
-                return {"error": str(e), "status_code": e.response.status_code, "details": e.response.text}
-            return {"error": str(e), "status_code": None, "details": "Network error or no response"}
+            logger.error("Error downloading media from %s: %s", link, e)
+            return {"error": str(e), "status_code": None, "details": f"Could not download media from {link}"}
+        if len(content) > WHATSAPP_MEDIA_MAX_BYTES:
+            return {"error": "Media too large", "status_code": 413, "details": f"{link} is larger than {WHATSAPP_MEDIA_MAX_BYTES} bytes"}
+        filename = os.path.basename(urlsplit(link).path) or "media"
+        return self.upload_media(content, mime_type, filename)
 
     def send_text_message(self, recipient_phone_number, message_text, preview_url=False):
         """
@@ -83,10 +372,6 @@ class WhatsAppService:
         Returns:
             dict: The JSON response from the Meta API or an error dictionary.
         """
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json",
-        }
         payload = {
             "messaging_product": "whatsapp",
             "to": recipient_phone_number,
@@ -96,18 +381,50 @@ class WhatsAppService:
                 "body": message_text
             }
         }
-        logger.info(f"Sending text message to {recipient_phone_number}")
-        try:
-            response = requests.post(self.base_url, headers=headers, data=json.dumps(payload))
-            response.raise_for_status()
-            logger.info(f"Text message sent successfully. Response: {response.json()}")
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error sending WhatsApp text message: {e}")
-            if e.response is not None:
-                logger.error(f"Error response content: {e.response.text}")
-                return {"error": str(e), "status_code": e.response.status_code, "details": e.response.text}
-            return {"error": str(e), "status_code": None, "details": "Network error or no response"}
+        logger.debug("Sending text message to %s", recipient_phone_number)
+        return self._post_message(payload)
+
+class WhatsAppServiceRegistry:
+    """
+    Process-wide WhatsAppService instances keyed by phone_number_id, all sending over one pooled session, so
+    the routes, campaigns and retries of a sender reuse warm keep-alive connections instead of opening new ones.
+
+    `get` is called with the credentials just read from the client profile: an entry built with another token
+    (rotated through this or another instance) is replaced on the spot. `invalidate` drops an entry eagerly.
+    """
+
+    def __init__(self, pool_maxsize=WHATSAPP_HTTP_POOL_MAXSIZE):
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+        self._services = {} # phone_number_id -> WhatsAppService
+        self._lock = threading.Lock()
+
+    def get(self, access_token, phone_number_id, messages_per_second=None):
+        """Returns the pooled service for a sender, creating or replacing it if needed."""
+        with self._lock:
+            service = self._services.get(phone_number_id)
+            if service is not None and service.access_token == access_token:
+                service.messages_per_second = messages_per_second # Tier changes need no new instance
+                return service
+            if self._session is None:
+                self._session = _pooled_session(self.pool_maxsize)
+            service = WhatsAppService(
+                access_token=access_token,
+                phone_number_id=phone_number_id,
+                messages_per_second=messages_per_second,
+                session=self._session
+            )
+            self._services[phone_number_id] = service
+            return service
+
+    def invalidate(self, phone_number_id):
+        """Forgets a sender's service, e.g. after its credentials were changed."""
+        with self._lock:
+            self._services.pop(phone_number_id, None)
+
+
+# Process-wide registry used by the messaging routes, the campaign dispatcher and the retry queue
+whatsapp_services = WhatsAppServiceRegistry()
 
 # Example Usage (for testing, not to be run directly here usually):
 # if __name__ == "__main__":
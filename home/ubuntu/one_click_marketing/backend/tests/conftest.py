@@ -0,0 +1,84 @@
+# backend/tests/conftest.py
+
+import subprocess
+import socket
+import sys
+import time
+import os
+
+import pytest
+from flask import Flask
+
+from src.models.user import db
+from src.services.rate_limiter import sender_rate_limiter
+from src.services.sender_health import sender_circuit_breaker
+
+MOCK_GRAPH_SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "mock_graph_server.py")
+
+
+@pytest.fixture(autouse=True)
+def reset_sender_state():
+    """Rate limiter buckets and circuit breakers are process-wide; each test starts with none."""
+    sender_rate_limiter._buckets.clear()
+    sender_circuit_breaker._circuits.clear()
+    yield
+    sender_rate_limiter._buckets.clear()
+    sender_circuit_breaker._circuits.clear()
+
+
+@pytest.fixture
+def app():
+    """A Flask app on an in-memory SQLite database with every table created."""
+    import src.models.campaign, src.models.campaign_chunk, src.models.campaign_recipient, src.models.client_pricing # noqa: F401
+    import src.models.idempotency_key, src.models.message_log, src.models.message_template # noqa: F401
+    import src.models.suppressed_number, src.models.wallet_transaction, src.models.webhook_event # noqa: F401
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_mock_graph_server(*args):
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, MOCK_GRAPH_SERVER, "--port", str(port), "--stats-interval", "60", *args],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("scripts/mock_graph_server.py did not start")
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture(scope="session")
+def mock_graph_url():
+    """Base URL of a scripts/mock_graph_server.py that accepts every message, with no latency and no webhooks."""
+    process, url = _start_mock_graph_server("--latency-ms", "0", "--latency-jitter-ms", "0")
+    yield url
+    process.terminate()
+    process.wait(timeout=10)
+
+
+@pytest.fixture(scope="session")
+def failing_graph_url():
+    """Base URL of a scripts/mock_graph_server.py answering every message with a 500 (Meta code 131000)."""
+    process, url = _start_mock_graph_server("--latency-ms", "0", "--latency-jitter-ms", "0", "--error-ratio", "1")
+    yield url
+    process.terminate()
+    process.wait(timeout=10)
@@ -0,0 +1,30 @@
+# backend/tests/test_audience_service.py
+
+import pytest
+
+from src.services import audience_service
+from src.services.audience_service import normalize_phone_number
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("+15551234567", "+15551234567"),
+    ("15551234567", "+15551234567"),
+    ("+1 (555) 123-4567", "+15551234567"),
+    ("0044 20 7946 0958", "+442079460958"),
+    ("+44.20.7946.0958", "+442079460958"),
+    (" +15551234567\t", "+15551234567"),
+    (15551234567, "+15551234567"),
+])
+def test_normalize_phone_number_accepts_international_numbers(raw, expected):
+    assert normalize_phone_number(raw) == expected
+
+
+@pytest.mark.parametrize("raw", ["", "+", "12345", "+0155512345", "+1555123456789012", "+1555abc4567", "020 7946 0958"])
+def test_normalize_phone_number_rejects_invalid_numbers(raw):
+    assert normalize_phone_number(raw) is None
+
+
+def test_normalize_phone_number_uses_default_country_code_for_trunk_prefix(monkeypatch):
+    monkeypatch.setattr(audience_service, "AUDIENCE_DEFAULT_COUNTRY_CODE", "44")
+    assert normalize_phone_number("020 7946 0958") == "+442079460958"
+    assert normalize_phone_number("0044 20 7946 0958") == "+442079460958" # "00" stays an international prefix
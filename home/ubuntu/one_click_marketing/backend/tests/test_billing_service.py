@@ -0,0 +1,51 @@
+# backend/tests/test_billing_service.py
+
+import decimal
+
+import pytest
+
+from src.models.user import db, User, ClientProfile
+from src.models.campaign import Campaign
+from src.models.wallet_transaction import WalletTransaction
+from src.services.billing_service import CampaignBilling
+
+
+@pytest.fixture
+def campaign(app):
+    user = User(username="client", email="client@example.com", role="client")
+    user.set_password("secret")
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(ClientProfile(user_id=user.id, wallet_balance=decimal.Decimal("10.00"),
+                                 wallet_reserved_balance=decimal.Decimal("5.00")))
+    camp = Campaign(client_id=user.id, campaign_name="Launch", template_id=1, status="SENDING",
+                    messages_sent_count=0, billing_price_per_message=decimal.Decimal("1.00"),
+                    billing_reserved_amount=decimal.Decimal("2.00"), billing_settled_count=0)
+    db.session.add(camp)
+    db.session.commit()
+    return camp
+
+
+def wallet(camp):
+    profile = ClientProfile.query.filter_by(user_id=camp.client_id).one()
+    return decimal.Decimal(profile.wallet_balance), decimal.Decimal(profile.wallet_reserved_balance)
+
+
+def test_settle_charges_from_the_hold(campaign):
+    campaign.messages_sent_count = 2
+    db.session.commit()
+    assert CampaignBilling.settle(campaign.id) == decimal.Decimal("2.00")
+    assert wallet(campaign) == (decimal.Decimal("8.00"), decimal.Decimal("3.00"))
+    assert db.session.get(Campaign, campaign.id).billing_reserved_amount == 0
+
+
+def test_settle_past_the_hold_takes_only_the_available_balance(campaign, caplog):
+    # Hold of 2 and 5 available (10 - 5 reserved); 9 sent owes 9, so 2 are left uncharged
+    campaign.messages_sent_count = 9
+    db.session.commit()
+    assert CampaignBilling.settle(campaign.id) == decimal.Decimal("7.00")
+    assert wallet(campaign) == (decimal.Decimal("3.00"), decimal.Decimal("3.00"))
+    entry = WalletTransaction.query.one()
+    assert entry.amount == -7.0
+    assert "2.00 over the hold not charged" in entry.description
+    assert "sent past its billing hold" in caplog.text
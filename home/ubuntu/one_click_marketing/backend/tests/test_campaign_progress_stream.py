@@ -0,0 +1,68 @@
+# backend/tests/test_campaign_progress_stream.py
+
+import jwt
+import pytest
+
+from src.models.user import db, User, ClientProfile
+from src.models.campaign import Campaign
+from src.routes.auth import SECRET_KEY
+from src.routes.campaigns import campaigns_bp
+
+
+@pytest.fixture
+def client(app):
+    app.register_blueprint(campaigns_bp)
+    user = User(username="client", email="client@example.com", role="client")
+    user.set_password("secret")
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(ClientProfile(user_id=user.id))
+    db.session.add_all([Campaign(client_id=user.id, campaign_name=name, template_id=1) for name in ("First", "Second")])
+    db.session.commit()
+    return app.test_client()
+
+
+def api_headers(user_id=1):
+    return {"Authorization": "Bearer " + jwt.encode({"user_id": user_id}, SECRET_KEY, algorithm="HS256")}
+
+
+def stream_token(client, campaign_id=1):
+    response = client.post(f"/api/v1/campaigns/{campaign_id}/progress/stream-token", headers=api_headers())
+    assert response.status_code == 200
+    return response.get_json()["stream_token"]
+
+
+def open_stream(client, query):
+    response = client.get(f"/api/v1/campaigns/1/progress/stream?{query}", buffered=False)
+    first_chunk = next(response.response) if response.status_code == 200 else None
+    response.close()
+    return response.status_code, first_chunk
+
+
+def test_stream_token_opens_the_campaign_stream(client):
+    status, first_chunk = open_stream(client, f"stream_token={stream_token(client)}")
+    assert status == 200 and first_chunk.startswith(b"retry:")
+
+
+def test_stream_token_is_scoped_to_its_campaign(client):
+    assert open_stream(client, f"stream_token={stream_token(client, campaign_id=2)}")[0] == 403
+
+
+def test_api_token_is_not_accepted_in_the_url(client):
+    api_token = api_headers()["Authorization"].split(" ")[1]
+    assert open_stream(client, f"stream_token={api_token}")[0] == 401
+    assert open_stream(client, f"access_token={api_token}")[0] == 401
+
+
+def test_stream_token_is_not_an_api_token(client):
+    response = client.get("/api/v1/campaigns/1", headers={"Authorization": f"Bearer {stream_token(client)}"})
+    assert response.status_code == 401
+
+
+def test_expired_stream_token_is_rejected(client, monkeypatch):
+    monkeypatch.setattr("src.routes.campaigns.CAMPAIGN_PROGRESS_STREAM_TOKEN_SECONDS", -1)
+    assert open_stream(client, f"stream_token={stream_token(client)}")[0] == 401
+
+
+def test_stream_token_requires_an_owned_campaign(client):
+    assert client.post("/api/v1/campaigns/99/progress/stream-token", headers=api_headers()).status_code == 404
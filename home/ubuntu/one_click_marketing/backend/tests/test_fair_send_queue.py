@@ -0,0 +1,68 @@
+# backend/tests/test_fair_send_queue.py
+
+from src.services.fair_send_queue import FairSendQueue
+
+
+def drain(queue, turns, cost=100):
+    """Hands out `turns` chunks, each sending `cost` messages and requeued. Returns the campaign of each turn."""
+    order = []
+    for _ in range(turns):
+        campaign_id = queue.get(cost)
+        queue.task_done(campaign_id, cost, cost, requeue=True)
+        order.append(campaign_id)
+    return order
+
+
+def test_clients_alternate_with_equal_weights():
+    queue = FairSendQueue()
+    queue.add(client_id=1, campaign_id=10)
+    queue.add(client_id=2, campaign_id=20)
+    assert drain(queue, 6) == [10, 20, 10, 20, 10, 20]
+
+
+def test_weight_sets_share_of_chunks():
+    queue = FairSendQueue()
+    queue.add(client_id=1, campaign_id=10)
+    queue.add(client_id=2, campaign_id=20)
+    queue.set_weight(1, 3)
+    order = drain(queue, 8)
+    assert order.count(10) == 6 and order.count(20) == 2
+
+
+def test_campaigns_of_one_client_are_served_round_robin():
+    queue = FairSendQueue()
+    queue.add(client_id=1, campaign_id=10)
+    queue.add(client_id=1, campaign_id=11)
+    assert drain(queue, 4) == [10, 11, 10, 11]
+
+
+def test_new_client_joins_at_current_minimum():
+    queue = FairSendQueue()
+    queue.add(client_id=1, campaign_id=10)
+    drain(queue, 5) # Client 1 alone: its virtual time is well ahead of zero
+    queue.add(client_id=2, campaign_id=20)
+    # The newcomer gets no banked credit: it alternates with client 1 instead of taking five turns in a row
+    assert drain(queue, 4) in ([10, 20, 10, 20], [20, 10, 20, 10])
+
+
+def test_finished_campaign_leaves_the_queue():
+    queue = FairSendQueue()
+    queue.add(client_id=1, campaign_id=10)
+    queue.add(client_id=2, campaign_id=20)
+    campaign_id = queue.get(100)
+    queue.task_done(campaign_id, 100, 40, requeue=False)
+    assert drain(queue, 2) == [20, 20]
+    assert 1 not in queue._clients
+
+
+def test_actual_cost_corrects_the_charge():
+    queue = FairSendQueue()
+    queue.add(client_id=1, campaign_id=10)
+    queue.add(client_id=2, campaign_id=20)
+    order = []
+    for _ in range(12):
+        campaign_id = queue.get(100)
+        # Client 1's chunks turn out to send a tenth of the messages they were charged for up front
+        queue.task_done(campaign_id, 100, 10 if campaign_id == 10 else 100, requeue=True)
+        order.append(campaign_id)
+    assert order.count(20) == 1
@@ -0,0 +1,79 @@
+# backend/tests/test_logging_config.py
+
+import logging
+
+import pytest
+
+from src import logging_config
+from src.logging_config import RateLimitedLog, SummaryLog
+
+LOGGER_NAME = "tests.logging_config"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(logging_config.time, "monotonic", fake.monotonic)
+    return fake
+
+
+@pytest.fixture
+def logger(caplog):
+    caplog.set_level(logging.INFO, logger=LOGGER_NAME)
+    return logging.getLogger(LOGGER_NAME)
+
+
+def test_rate_limited_log_suppresses_lines_beyond_the_limit(clock, logger, caplog):
+    log = RateLimitedLog(logger, per_minute=3)
+    for i in range(10):
+        log.warning("timeout", "Request %d timed out", i)
+    assert [r.getMessage() for r in caplog.records] == ["Request 0 timed out", "Request 1 timed out", "Request 2 timed out"]
+
+    clock.now += 61
+    log.warning("timeout", "Request %d timed out", 10)
+    assert caplog.records[-1].getMessage() == "Request 10 timed out [7 similar suppressed]"
+
+
+def test_rate_limited_log_counts_categories_separately(clock, logger, caplog):
+    log = RateLimitedLog(logger, per_minute=1)
+    log.error("a", "first a")
+    log.error("a", "second a")
+    log.error("b", "first b")
+    assert [r.getMessage() for r in caplog.records] == ["first a", "first b"]
+
+
+def test_rate_limited_log_skips_disabled_levels(clock, logger, caplog):
+    caplog.set_level(logging.ERROR, logger=LOGGER_NAME)
+    log = RateLimitedLog(logger, per_minute=1)
+    log.warning("a", "dropped")
+    log.error("a", "logged")
+    assert [r.getMessage() for r in caplog.records] == ["logged"]
+
+
+def test_summary_log_writes_one_line_per_batch_of_events(clock, logger, caplog):
+    summary = SummaryLog(logger, "whatsapp_send", every=4, max_seconds=60)
+    for outcome, latency in (("sent", 0.1), ("sent", 0.2), ("retryable", 0.3)):
+        summary.record(outcome, latency)
+    assert not caplog.records
+    summary.record("sent", 0.4)
+    assert len(caplog.records) == 1
+    record = caplog.records[0]
+    assert record.getMessage().startswith("whatsapp_send: 4 in 0.0s (retryable=1 sent=3), latency p50 300ms")
+    assert record.outcomes == {"sent": 3, "retryable": 1} and record.count == 4
+    assert record.latency_max_ms == 400.0
+
+
+def test_summary_log_flushes_after_max_seconds(clock, logger, caplog):
+    summary = SummaryLog(logger, "whatsapp_webhook", every=1000, max_seconds=60)
+    summary.record("incoming")
+    clock.now += 61
+    summary.record("incoming")
+    assert [r.getMessage() for r in caplog.records] == ["whatsapp_webhook: 2 in 61.0s (incoming=2)"]
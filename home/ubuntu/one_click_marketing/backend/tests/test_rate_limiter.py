@@ -0,0 +1,63 @@
+# backend/tests/test_rate_limiter.py
+
+import pytest
+
+from src.services import rate_limiter
+from src.services.rate_limiter import TokenBucket, SenderRateLimiter
+
+
+class FakeClock:
+    """Stands in for time.monotonic / time.sleep: sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", fake.sleep)
+    return fake
+
+
+def test_token_bucket_allows_a_burst_up_to_capacity(clock):
+    bucket = TokenBucket(rate=10)
+    assert [bucket.acquire() for _ in range(10)] == [0.0] * 10
+    assert clock.slept == []
+
+
+def test_token_bucket_waits_for_tokens_beyond_capacity(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.acquire(10)
+    assert bucket.acquire() == pytest.approx(0.1)
+    assert bucket.acquire(5) == pytest.approx(0.5)
+
+
+def test_token_bucket_refills_over_time_up_to_capacity(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.acquire(10)
+    clock.now += 60
+    assert bucket.acquire(10) == 0.0
+    assert bucket.acquire() == pytest.approx(0.1)
+
+
+def test_token_bucket_penalize_delays_the_next_token(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.penalize(2.0)
+    assert bucket.acquire() == pytest.approx(2.1)
+
+
+def test_sender_rate_limiter_applies_changed_rate(clock):
+    limiter = SenderRateLimiter(default_rate=80)
+    assert limiter.get_bucket("PN1").rate == 80
+    assert limiter.get_bucket("PN1", rate=250).rate == 250
+    assert limiter.get_bucket("PN2").rate == 80
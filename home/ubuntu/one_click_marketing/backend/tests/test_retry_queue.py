@@ -0,0 +1,30 @@
+# backend/tests/test_retry_queue.py
+
+from src.models.user import db
+from src.models.message_log import MessageLog
+from src.services.retry_queue import RetryQueue
+
+
+def add_log(status):
+    log = MessageLog(client_id=1, campaign_id=1, recipient_phone_number="+15550000001", status=status,
+                     direction="outgoing", message_type="template")
+    db.session.add(log)
+    db.session.commit()
+    return log.id
+
+
+def test_claim_takes_every_due_row_in_one_statement(app):
+    ids = [add_log("retry_scheduled") for _ in range(3)]
+    assert sorted(RetryQueue()._claim(ids)) == ids
+    logs = MessageLog.query.filter(MessageLog.id.in_(ids)).all()
+    assert {log.status for log in logs} == {"retry_in_flight"}
+    assert len({log.retry_claimed_by for log in logs}) == 1
+
+
+def test_claim_returns_only_rows_this_claim_won(app):
+    first = [add_log("retry_scheduled") for _ in range(2)]
+    assert sorted(RetryQueue()._claim(first)) == first
+    later = add_log("retry_scheduled")
+    sent = add_log("sent_to_whatsapp")
+    assert RetryQueue()._claim(first + [later, sent]) == [later]
+    assert RetryQueue()._claim(first + [later]) == []
@@ -0,0 +1,70 @@
+# backend/tests/test_send_results.py
+
+import json
+from datetime import datetime
+
+import pytest
+
+from src.services import send_results
+from src.services.send_results import classify_send_result, build_send_outcome, parse_meta_error
+
+
+def meta_error(status_code, code, message="error"):
+    return {"error": f"{status_code} Error", "status_code": status_code, "details": json.dumps({"error": {"code": code, "message": message}})}
+
+
+SENT = {"messaging_product": "whatsapp", "messages": [{"id": "wamid.1"}]}
+
+
+@pytest.mark.parametrize("api_response, expected", [
+    (SENT, "sent"),
+    (None, "retryable"),
+    ({"error": "refused", "status_code": None, "details": "Could not connect to the Graph API"}, "retryable"),
+    (meta_error(429, 130429), "retryable"),
+    (meta_error(500, 131000), "retryable"),
+    (meta_error(503, 999), "retryable"),
+    (meta_error(400, 131056), "retryable"), # Pair rate limit: transient Meta code on a 4xx
+    (meta_error(400, 131026), "permanent"),
+    (meta_error(401, 190), "permanent"),
+    ({"error": "read timeout", "status_code": None, "details": "No response", "delivery_unknown": True}, "unknown"),
+    ({"messages": []}, "retryable"),
+])
+def test_classify_send_result(api_response, expected):
+    assert classify_send_result(api_response) == expected
+
+
+def test_parse_meta_error_reads_code_and_message_from_details():
+    assert parse_meta_error(meta_error(400, 131026, "Message undeliverable")) == (131026, "Message undeliverable")
+    assert parse_meta_error({"error": "boom", "status_code": None, "details": "Network error"}) == (None, "Network error")
+
+
+def test_build_send_outcome_sent():
+    update, state, retry_at = build_send_outcome(7, 1, SENT)
+    assert state == "sent" and retry_at is None
+    assert update["id"] == 7 and update["status"] == "sent_to_whatsapp" and update["whatsapp_message_id"] == "wamid.1"
+
+
+def test_build_send_outcome_schedules_retry_until_attempts_run_out(monkeypatch):
+    monkeypatch.setattr(send_results, "RETRY_MAX_ATTEMPTS", 3)
+    now = datetime(2026, 1, 1)
+    update, state, retry_at = build_send_outcome(7, 2, meta_error(500, 131000), now)
+    assert state == "retrying" and update["status"] == "retry_scheduled"
+    assert retry_at > now and update["next_retry_at"] == retry_at
+    assert update["failure_reason"].startswith("[131000]")
+
+    update, state, retry_at = build_send_outcome(7, 3, meta_error(500, 131000), now)
+    assert state == "failed" and update["status"] == "failed_on_send" and retry_at is None
+
+
+def test_build_send_outcome_never_retries_unconfirmed_send():
+    api_response = {"error": "read timeout", "status_code": None, "details": "No response", "delivery_unknown": True}
+    update, state, retry_at = build_send_outcome(7, 1, api_response)
+    assert state == "unconfirmed" and update["status"] == "send_unknown" and retry_at is None
+    assert state not in send_results.UNSETTLED_RECIPIENT_STATES
+
+
+def test_compute_backoff_seconds_is_capped(monkeypatch):
+    monkeypatch.setattr(send_results, "RETRY_BASE_DELAY_SECONDS", 5)
+    monkeypatch.setattr(send_results, "RETRY_MAX_DELAY_SECONDS", 60)
+    assert 2.5 <= send_results.compute_backoff_seconds(1) <= 5
+    assert 30 <= send_results.compute_backoff_seconds(10) <= 60
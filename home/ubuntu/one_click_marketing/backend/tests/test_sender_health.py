@@ -0,0 +1,102 @@
+# backend/tests/test_sender_health.py
+
+import json
+
+import pytest
+
+from src.services import sender_health
+from src.services.sender_health import SenderCircuitBreaker, is_breaker_failure
+
+SENT = {"messages": [{"id": "wamid.1"}]}
+SERVER_ERROR = {"error": "500 Error", "status_code": 500, "details": json.dumps({"error": {"code": 131000, "message": "Something went wrong"}})}
+AUTH_ERROR = {"error": "401 Error", "status_code": 401, "details": json.dumps({"error": {"code": 190, "message": "Token expired"}})}
+RECIPIENT_ERROR = {"error": "400 Error", "status_code": 400, "details": json.dumps({"error": {"code": 131026, "message": "Undeliverable"}})}
+THROTTLED = {"error": "429 Error", "status_code": 429, "details": json.dumps({"error": {"code": 130429, "message": "Rate limit hit"}})}
+NO_CONNECTION = {"error": "refused", "status_code": None, "details": "Could not connect to the Graph API"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(sender_health.time, "monotonic", fake.monotonic)
+    return fake
+
+
+def test_is_breaker_failure_only_counts_sender_level_failures():
+    assert is_breaker_failure(AUTH_ERROR)
+    assert is_breaker_failure(SERVER_ERROR)
+    assert is_breaker_failure(NO_CONNECTION)
+    assert not is_breaker_failure(SENT)
+    assert not is_breaker_failure(RECIPIENT_ERROR)
+    assert not is_breaker_failure(THROTTLED)
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = SenderCircuitBreaker(failure_threshold=3, sender_error_threshold=10, open_seconds=60)
+    for _ in range(2):
+        breaker.record("PN1", SERVER_ERROR)
+    assert not breaker.is_open("PN1")
+    breaker.record("PN1", SERVER_ERROR)
+    assert breaker.is_open("PN1")
+    assert not breaker.allow("PN1")
+    error = breaker.open_error("PN1")
+    assert error["circuit_open"] and error["status_code"] == 503
+
+
+def test_authorization_errors_open_the_circuit_sooner(clock):
+    breaker = SenderCircuitBreaker(failure_threshold=25, sender_error_threshold=2, open_seconds=60)
+    breaker.record("PN1", AUTH_ERROR)
+    breaker.record("PN1", AUTH_ERROR)
+    assert breaker.is_open("PN1")
+
+
+def test_success_and_recipient_errors_do_not_open_the_circuit(clock):
+    breaker = SenderCircuitBreaker(failure_threshold=2, sender_error_threshold=2, open_seconds=60)
+    breaker.record("PN1", SERVER_ERROR)
+    breaker.record("PN1", SENT) # Resets the count
+    breaker.record("PN1", SERVER_ERROR)
+    for _ in range(5):
+        breaker.record("PN1", RECIPIENT_ERROR)
+        breaker.record("PN1", THROTTLED)
+    assert not breaker.is_open("PN1")
+    assert breaker.health("PN2")["state"] == "closed"
+
+
+def test_single_probe_after_open_period(clock):
+    breaker = SenderCircuitBreaker(failure_threshold=1, sender_error_threshold=1, open_seconds=60)
+    breaker.record("PN1", SERVER_ERROR)
+    clock.now += 61
+    assert breaker.allow("PN1") # The probe
+    assert not breaker.allow("PN1") # Everyone else waits for its result
+    breaker.record("PN1", SERVER_ERROR)
+    assert breaker.is_open("PN1") # Failed probe: open for another period
+
+    clock.now += 61
+    assert breaker.allow("PN1")
+    breaker.record("PN1", SENT)
+    assert breaker.health("PN1")["state"] == "closed"
+    assert breaker.allow("PN1") and breaker.allow("PN1")
+
+
+def test_probe_rejected_for_its_recipient_closes_the_circuit(clock):
+    breaker = SenderCircuitBreaker(failure_threshold=1, sender_error_threshold=1, open_seconds=60)
+    breaker.record("PN1", SERVER_ERROR)
+    clock.now += 61
+    assert breaker.allow("PN1")
+    breaker.record("PN1", RECIPIENT_ERROR) # Meta accepted the request: the sender works again
+    assert breaker.health("PN1")["state"] == "closed"
+
+
+def test_reset_closes_the_circuit(clock):
+    breaker = SenderCircuitBreaker(failure_threshold=1, sender_error_threshold=1, open_seconds=60)
+    breaker.record("PN1", AUTH_ERROR)
+    breaker.reset("PN1")
+    assert breaker.allow("PN1")
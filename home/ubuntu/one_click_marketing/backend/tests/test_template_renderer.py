@@ -0,0 +1,67 @@
+# backend/tests/test_template_renderer.py
+
+from src.services.template_renderer import CompiledTemplate
+
+
+def body(*values):
+    return {"type": "body", "parameters": [{"type": "text", "text": value} for value in values]}
+
+
+def test_body_placeholders_are_filled_in_order():
+    template = CompiledTemplate({"body": {"text": "Hi {{1}}, your code is {{2}}"}}, ["name", "code"])
+    assert template.render({"name": "Ann", "code": 42}) == [body("Ann", "42")]
+
+
+def test_repeated_placeholder_takes_one_variable():
+    template = CompiledTemplate({"body": {"text": "Hi {{1}}, {{ 1 }}!"}}, ["name"])
+    assert template.render({"name": "Ann"}) == [body("Ann")]
+
+
+def test_missing_variables_render_as_empty_strings():
+    template = CompiledTemplate({"body": {"text": "Hi {{1}} {{2}}"}}, ["name"])
+    assert template.render({}) == [body("", "")]
+
+
+def test_structure_without_placeholders_sends_every_variable_in_the_body():
+    template = CompiledTemplate({"body": {"text": "Hello"}}, ["name", "city"])
+    assert template.render({"name": "Ann", "city": "Oslo"}) == [body("Ann", "Oslo")]
+    assert CompiledTemplate({}, []).render({"name": "Ann"}) == []
+
+
+def test_header_body_and_buttons_consume_variables_in_template_order():
+    structure = {
+        "header": {"format": "TEXT", "text": "Order {{1}}"},
+        "body": {"text": "Hi {{2}}"},
+        "buttons": [
+            {"type": "URL", "url": "https://example.com/track/{{1}}"},
+            {"type": "QUICK_REPLY", "text": "Stop"},
+            {"type": "COPY_CODE"},
+        ],
+    }
+    template = CompiledTemplate(structure, ["order", "name", "tracking", "coupon"])
+    assert template.render({"order": "A1", "name": "Ann", "tracking": "T9", "coupon": "SAVE10"}) == [
+        {"type": "header", "parameters": [{"type": "text", "text": "A1"}]},
+        body("Ann"),
+        {"type": "button", "sub_type": "url", "index": "0", "parameters": [{"type": "text", "text": "T9"}]},
+        {"type": "button", "sub_type": "copy_code", "index": "2", "parameters": [{"type": "coupon_code", "coupon_code": "SAVE10"}]},
+    ]
+
+
+def test_meta_component_list_is_accepted():
+    structure = [
+        {"type": "HEADER", "format": "IMAGE"},
+        {"type": "BODY", "text": "Hi {{1}}"},
+    ]
+    template = CompiledTemplate(structure, ["image_url", "name"])
+    assert template.render({"image_url": "https://example.com/a.jpg", "name": "Ann"}) == [
+        {"type": "header", "parameters": [{"type": "image", "image": {"link": "https://example.com/a.jpg"}}]},
+        body("Ann"),
+    ]
+
+
+def test_static_media_header_can_be_overridden_with_an_uploaded_id():
+    template = CompiledTemplate({"header": {"format": "VIDEO", "media_url": "https://example.com/v.mp4"}, "body": {"text": "Hi"}}, [])
+    assert template.render({}) == [{"type": "header", "parameters": [{"type": "video", "video": {"link": "https://example.com/v.mp4"}}]}]
+    assert template.render({}, header_media=("video", {"id": "123"})) == [
+        {"type": "header", "parameters": [{"type": "video", "video": {"id": "123"}}]}
+    ]
@@ -0,0 +1,77 @@
+# backend/tests/test_webhook_queue.py
+
+import time
+
+import pytest
+
+from src.models.user import db, User, ClientProfile
+from src.models.campaign import Campaign
+from src.models.campaign_recipient import CampaignRecipient
+from src.models.message_log import MessageLog
+from src.services.webhook_queue import apply_webhook_payloads
+
+
+@pytest.fixture
+def campaign(app):
+    user = User(username="client", email="client@example.com", role="client")
+    user.set_password("secret")
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(ClientProfile(user_id=user.id, meta_phone_number_id="PN1", meta_waba_id="WABA1"))
+    camp = Campaign(client_id=user.id, campaign_name="Launch", template_id=1, status="SENDING",
+                    messages_sent_count=0, messages_failed_count=0)
+    db.session.add(camp)
+    db.session.commit()
+    return camp
+
+
+def add_send(camp, phone, status, whatsapp_message_id=None):
+    log = MessageLog(client_id=camp.client_id, campaign_id=camp.id, recipient_phone_number=phone, status=status,
+                     whatsapp_message_id=whatsapp_message_id, direction="outgoing", message_type="template")
+    db.session.add(log)
+    db.session.flush()
+    state = "unconfirmed" if status == "send_unknown" else "sent"
+    db.session.add(CampaignRecipient(campaign_id=camp.id, phone_number=phone, state=state, message_log_id=log.id))
+    db.session.commit()
+    return log
+
+
+def status_payload(*statuses):
+    return {"object": "whatsapp_business_account", "entry": [{"id": "WABA1", "changes": [{"value": {
+        "metadata": {"phone_number_id": "PN1"},
+        "statuses": [{"id": message_id, "recipient_id": recipient, "status": status, "timestamp": str(int(time.time())),
+                      "errors": [{"title": "Message undeliverable"}]} for message_id, recipient, status in statuses],
+    }}]}]}
+
+
+def test_receipts_count_once_per_message(campaign):
+    add_send(campaign, "+15550000001", "sent_to_whatsapp", "wamid.A")
+    payload = status_payload(("wamid.A", "15550000001", "delivered"), ("wamid.A", "15550000001", "read"),
+                             ("wamid.A", "15550000001", "delivered"))
+    _, receipts, _ = apply_webhook_payloads([payload])
+    db.session.commit()
+    assert receipts == {campaign.id: [1, 1]}
+    assert MessageLog.query.filter_by(whatsapp_message_id="wamid.A").one().status == "read"
+    camp = db.session.get(Campaign, campaign.id)
+    assert (camp.messages_delivered_count, camp.messages_read_count) == (1, 1)
+
+
+def test_unconfirmed_sends_are_settled_by_their_first_status(campaign):
+    accepted = add_send(campaign, "+15550000001", "send_unknown")
+    rejected = add_send(campaign, "+15550000002", "send_unknown")
+    payload = status_payload(("wamid.B", "15550000001", "sent"), ("wamid.C", "15550000002", "failed"),
+                             ("wamid.D", "15550000003", "sent"))
+    _, _, confirmed = apply_webhook_payloads([payload])
+    db.session.commit()
+
+    assert confirmed == {campaign.id: [1, 1]}
+    accepted, rejected = db.session.get(MessageLog, accepted.id), db.session.get(MessageLog, rejected.id)
+    assert (accepted.whatsapp_message_id, accepted.status) == ("wamid.B", "sent")
+    assert (rejected.whatsapp_message_id, rejected.status) == ("wamid.C", "failed")
+    assert sorted(r.state for r in CampaignRecipient.query) == ["failed", "sent"]
+    camp = db.session.get(Campaign, campaign.id)
+    assert (camp.messages_sent_count, camp.messages_failed_count) == (1, 1)
+
+    # Later statuses of the same message are ordinary receipts
+    _, receipts, confirmed = apply_webhook_payloads([status_payload(("wamid.B", "15550000001", "delivered"))])
+    assert receipts == {campaign.id: [1, 0]} and confirmed == {}
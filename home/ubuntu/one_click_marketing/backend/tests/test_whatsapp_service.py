@@ -0,0 +1,73 @@
+# backend/tests/test_whatsapp_service.py
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import time
+
+import pytest
+
+from src.services import whatsapp_service
+from src.services.send_results import classify_send_result
+from src.services.sender_health import sender_circuit_breaker
+from src.services.whatsapp_service import WhatsAppService
+
+
+def recipients(count):
+    return [(f"+1555000{i:04d}", None) for i in range(count)]
+
+
+@pytest.mark.parametrize("batch_size", [1, 5])
+def test_send_template_batch_returns_one_result_per_recipient_in_order(mock_graph_url, batch_size):
+    service = WhatsAppService("token", "PN1", api_base_url=mock_graph_url, messages_per_second=1000, batch_size=batch_size)
+    results = service.send_template_batch(recipients(23), "hello")
+    assert len(results) == 23
+    assert all(classify_send_result(result) == "sent" for result in results)
+    assert [result["contacts"][0]["input"] for result in results] == [phone for phone, _ in recipients(23)]
+    assert len({result["messages"][0]["id"] for result in results}) == 23
+
+
+def test_send_template_batch_reports_server_errors_as_retryable(failing_graph_url):
+    service = WhatsAppService("token", "PN1", api_base_url=failing_graph_url, messages_per_second=1000, batch_size=4)
+    results = service.send_template_batch(recipients(6), "hello")
+    assert [classify_send_result(result) for result in results] == ["retryable"] * 6
+    assert sender_circuit_breaker.health("PN1")["consecutive_failures"] == 6
+
+
+def test_send_template_batch_fails_fast_while_the_circuit_is_open(mock_graph_url, monkeypatch):
+    breaker_failure = {"error": "500 Error", "status_code": 500, "details": "boom"}
+    monkeypatch.setattr(sender_circuit_breaker, "failure_threshold", 1)
+    sender_circuit_breaker.record("PN1", breaker_failure)
+    service = WhatsAppService("token", "PN1", api_base_url=mock_graph_url, messages_per_second=1000, batch_size=5)
+    results = service.send_template_batch(recipients(3), "hello")
+    assert all(result.get("circuit_open") for result in results)
+
+
+def test_connection_refused_is_retryable():
+    service = WhatsAppService("token", "PN1", api_base_url="http://127.0.0.1:9", messages_per_second=1000)
+    result = service.send_template_message("+15550000001", "hello")
+    assert result["status_code"] is None and classify_send_result(result) == "retryable"
+
+
+@pytest.fixture
+def unresponsive_graph_url():
+    """A server that accepts requests but answers none of them in time."""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            time.sleep(1)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("batch_size", [1, 3])
+def test_read_timeout_is_not_retried(unresponsive_graph_url, monkeypatch, batch_size):
+    monkeypatch.setattr(whatsapp_service, "WHATSAPP_SEND_TIMEOUT", (1, 0.2))
+    service = WhatsAppService("token", "PN1", api_base_url=unresponsive_graph_url, messages_per_second=1000, batch_size=batch_size)
+    results = service.send_template_batch(recipients(3), "hello")
+    assert [classify_send_result(result) for result in results] == ["unknown"] * 3
@@ -193,7 +193,7 @@ export default function CampaignsPage() {
     const token = localStorage.getItem("authToken");
     if (!token) { toast({ title: "Auth Error"}); setIsLoading(false); return; }
     try {
-        const response = await fetch(`/api/v1/campaigns/${campaignId}`, { headers: { "Authorization": `Bearer ${token}`}});
+        const response = await fetch(`/api/v1/campaigns/${campaignId}?include_audience=true`, { headers: { "Authorization": `Bearer ${token}`}});
         if (response.ok) {
             const data: Campaign = await response.json();
             setCurrentCampaign(data);